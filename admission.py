@@ -0,0 +1,161 @@
+import logging
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionError(Exception):
+    """Raised when a download job cannot be admitted. The message is user-facing."""
+    pass
+
+
+class QueueFullError(AdmissionError):
+    """The global download queue is full"""
+    pass
+
+
+class UserLimitError(AdmissionError):
+    """The user already has too many downloads running or queued"""
+    pass
+
+
+class _Waiter:
+    __slots__ = ('user_id', 'future', 'on_position')
+
+    def __init__(self, user_id, future, on_position):
+        self.user_id = user_id
+        self.future = future
+        self.on_position = on_position
+
+
+class AdmissionController:
+    """
+    Global admission control for download jobs.
+
+    At most `max_in_flight` jobs run at once, at most `max_queue` jobs wait
+    behind them (FIFO) and a single user can hold at most `per_user` slots
+    (running + queued). Anything beyond that is rejected immediately instead
+    of piling up on the VM.
+
+    Usage:
+        await controller.acquire(user_id, on_position)
+        try:
+            ...
+        finally:
+            controller.release(user_id)
+    """
+
+    def __init__(self, max_in_flight: int = 2, max_queue: int = 20, per_user: int = 2):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.per_user = per_user
+        self._in_flight = 0
+        self._waiters = deque()
+        self._per_user = {}
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, user_id, on_position: Optional[Callable[[int], Awaitable]] = None):
+        """
+        Waits for a download slot.
+
+        Args:
+            user_id: Telegram user id owning the job
+            on_position: Optional coroutine function called with the 1-based
+                queue position whenever it changes while waiting
+
+        Raises:
+            UserLimitError: If the user is already at their cap
+            QueueFullError: If the queue is full
+            
+        Returns:
+            bool: True if the job had to wait in the queue
+        """
+        if self._per_user.get(user_id, 0) >= self.per_user:
+            raise UserLimitError(
+                f"⚠️ Você já tem {self.per_user} downloads em andamento.\n\n"
+                f"Aguarde eles terminarem antes de enviar outro link."
+            )
+
+        if self._in_flight < self.max_in_flight and not self._waiters:
+            self._admit(user_id)
+            return False
+
+        if len(self._waiters) >= self.max_queue:
+            logger.warning(f"Admission queue full ({len(self._waiters)}), rejecting job from {user_id}")
+            raise QueueFullError(
+                "🚦 O bot está sobrecarregado no momento.\n\n"
+                "A fila de downloads está cheia. Tente novamente em alguns minutos."
+            )
+
+        waiter = _Waiter(user_id, asyncio.get_running_loop().create_future(), on_position)
+        self._waiters.append(waiter)
+        self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+        self._notify(waiter, len(self._waiters))
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Slot was handed over right before the cancellation
+                self.release(user_id)
+            else:
+                self._waiters.remove(waiter)
+                self._decrement_user(user_id)
+                self._notify_positions()
+            raise
+        
+        return True
+
+    def release(self, user_id):
+        """Frees a slot held by `user_id` and hands it to the next waiter."""
+        self._in_flight -= 1
+        self._decrement_user(user_id)
+
+        while self._waiters and self._in_flight < self.max_in_flight:
+            waiter = self._waiters.popleft()
+            if waiter.future.done():
+                continue
+            # The waiter already counts towards _per_user; only the slot moves
+            self._in_flight += 1
+            waiter.future.set_result(None)
+
+        self._notify_positions()
+
+    def _admit(self, user_id):
+        self._in_flight += 1
+        self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+
+    def _decrement_user(self, user_id):
+        count = self._per_user.get(user_id, 0) - 1
+        if count > 0:
+            self._per_user[user_id] = count
+        else:
+            self._per_user.pop(user_id, None)
+
+    def _notify_positions(self):
+        for position, waiter in enumerate(self._waiters, 1):
+            self._notify(waiter, position)
+
+    def _notify(self, waiter, position):
+        if waiter.on_position is None:
+            return
+
+        async def _run():
+            if waiter.future.done():
+                return
+            try:
+                await waiter.on_position(position)
+            except Exception as e:
+                logger.debug(f"Queue position update failed: {e}")
+
+        asyncio.get_running_loop().create_task(_run())
+
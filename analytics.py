@@ -0,0 +1,176 @@
+import time
+
+import numpy as np
+
+# Hour blocks by hour // 6
+TIME_BLOCKS = ['Madrugada (00h-6h)', 'Manhã (6h-12h)', 'Tarde (12h-18h)', 'Noite (18h-00h)']
+WEEKDAYS = ['Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta', 'Sábado', 'Domingo']
+
+
+def _local_offset() -> int:
+    """Current UTC offset of the local timezone in seconds (DST changes are ignored)."""
+    return time.localtime().tm_gmtoff
+
+
+def extract_hashtags(title: str) -> list:
+    """Normalized hashtags (lowercase, without '#') in a video title, in order."""
+    tags = []
+    for word in title.split():
+        if word.startswith('#'):
+            tag = word.strip('#').lower()
+            if tag:
+                tags.append(tag)
+    return tags
+
+
+class Interner:
+    """Maps strings to dense integer codes."""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def code(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class FeedColumns:
+    """
+    Columnar view of a list of tikwm video items (feed, search or posts pages)
+    or VideoRecords.
+
+    Counts and timestamps become NumPy arrays, authors/sounds/hashtags are
+    interned to integer codes, and aggregations are vectorized group-bys
+    (np.bincount). Hashtags are tokenized once into (video index, tag code)
+    pairs; URLs are only built for the rows that end up being shown.
+    """
+
+    def __init__(self, items: list, default_author: str = 'user'):
+        n = len(items)
+        self.size = n
+        self.play = np.fromiter((v.get('play_count', 0) for v in items), dtype=np.int64, count=n)
+        self.digg = np.fromiter((v.get('digg_count', 0) for v in items), dtype=np.int64, count=n)
+        self.comment = np.fromiter((v.get('comment_count', 0) for v in items), dtype=np.int64, count=n)
+        self.share = np.fromiter((v.get('share_count', 0) for v in items), dtype=np.int64, count=n)
+        self.create_time = np.fromiter((v.get('create_time', 0) for v in items), dtype=np.int64, count=n)
+        self.duration = np.fromiter((v.get('duration', 0) for v in items), dtype=np.int64, count=n)
+
+        self.video_ids = [v.get('video_id') for v in items]
+        self.titles = [v.get('title', '') for v in items]
+        self.covers = [v.get('cover', '') for v in items]
+
+        self.authors = Interner()
+        author = np.empty(n, dtype=np.int64)
+        self.music = Interner()
+        music = np.full(n, -1, dtype=np.int64)
+        self.music_info = []
+        self.tags = Interner()
+        tag_rows, tag_codes = [], []
+
+        for i, v in enumerate(items):
+            # Raw tikwm items nest the author; VideoRecords carry unique_id directly
+            author_info = v.get('author')
+            if isinstance(author_info, dict):
+                author[i] = self.authors.code(author_info.get('unique_id', default_author))
+            else:
+                author[i] = self.authors.code(v.get('unique_id') or default_author)
+
+            music_info = v.get('music_info') or {}
+            music_id = music_info.get('id', '')
+            if music_id:
+                code = self.music.code(music_id)
+                if code == len(self.music_info):
+                    self.music_info.append(music_info)
+                music[i] = code
+
+            for tag in extract_hashtags(self.titles[i]):
+                tag_rows.append(i)
+                tag_codes.append(self.tags.code(tag))
+
+        self.author = author
+        self.music_code = music
+        self.tag_rows = np.array(tag_rows, dtype=np.int64)
+        self.tag_codes = np.array(tag_codes, dtype=np.int64)
+
+    def url(self, i: int) -> str:
+        return f"https://www.tiktok.com/@{self.authors.values[self.author[i]]}/video/{self.video_ids[i]}"
+
+    def hashtag_stats(self, limit: int) -> list:
+        """
+        Per-hashtag count, total views/likes and most liked video,
+        sorted by count (ties keep first-seen order).
+        """
+        k = len(self.tags)
+        if not k:
+            return []
+
+        counts = np.bincount(self.tag_codes, minlength=k)
+        views = np.bincount(self.tag_codes, weights=self.play[self.tag_rows], minlength=k)
+        likes = np.bincount(self.tag_codes, weights=self.digg[self.tag_rows], minlength=k)
+
+        # Most liked row per tag: sort pairs by (tag, likes) and take the last of each group
+        order = np.lexsort((self.digg[self.tag_rows], self.tag_codes))
+        last_of_group = np.r_[self.tag_codes[order][1:] != self.tag_codes[order][:-1], True]
+        top_rows = np.empty(k, dtype=np.int64)
+        top_rows[self.tag_codes[order][last_of_group]] = self.tag_rows[order][last_of_group]
+
+        ranked = np.lexsort((np.arange(k), -counts))[:limit]
+        return [
+            {
+                'name': self.tags.values[t],
+                'count': int(counts[t]),
+                'total_views': int(views[t]),
+                'total_likes': int(likes[t]),
+                'top_video': self.url(int(top_rows[t])),
+            }
+            for t in ranked
+        ]
+
+    def sound_stats(self) -> list:
+        """Per-sound usage count and total views/likes, sorted by usage (ties keep first-seen order)."""
+        k = len(self.music)
+        if not k:
+            return []
+
+        mask = self.music_code >= 0
+        codes = self.music_code[mask]
+        usage = np.bincount(codes, minlength=k)
+        views = np.bincount(codes, weights=self.play[mask], minlength=k)
+        likes = np.bincount(codes, weights=self.digg[mask], minlength=k)
+
+        ranked = np.lexsort((np.arange(k), -usage))
+        sounds = []
+        for m in ranked:
+            info = self.music_info[m]
+            sounds.append({
+                'id': self.music.values[m],
+                'title': info.get('title', 'Unknown'),
+                'author': info.get('author', 'Unknown'),
+                'duration': info.get('duration', 0),
+                'usage_count': int(usage[m]),
+                'total_views': int(views[m]),
+                'total_likes': int(likes[m]),
+                'url': info.get('play', ''),
+            })
+        return sounds
+
+    def time_groups(self):
+        """
+        Returns (block, weekday, engagement) arrays for rows with a create_time,
+        where block indexes TIME_BLOCKS, weekday indexes WEEKDAYS and
+        engagement is likes + comments.
+        """
+        mask = self.create_time > 0
+        local = self.create_time[mask] + _local_offset()
+        block = (local // 3600) % 24 // 6
+        # 1970-01-01 was a Thursday (index 3 with Monday = 0)
+        weekday = (local // 86400 + 3) % 7
+        engagement = self.digg[mask] + self.comment[mask]
+        return block, weekday, engagement
@@ -0,0 +1,254 @@
+"""
+Time, peak memory and scaling of the analytics aggregations over
+synthetic histories of 1k to 1M videos: FeedColumns, the hashtag
+aggregation behind get_trending_topics (feed columns and hashtag index),
+the sound aggregation behind get_trending_sounds, and
+analyze_creator_content (whole list and page by page).
+
+    python -m benchmarks.analytics [--sizes 1000,10000,100000,1000000] [--only sound_stats]
+                                   [--max-exponent 1.25] [--max-seconds 5]
+
+The scaling exponent is the log-log slope of time (and peak memory)
+against the number of videos, fitted over sizes from 10k up where fixed
+costs no longer dominate: 1.0 is linear. Exits with status 1 when a
+function scales worse than --max-exponent or its largest run takes
+longer than --max-seconds.
+"""
+import os
+import gc
+import sys
+import math
+import time
+import random
+import argparse
+import itertools
+import tempfile
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+# Sizes below this are dominated by fixed costs and left out of the fit
+FIT_MIN_SIZE = 10_000
+
+# Posts per /api/user/posts page, as iter_creator_video_pages requests them
+CREATOR_PAGE_SIZE = 35
+
+WORDS = [
+    'como', 'fazer', 'meu', 'dia', 'receita', 'fácil', 'the', 'best', 'day', 'ever', 'when', 'you',
+    'pov', 'try', 'this', 'new', 'trend', 'vida', 'real', 'parte', 'final', 'wait', 'for', 'it',
+]
+
+
+def _zipf_weights(n: int, s: float = 1.1) -> list:
+    return list(itertools.accumulate(1 / (rank ** s) for rank in range(1, n + 1)))
+
+
+class Corpus:
+    """
+    Synthetic tikwm items with the distributions that drive the
+    aggregations: hashtag, sound and creator popularity follow a Zipf law
+    over vocabularies that grow with the history (Heaps' law), titles carry
+    0-6 hashtags, counts are log-normal and posts span 90 days.
+
+    Only the fields the analytics read are generated, and items of the same
+    creator/sound share their nested author/music_info dicts, so 1M videos
+    fit in memory; see benchmarks.fixtures for full-size items.
+    """
+
+    def __init__(self, size: int, seed: int = 0, now: int = None):
+        rng = random.Random(seed)
+        now = now or int(time.time())
+
+        tags = [f"tag{i}" for i in range(max(50, int(30 * size ** 0.5)))]
+        tag_weights = _zipf_weights(len(tags))
+        creators = [
+            {'unique_id': f"creator{i}", 'nickname': f"Creator {i}"}
+            for i in range(max(10, size // 50))
+        ]
+        creator_weights = _zipf_weights(len(creators))
+        sounds = [
+            {
+                'id': str(7100000000000000000 + i),
+                'title': f"original sound - creator{i}",
+                'author': f"creator{i}",
+                'duration': 5 + i % 55,
+                'play': f"https://sf16-ies-music.tiktokcdn.com/obj/{i}.mp3",
+            }
+            for i in range(max(10, size // 20))
+        ]
+        sound_weights = _zipf_weights(len(sounds))
+
+        # Drawn in bulk: one rng.choices call per column is much faster than per item
+        authors = rng.choices(creators, cum_weights=creator_weights, k=size)
+        music = rng.choices(sounds, cum_weights=sound_weights, k=size)
+        tag_counts = rng.choices(range(7), weights=[10, 20, 25, 20, 12, 8, 5], k=size)
+        tag_draws = iter(rng.choices(tags, cum_weights=tag_weights, k=sum(tag_counts)))
+
+        self.items = []
+        for i in range(size):
+            words = ' '.join(rng.choices(WORDS, k=rng.randrange(2, 10)))
+            hashtags = ' '.join(f"#{next(tag_draws)}" for _ in range(tag_counts[i]))
+            plays = int(rng.lognormvariate(10, 2))
+            self.items.append({
+                'video_id': str(7300000000000000000 + i),
+                'title': f"{words} {hashtags}" if hashtags else words,
+                'cover': f"https://p16-sign.tiktokcdn.com/{i}/cover.jpeg",
+                'duration': rng.randrange(5, 180),
+                'play_count': plays,
+                'digg_count': int(plays * rng.uniform(0.01, 0.15)),
+                'comment_count': int(plays * rng.uniform(0, 0.01)),
+                'share_count': int(plays * rng.uniform(0, 0.005)),
+                'create_time': now - rng.randrange(0, 90 * 86400),
+                'author': authors[i],
+                'music_info': music[i],
+            })
+
+
+def load_analytics(workdir: str):
+    """
+    Imports the analytics code with its data/ in `workdir` (downloader
+    opens the time series store and hashtag index at import time).
+    """
+    os.environ['DATA_DIR'] = os.path.join(workdir, 'data')
+    os.environ.setdefault('TELEGRAM_BOT_TOKEN', 'benchmark')
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+
+    import analytics
+    import downloader
+    from hashtag_index import HashtagIndex
+    return analytics, downloader, HashtagIndex
+
+
+def functions(analytics, downloader, HashtagIndex, workdir: str) -> dict:
+    """name -> (setup(items) -> state, run(state)); only `run` is measured."""
+
+    def index(items):
+        idx = HashtagIndex(os.path.join(workdir, 'bench_index.json'), max_videos=len(items))
+        idx.add_items(items, 'BR')
+        return idx
+
+    def pages(items):
+        for start in range(0, len(items), CREATOR_PAGE_SIZE):
+            yield items[start:start + CREATOR_PAGE_SIZE]
+
+    def creator_pages(items):
+        acc = downloader.CreatorStatsAccumulator()
+        for page in pages(items):
+            acc.add_page(page)
+        return acc.result()
+
+    return {
+        'FeedColumns': (lambda items: items, analytics.FeedColumns),
+        'hashtag_stats': (analytics.FeedColumns, lambda cols: cols.hashtag_stats(None)),
+        'topic_stats': (index, lambda idx: idx.topic_stats('BR', None)),
+        'sound_stats': (analytics.FeedColumns, lambda cols: cols.sound_stats()),
+        'analyze_creator_content': (lambda items: items, downloader.analyze_creator_content),
+        'creator_pages': (lambda items: items, creator_pages),
+    }
+
+
+def measure(setup, run, items: list, repeat: int) -> dict:
+    """
+    Best wall time of `repeat` runs and the peak memory `run` allocates.
+    The collector is paused while timing, like timeit does: otherwise
+    collections triggered by the corpus itself make big sizes noisy.
+    """
+    state = setup(items)
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            started = time.perf_counter()
+            result = run(state)
+            best = min(best, time.perf_counter() - started)
+        finally:
+            gc.enable()
+        del result
+
+    gc.collect()
+    tracemalloc.start()
+    result = run(state)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result, state
+    return {'seconds': best, 'peak_bytes': peak}
+
+
+def exponent(points: list) -> float:
+    """Least-squares slope of log(value) against log(size); NaN with fewer than two points."""
+    points = [(math.log(n), math.log(v)) for n, v in points if n >= FIT_MIN_SIZE and v > 0]
+    if len(points) < 2:
+        return math.nan
+    mx = sum(x for x, _ in points) / len(points)
+    my = sum(y for _, y in points) / len(points)
+    sxx = sum((x - mx) ** 2 for x, _ in points)
+    return sum((x - mx) * (y - my) for x, y in points) / sxx if sxx else math.nan
+
+
+def _cell(m: dict) -> str:
+    return f"{m['seconds'] * 1000:.1f} ms / {m['peak_bytes'] / 2**20:.1f} MiB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)), help='comma-separated history sizes')
+    parser.add_argument('--only', help='comma-separated functions to run')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per function at sizes up to 10k (fewer above)')
+    parser.add_argument('--max-exponent', type=float, default=1.25, help='fail when time or memory scales worse than this')
+    parser.add_argument('--max-seconds', type=float, help='fail when the largest size takes longer than this')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    sizes = sorted(int(s) for s in args.sizes.split(','))
+
+    workdir = tempfile.TemporaryDirectory(prefix='bench-analytics-')
+    try:
+        benchmarks = functions(*load_analytics(workdir.name), workdir.name)
+        if args.only:
+            wanted = args.only.split(',')
+            unknown = set(wanted) - set(benchmarks)
+            if unknown:
+                parser.error(f"unknown functions: {', '.join(sorted(unknown))}")
+            benchmarks = {name: benchmarks[name] for name in wanted}
+
+        results = {name: {} for name in benchmarks}
+        for size in sizes:
+            started = time.perf_counter()
+            items = Corpus(size, args.seed).items
+            print(f"{size:,} videos generated in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+            repeat = args.repeat if size <= 10_000 else max(1, args.repeat // 2 if size <= 100_000 else 1)
+            for name, (setup, run) in benchmarks.items():
+                results[name][size] = measure(setup, run, items, repeat)
+            del items
+            gc.collect()
+    finally:
+        workdir.cleanup()
+
+    header = ''.join(f"{n:>20,}" for n in sizes)
+    print(f"{'function':<26}{header}{'time exp':>10}{'mem exp':>9}")
+    failures = []
+    for name, by_size in results.items():
+        cells = ''.join(f"{_cell(m):>20}" for m in by_size.values())
+        time_exp = exponent([(n, m['seconds']) for n, m in by_size.items()])
+        mem_exp = exponent([(n, m['peak_bytes']) for n, m in by_size.items()])
+        print(f"{name:<26}{cells}{time_exp:>10.2f}{mem_exp:>9.2f}")
+
+        for kind, value in (('time', time_exp), ('memory', mem_exp)):
+            if value > args.max_exponent:
+                failures.append(f"{name}: {kind} grows as n^{value:.2f} (budget n^{args.max_exponent:.2f})")
+        largest = by_size[sizes[-1]]['seconds']
+        if args.max_seconds is not None and largest > args.max_seconds:
+            failures.append(f"{name}: {largest:.2f}s at {sizes[-1]:,} videos (budget {args.max_seconds:.2f}s)")
+
+    if failures:
+        print('\nOver budget:')
+        for line in failures:
+            print(f"  {line}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
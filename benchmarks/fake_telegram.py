@@ -0,0 +1,271 @@
+"""
+Stand-ins for Telegram:
+
+- FakeBot, FakeUpdate, FakeContext...: the parts of python-telegram-bot
+  the handlers touch, for calling handlers directly. Every Bot API call
+  is recorded with its duration and payload size, after an optional
+  simulated API latency.
+- FakeBotApi: a local Bot API HTTP server, for running the real PTB
+  Application against (ApplicationBuilder().base_url(...)).
+"""
+import re
+import json
+import time
+import asyncio
+import logging
+import itertools
+import threading
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Optional
+from urllib.parse import parse_qs
+
+logger = logging.getLogger(__name__)
+
+_message_ids = itertools.count(1)
+
+
+@dataclass
+class ApiCall:
+    method: str
+    bytes: int
+    started: float
+    seconds: float = 0.0
+
+
+def _payload_size(value) -> int:
+    """Bytes a Bot API argument would put on the wire (files are read)."""
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return len(value.encode())
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        # In-memory spools are uploaded as bytes; str() would measure their repr
+        return len(value)
+    if hasattr(value, 'read'):
+        position = value.tell()
+        size = 0
+        while True:
+            chunk = value.read(64 * 1024)
+            if not chunk:
+                break
+            size += len(chunk)
+        value.seek(position)
+        return size
+    return len(str(value).encode())
+
+
+class FakeBot:
+    """Records every Bot API call; `latency` seconds are awaited per call."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = []
+
+    async def call(self, method: str, *payload):
+        call = ApiCall(method, sum(_payload_size(p) for p in payload), time.monotonic())
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        call.seconds = time.monotonic() - call.started
+        self.calls.append(call)
+
+    def message(self, chat_id: int, text: Optional[str] = None, **extra) -> 'FakeMessage':
+        return FakeMessage(self, chat_id, text, **extra)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self.call('sendMessage', text)
+        return self.message(chat_id, text)
+
+    async def send_photo(self, chat_id, photo, caption=None, **kwargs):
+        await self.call('sendPhoto', photo, caption)
+        return self.message(chat_id)
+
+    async def send_audio(self, chat_id, audio, caption=None, **kwargs):
+        await self.call('sendAudio', audio, caption)
+        file_id = audio if isinstance(audio, str) else f"audio{next(_message_ids)}"
+        return self.message(chat_id, audio=SimpleNamespace(file_id=file_id))
+
+    async def send_video(self, chat_id, video, caption=None, **kwargs):
+        await self.call('sendVideo', video, caption)
+        return self.message(chat_id, video=SimpleNamespace(file_id=f"video{next(_message_ids)}"))
+
+    async def send_chat_action(self, chat_id, action, **kwargs):
+        await self.call('sendChatAction', action)
+
+
+class FakeMessage:
+    def __init__(self, bot: FakeBot, chat_id: int, text: Optional[str] = None, **extra):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = next(_message_ids)
+        self.text = text
+        self.chat = SimpleNamespace(id=chat_id)
+        for name, value in extra.items():
+            setattr(self, name, value)
+
+    async def reply_text(self, text, **kwargs):
+        return await self.bot.send_message(self.chat_id, text, **kwargs)
+
+    async def reply_video(self, video, caption=None, **kwargs):
+        return await self.bot.send_video(self.chat_id, video, caption, **kwargs)
+
+    async def reply_audio(self, audio, caption=None, **kwargs):
+        return await self.bot.send_audio(self.chat_id, audio, caption, **kwargs)
+
+    async def edit_text(self, text, **kwargs):
+        await self.bot.call('editMessageText', text)
+        self.text = text
+        return self
+
+    async def delete(self):
+        await self.bot.call('deleteMessage')
+        return True
+
+
+class FakeCallbackQuery:
+    def __init__(self, bot: FakeBot, message: FakeMessage, data: str, user_id: int):
+        self.bot = bot
+        self.message = message
+        self.data = data
+        self.from_user = SimpleNamespace(id=user_id)
+
+    async def answer(self, text=None, show_alert=False, **kwargs):
+        await self.bot.call('answerCallbackQuery', text)
+        return True
+
+    async def edit_message_text(self, text, **kwargs):
+        return await self.message.edit_text(text, **kwargs)
+
+    async def delete_message(self):
+        return await self.message.delete()
+
+
+@dataclass
+class FakeContext:
+    bot: FakeBot
+    args: list = field(default_factory=list)
+    user_data: dict = field(default_factory=dict)
+    chat_data: dict = field(default_factory=dict)
+
+
+class FakeUpdate:
+    """A message update (text or /command) or a callback query update."""
+
+    def __init__(self, bot: FakeBot, chat_id: int, user_id: int, text: Optional[str] = None,
+                 callback_data: Optional[str] = None):
+        self.effective_chat = SimpleNamespace(id=chat_id)
+        self.effective_user = SimpleNamespace(id=user_id)
+        self.message = None
+        self.callback_query = None
+        if callback_data is None:
+            self.message = bot.message(chat_id, text)
+        else:
+            self.callback_query = FakeCallbackQuery(bot, bot.message(chat_id, 'results'), callback_data, user_id)
+
+
+_MULTIPART_FIELD = re.compile(rb'name="(chat_id|message_id|text|caption)"\r\n(?:[^\r\n]+\r\n)*\r\n(.*?)\r\n--', re.S)
+_DOWNLOAD_BUTTON = re.compile(r'"callback_data":\s*"((?:download|audio)_[^"]+)"')
+
+
+class FakeBotApi:
+    """
+    Minimal Bot API server: answers the methods the bot uses with
+    plausible results after `latency` seconds, counting calls and request
+    bytes per method. Messages containing "❌" are counted as errors, and
+    the download buttons sent to each chat are kept in `buttons` so
+    simulated users can tap them.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.base_url = None
+        self.stats = {}
+        self.errors = {}  # first line of each "❌" message -> count
+        self.buttons = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def start(self) -> str:
+        """Starts serving in a daemon thread. Returns the base URL for ApplicationBuilder.base_url."""
+        self._server = ThreadingHTTPServer((self.host, self.port), _BotApiHandler)
+        self._server.daemon_threads = True
+        self._server.api = self
+        self.port = self._server.server_address[1]
+        self.base_url = f"http://{self.host}:{self.port}/bot"
+        threading.Thread(target=self._server.serve_forever, name='fake-bot-api', daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def record(self, method: str, size: int, fields: dict):
+        with self._lock:
+            counters = self.stats.setdefault(method, {'calls': 0, 'bytes': 0})
+            counters['calls'] += 1
+            counters['bytes'] += size
+            text = fields.get('text') or fields.get('caption') or ''
+            if '❌' in text:
+                first_line = text.strip().splitlines()[0]
+                self.errors[first_line] = self.errors.get(first_line, 0) + 1
+            buttons = _DOWNLOAD_BUTTON.findall(fields.get('reply_markup', ''))
+            if buttons:
+                chat = self.buttons.setdefault(str(fields.get('chat_id')), [])
+                chat.extend(buttons)
+                del chat[:-50]
+
+    def result(self, method: str, fields: dict):
+        chat_id = int(fields.get('chat_id') or 0)
+        message = {
+            'message_id': int(fields.get('message_id') or next(_message_ids)),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+        }
+        file_id = f"{method}{next(_message_ids)}"
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        if method in ('sendMessage', 'editMessageText'):
+            return {**message, 'text': fields.get('text', '')}
+        if method == 'sendPhoto':
+            return {**message, 'photo': [{'file_id': file_id, 'file_unique_id': file_id, 'width': 720, 'height': 1280}]}
+        if method == 'sendVideo':
+            return {**message, 'video': {'file_id': file_id, 'file_unique_id': file_id, 'width': 720, 'height': 1280, 'duration': 30}}
+        if method == 'sendAudio':
+            return {**message, 'audio': {'file_id': file_id, 'file_unique_id': file_id, 'duration': 30}}
+        return True
+
+
+class _BotApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def do_POST(self):
+        api = self.server.api
+        method = self.path.rstrip('/').rsplit('/', 1)[-1]
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.startswith('application/json'):
+            fields = {k: v if isinstance(v, str) else json.dumps(v) for k, v in json.loads(body or b'{}').items()}
+        elif content_type.startswith('multipart/'):
+            fields = {k.decode(): v.decode('utf-8', 'replace') for k, v in _MULTIPART_FIELD.findall(body)}
+        else:
+            fields = {k: v[-1] for k, v in parse_qs(body.decode('utf-8', 'replace')).items()}
+
+        if api.latency:
+            time.sleep(api.latency)
+        api.record(method, len(body), fields)
+
+        payload = json.dumps({'ok': True, 'result': api.result(method, fields)}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
@@ -0,0 +1,452 @@
+"""
+Local stand-in for the services downloader.py talks to: the tikwm API
+(/api/, feed list/search, user info/posts), SnapInsta, SnapTik and a fake
+CDN serving synthetic video/audio bytes with Range support. Latency,
+errors and throttling can be injected per service.
+
+    python -m benchmarks.fake_upstream [--port 8765] [--latency 0.3] [--error-rate 0.05] ...
+
+then start the bot with the printed TIKWM_BASE_URL / SNAPINSTA_BASE_URL /
+SNAPTIK_BASE_URL. yt-dlp is not covered: it still needs the real sites.
+
+Responses are synthetic (benchmarks.fixtures) unless `fixtures` points at
+a directory with recorded ones, named after FIXTURE_NAMES (e.g.
+feed_list.json, snaptik.html); "$BASE" inside them is replaced with the
+server's URL so media links hit the fake CDN.
+"""
+import os
+import re
+import json
+import time
+import zlib
+import random
+import logging
+import argparse
+import threading
+from collections import deque
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+from benchmarks.fixtures import feed_page, video_item
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# path -> service (the unit faults are configured and counted by)
+ROUTES = {
+    '/api/': 'tikwm',
+    '/api/feed/list': 'tikwm',
+    '/api/feed/search': 'tikwm',
+    '/api/user/info': 'tikwm',
+    '/api/user/posts': 'tikwm',
+    '/api/ajaxSearch': 'snapinsta',
+    '/abc2.php': 'snaptik',
+}
+
+# path -> recorded fixture file name (without extension)
+FIXTURE_NAMES = {
+    '/api/': 'video',
+    '/api/feed/list': 'feed_list',
+    '/api/feed/search': 'feed_search',
+    '/api/user/info': 'user_info',
+    '/api/user/posts': 'user_posts',
+    '/api/ajaxSearch': 'snapinsta',
+    '/abc2.php': 'snaptik',
+}
+
+POSTS_PER_CREATOR = 300
+CHUNK = 64 * 1024
+# Repeating pattern the synthetic media bytes are cut from
+_PATTERN = bytes(range(256)) * (CHUNK // 256)
+_RANGE = re.compile(r'bytes=(\d*)-(\d*)$')
+
+
+@dataclass
+class Faults:
+    """What goes wrong, and how slowly, for one service."""
+
+    latency: float = 0.0        # seconds before every response
+    jitter: float = 0.0         # extra uniform random latency, up to this many seconds
+    error_rate: float = 0.0     # share of requests answered with HTTP 500
+    throttle_rate: float = 0.0  # share of requests answered as throttled
+    rps: float = 0.0            # requests per second before throttling (0 = unlimited)
+    bandwidth: float = 0.0      # CDN bytes per second per response (0 = unlimited)
+
+
+class FakeUpstream:
+    """
+    The stand-in server. Use as a context manager (or start()/stop()) and
+    point the bot at it with env(). `faults` applies to every service
+    unless `service_faults` has an entry for it ('tikwm', 'snapinsta',
+    'snaptik', 'cdn'). Counters per service are in `stats`.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, faults: Optional[Faults] = None,
+                 service_faults: Optional[dict] = None, fixtures: Optional[str] = None,
+                 video_size: int = 2 * MB, audio_size: int = MB // 2, seed: int = 0):
+        self.host = host
+        self.port = port
+        self.faults = faults or Faults()
+        self.service_faults = service_faults or {}
+        self.fixtures = fixtures
+        self.video_size = video_size
+        self.audio_size = audio_size
+        self.base_url = None
+        self.stats = {}
+        self._rng = random.Random(seed)
+        self._recent = {}
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def start(self) -> str:
+        """Starts serving in a daemon thread. Returns the base URL."""
+        self._server = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._server.daemon_threads = True
+        self._server.upstream = self
+        self.port = self._server.server_address[1]
+        self.base_url = f"http://{self.host}:{self.port}"
+        threading.Thread(target=self._server.serve_forever, name='fake-upstream', daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def env(self) -> dict:
+        """Environment variables that point downloader.py and tikwm.py here."""
+        return {
+            'TIKWM_BASE_URL': self.base_url,
+            'SNAPINSTA_BASE_URL': self.base_url,
+            'SNAPTIK_BASE_URL': self.base_url,
+        }
+
+    def faults_for(self, service: str) -> Faults:
+        return self.service_faults.get(service, self.faults)
+
+    def count(self, service: str, name: str, amount: int = 1):
+        with self._lock:
+            counters = self.stats.setdefault(service, {'requests': 0, 'errors': 0, 'throttled': 0, 'bytes': 0})
+            counters[name] += amount
+
+    def inject(self, service: str) -> Optional[str]:
+        """
+        Applies `service`'s latency and decides its fate: 'error',
+        'throttled' or None (serve normally).
+        """
+        faults = self.faults_for(service)
+        with self._lock:
+            roll = self._rng.random()
+            delay = faults.latency + faults.jitter * self._rng.random()
+            over_limit = False
+            if faults.rps:
+                now = time.monotonic()
+                recent = self._recent.setdefault(service, deque())
+                while recent and now - recent[0] >= 1.0:
+                    recent.popleft()
+                over_limit = len(recent) >= faults.rps
+                if not over_limit:
+                    recent.append(now)
+
+        if delay:
+            time.sleep(delay)
+        if roll < faults.error_rate:
+            return 'error'
+        if over_limit or roll < faults.error_rate + faults.throttle_rate:
+            return 'throttled'
+        return None
+
+    def fixture(self, path: str) -> Optional[tuple]:
+        """Recorded (body, content type) for `path`, or None."""
+        if not self.fixtures:
+            return None
+        for ext, content_type in (('.json', 'application/json'), ('.html', 'text/html; charset=utf-8')):
+            name = os.path.join(self.fixtures, FIXTURE_NAMES[path] + ext)
+            if os.path.exists(name):
+                with open(name, 'rb') as f:
+                    return f.read().replace(b'$BASE', self.base_url.encode()), content_type
+        return None
+
+    def respond(self, path: str, params: dict) -> tuple:
+        """Synthetic (body, content type) for an API route."""
+        recorded = self.fixture(path)
+        if recorded:
+            return recorded
+
+        key = (path, tuple(sorted(params.items())))
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached:
+            return cached
+
+        if path == '/abc2.php':
+            body = self._snaptik(params).encode()
+            result = body, 'text/html; charset=utf-8'
+        else:
+            body = getattr(self, '_' + FIXTURE_NAMES[path])(params)
+            result = json.dumps(body).encode(), 'application/json'
+
+        with self._lock:
+            if len(self._cache) > 1000:
+                self._cache.clear()
+            self._cache[key] = result
+        return result
+
+    # Synthetic responses, deterministic per request parameters
+
+    def _items(self, count: int, seed: str, start: int = 0, **kwargs) -> list:
+        cdn = f"{self.base_url}/cdn/tiktokcdn"
+        page = feed_page(count, zlib.crc32(seed.encode()), start, cdn=cdn, music_cdn=cdn, **kwargs)
+        return page['data']
+
+    def _feed_list(self, params: dict) -> dict:
+        region = params.get('region', 'US')
+        count = min(int(params.get('count', 10)), 200)
+        # Regions overlap partially, like the real global feeds
+        items = self._items(count, f"feed:{region}", zlib.crc32(region.encode()) % 1000)
+        return {'code': 0, 'msg': 'success', 'processed_time': 0.3, 'data': items}
+
+    def _feed_search(self, params: dict) -> dict:
+        keywords = params.get('keywords', '')
+        region = params.get('region', 'US')
+        count = min(int(params.get('count', 10)), 100)
+        items = self._items(count, f"search:{keywords}:{region}", 100_000 + zlib.crc32(keywords.encode()) % 100_000)
+        for item in items:
+            item['title'] = f"{item['title']} {keywords}"
+        return {'code': 0, 'msg': 'success', 'processed_time': 0.4,
+                'data': {'videos': items, 'cursor': count, 'hasMore': True}}
+
+    def _user_info(self, params: dict) -> dict:
+        unique_id = params.get('unique_id', 'user')
+        rng = random.Random(zlib.crc32(unique_id.encode()))
+        return {'code': 0, 'msg': 'success', 'processed_time': 0.2, 'data': {
+            'user': {
+                'id': str(6800000000000000000 + rng.randrange(10 ** 12)),
+                'unique_id': unique_id,
+                'nickname': unique_id.title(),
+                'avatar': f"{self.base_url}/cdn/tiktokcdn/avatar_{unique_id}.jpeg",
+                'signature': 'Conta de teste do servidor local',
+                'verified': rng.random() < 0.2,
+                'secUid': f"MS4wLjABAAAA{rng.getrandbits(256):064x}",
+                'privateAccount': False,
+            },
+            'stats': {
+                'followerCount': rng.randrange(1000, 10 ** 7),
+                'followingCount': rng.randrange(0, 2000),
+                'heartCount': rng.randrange(10 ** 4, 10 ** 9),
+                'videoCount': POSTS_PER_CREATOR,
+                'diggCount': rng.randrange(0, 10 ** 5),
+            },
+        }}
+
+    def _user_posts(self, params: dict) -> dict:
+        unique_id = params.get('unique_id', 'user')
+        cursor = int(params.get('cursor', 0))
+        count = max(0, min(int(params.get('count', 10)), 35, POSTS_PER_CREATOR - cursor))
+        items = self._items(count, f"posts:{unique_id}:{cursor}", 200_000 + cursor)
+        now = int(time.time())
+        for i, item in enumerate(items):
+            # Newest first, one post every 6 hours
+            item['create_time'] = now - (cursor + i) * 6 * 3600
+            item['author']['unique_id'] = unique_id
+        return {'code': 0, 'msg': 'success', 'processed_time': 0.3, 'data': {
+            'videos': items, 'cursor': cursor + count, 'hasMore': cursor + count < POSTS_PER_CREATOR,
+        }}
+
+    def _video(self, params: dict) -> dict:
+        url = params.get('url', '')
+        video_id = (re.findall(r'\d{6,}', url) or [str(zlib.crc32(url.encode()))])[-1]
+        item = video_item(0, random.Random(video_id), cdn=f"{self.base_url}/cdn/tiktokcdn")
+        item['id'] = item['video_id'] = video_id
+        item['play'] = f"{self.base_url}/cdn/tiktokcdn/{video_id}.mp4"
+        item['hdplay'] = f"{self.base_url}/cdn/tiktokcdn/{video_id}_hd.mp4"
+        item['size'] = item['hd_size'] = self.video_size
+        return {'code': 0, 'msg': 'success', 'processed_time': 0.5, 'data': item}
+
+    def _snapinsta(self, params: dict) -> dict:
+        name = zlib.crc32(params.get('q', '').encode())
+        html = (
+            '<div class="download-items"><div class="download-items__thumb">'
+            f'<img src="{self.base_url}/cdn/scontent/{name}.jpg"></div>'
+            f'<div class="download-items__btn"><a href="{self.base_url}/cdn/scontent/{name}.mp4" '
+            'class="abutton is-success is-fullwidth btn-premium download-media" rel="nofollow">'
+            '<span>Download Video</span></a></div></div>'
+        )
+        return {'status': 'ok', 'p': 'video', 'data': html}
+
+    def _snaptik(self, params: dict) -> str:
+        name = zlib.crc32(params.get('url', '').encode())
+        return (
+            '<div class="video-links">'
+            f'<a href="{self.base_url}/cdn/tiktokcdn/{name}.mp4" class="button download-file" rel="nofollow">Download</a>'
+            f'<a href="{self.base_url}/cdn/tiktokcdn/{name}_hd.mp4" class="button download-file-hd" rel="nofollow">Download HD</a>'
+            '</div>'
+        )
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        if url.path.startswith('/cdn/'):
+            self._media(url.path, params, head=False)
+        elif url.path == '/_stats':
+            with self.server.upstream._lock:
+                body = json.dumps(self.server.upstream.stats).encode()
+            self._send(200, body, 'application/json')
+        else:
+            self._api(url.path, params)
+
+    def do_HEAD(self):
+        url = urlsplit(self.path)
+        if url.path.startswith('/cdn/'):
+            self._media(url.path, {k: v[-1] for k, v in parse_qs(url.query).items()}, head=True)
+        else:
+            self._send(405, b'')
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        form = self.rfile.read(length).decode('utf-8', 'replace') if length else ''
+        params = {k: v[-1] for k, v in parse_qs(form).items()}
+        params.update({k: v[-1] for k, v in parse_qs(url.query).items()})
+        self._api(url.path, params)
+
+    def _send(self, status: int, body: bytes, content_type: str = 'text/plain', headers: Optional[dict] = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _api(self, path: str, params: dict):
+        upstream = self.server.upstream
+        service = ROUTES.get(path)
+        if service is None:
+            self._send(404, b'not found')
+            return
+
+        upstream.count(service, 'requests')
+        fate = upstream.inject(service)
+        if fate == 'error':
+            upstream.count(service, 'errors')
+            self._send(500, b'Internal Server Error')
+            return
+        if fate == 'throttled':
+            upstream.count(service, 'throttled')
+            if service == 'tikwm':
+                # tikwm answers 200 with a non-zero code when over its free limit
+                body = json.dumps({'code': -1, 'msg': 'Free Api Limit: 1 request/second.', 'processed_time': 0}).encode()
+                self._send(200, body, 'application/json')
+            else:
+                self._send(429, b'Too Many Requests', headers={'Retry-After': '1'})
+            return
+
+        body, content_type = upstream.respond(path, params)
+        upstream.count(service, 'bytes', len(body))
+        self._send(200, body, content_type)
+
+    def _media(self, path: str, params: dict, head: bool):
+        upstream = self.server.upstream
+        upstream.count('cdn', 'requests')
+        fate = upstream.inject('cdn')
+        if fate:
+            upstream.count('cdn', 'errors' if fate == 'error' else 'throttled')
+            self._send(500 if fate == 'error' else 429, b'')
+            return
+
+        audio = path.endswith('.mp3')
+        size = int(params.get('size') or (upstream.audio_size if audio else upstream.video_size))
+        start, end, status = 0, size - 1, 200
+        headers = {'Accept-Ranges': 'bytes'}
+
+        match = _RANGE.match(self.headers.get('Range', ''))
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:  # suffix range: the last N bytes
+                start = max(0, size - int(match.group(2)))
+            if start >= size or start > end:
+                self._send(416, b'', headers={'Content-Range': f"bytes */{size}"})
+                return
+            status = 206
+            headers['Content-Range'] = f"bytes {start}-{end}/{size}"
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'audio/mpeg' if audio else 'video/mp4')
+        self.send_header('Content-Length', str(end - start + 1))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if head:
+            return
+
+        bandwidth = upstream.faults_for('cdn').bandwidth
+        pos = start
+        try:
+            while pos <= end:
+                offset = pos % CHUNK
+                chunk = _PATTERN[offset:offset + min(CHUNK - offset, end - pos + 1)]
+                self.wfile.write(chunk)
+                pos += len(chunk)
+                upstream.count('cdn', 'bytes', len(chunk))
+                if bandwidth:
+                    time.sleep(len(chunk) / bandwidth)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random latency, up to this many seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of HTTP 500 responses')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='share of throttled responses')
+    parser.add_argument('--rps', type=float, default=0.0, help='requests per second per service before throttling')
+    parser.add_argument('--bandwidth', type=float, default=0.0, help='CDN bytes per second per download')
+    parser.add_argument('--video-mb', type=float, default=2.0, help='size of served videos')
+    parser.add_argument('--fixtures', help='directory with recorded responses')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    faults = Faults(args.latency, args.jitter, args.error_rate, args.throttle_rate, args.rps, args.bandwidth)
+    upstream = FakeUpstream(args.host, args.port, faults, fixtures=args.fixtures,
+                            video_size=int(args.video_mb * MB), seed=args.seed)
+    upstream.start()
+    for name, value in upstream.env().items():
+        print(f"export {name}={value}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        upstream.stop()
+        print(json.dumps(upstream.stats, indent=2))
+
+
+if __name__ == '__main__':
+    main()
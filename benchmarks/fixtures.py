@@ -0,0 +1,93 @@
+import json
+import random
+import time
+
+WORDS = ['dance', 'funny', 'food', 'pet', 'travel', 'music', 'fyp', 'viral', 'tutorial', 'outfit', 'receita', 'humor']
+
+TIKTOK_CDN = 'https://v16m.tiktokcdn.com'
+MUSIC_CDN = 'https://sf16-ies-music.tiktokcdn.com/obj'
+
+
+def video_item(i: int, rng: random.Random, now: int = None, cdn: str = TIKTOK_CDN, music_cdn: str = MUSIC_CDN) -> dict:
+    """
+    A tikwm feed/search item with the shape and field sizes of real
+    responses (URLs, nested author/music objects, commerce info), most of
+    which the bot never reads. `cdn`/`music_cdn` set where the video and
+    sound URLs point.
+    """
+    now = now or int(time.time())
+    video_id = str(7300000000000000000 + i)
+    author_id = str(6800000000000000000 + rng.randrange(5000))
+    unique_id = f"creator{rng.randrange(5000)}"
+    music_id = str(7100000000000000000 + rng.randrange(300))
+    tags = ' '.join(f"#{rng.choice(WORDS)}" for _ in range(rng.randrange(1, 5)))
+    cdn = f"{cdn}/{rng.getrandbits(128):032x}/{video_id}"
+    return {
+        'aweme_id': f"v09044g40000{rng.getrandbits(64):016x}",
+        'video_id': video_id,
+        'region': rng.choice(['US', 'BR', 'JP', 'GB', 'FR']),
+        'title': f"{' '.join(rng.choices(WORDS, k=rng.randrange(3, 12)))} {tags}",
+        'cover': f"{cdn}/cover.jpeg?x-expires={now + 86400}&x-signature={rng.getrandbits(96):024x}",
+        'ai_dynamic_cover': f"{cdn}/dynamic.webp?x-expires={now + 86400}&x-signature={rng.getrandbits(96):024x}",
+        'origin_cover': f"{cdn}/origin.jpeg?x-expires={now + 86400}&x-signature={rng.getrandbits(96):024x}",
+        'duration': rng.randrange(5, 180),
+        'play': f"{cdn}/play.mp4?x-expires={now + 86400}&x-signature={rng.getrandbits(96):024x}",
+        'wmplay': f"{cdn}/wmplay.mp4?x-expires={now + 86400}&x-signature={rng.getrandbits(96):024x}",
+        'size': rng.randrange(500_000, 20_000_000),
+        'wm_size': rng.randrange(500_000, 20_000_000),
+        'music': f"{music_cdn}/{music_id}.mp3",
+        'music_info': {
+            'id': music_id,
+            'title': f"original sound - {unique_id}",
+            'play': f"{music_cdn}/{music_id}.mp3",
+            'cover': f"https://p16-sign.tiktokcdn.com/{rng.getrandbits(64):016x}~c5_100x100.jpeg",
+            'author': unique_id,
+            'original': rng.random() < 0.5,
+            'duration': rng.randrange(5, 60),
+            'album': '',
+        },
+        'play_count': rng.randrange(1000, 50_000_000),
+        'digg_count': rng.randrange(10, 5_000_000),
+        'comment_count': rng.randrange(0, 100_000),
+        'share_count': rng.randrange(0, 200_000),
+        'download_count': rng.randrange(0, 50_000),
+        'collect_count': rng.randrange(0, 100_000),
+        'create_time': now - rng.randrange(0, 30 * 86400),
+        'anchors': None,
+        'anchors_extras': '',
+        'is_ad': False,
+        'commerce_info': {
+            'adv_promotable': False,
+            'auction_ad_invited': False,
+            'branded_content_type': 0,
+            'with_comment_filter_words': False,
+        },
+        'commercial_video_info': '',
+        'item_comment_settings': 0,
+        'mentioned_users': '',
+        'author': {
+            'id': author_id,
+            'unique_id': unique_id,
+            'nickname': f"Creator {unique_id[7:]}",
+            'avatar': f"https://p16-sign-va.tiktokcdn.com/{rng.getrandbits(128):032x}~c5_300x300.jpeg",
+        },
+        'is_top': 0,
+    }
+
+
+def feed_page(count: int = 200, seed: int = 0, start: int = 0, **kwargs) -> dict:
+    """
+    A /api/feed/list response with `count` items numbered from `start`
+    (kwargs go to video_item).
+    """
+    rng = random.Random(seed)
+    return {
+        'code': 0,
+        'msg': 'success',
+        'processed_time': 0.25,
+        'data': [video_item(start + i, rng, **kwargs) for i in range(count)],
+    }
+
+
+def feed_page_bytes(count: int = 200, seed: int = 0) -> bytes:
+    return json.dumps(feed_page(count, seed)).encode()
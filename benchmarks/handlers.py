@@ -0,0 +1,240 @@
+"""
+End-to-end latency of the bot's handlers, driven with fake Telegram
+objects (benchmarks.fake_telegram) against the stand-in upstreams
+(benchmarks.fake_upstream), with p50/p95/p99 latency, Bot API calls and
+bytes moved per command, optionally compared against a saved baseline.
+
+    python -m benchmarks.handlers [--iterations 20] [--only viral_callback,musicas]
+                                  [--save-baseline FILE] [--baseline FILE] [--tolerance 0.2]
+
+Exits with status 1 when a command regressed against the baseline, so it
+can gate a deploy. yt-dlp is skipped (its circuits are forced open), so
+downloads go through the alternative APIs and the fake CDN.
+"""
+import os
+import sys
+import json
+import math
+import time
+import asyncio
+import logging
+import argparse
+import platform
+import tempfile
+from statistics import mean
+
+from benchmarks.fake_telegram import FakeBot, FakeContext, FakeUpdate
+from benchmarks.fake_upstream import MB, Faults, FakeUpstream
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHAT_ID = 1000
+USER_ID = 2000
+REGIONS = ['BR', 'US', 'GLOBAL']
+
+# Regressions smaller than this many seconds are noise, whatever the ratio
+MIN_REGRESSION_SECONDS = 0.01
+
+
+def percentile(values: list, p: float) -> float:
+    """Nearest-rank percentile (0-100) of `values`."""
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))]
+
+
+def load_bot(workdir: str, upstream: FakeUpstream, tikwm_rate: float):
+    """
+    Imports bot.py pointed at `upstream`, with its data/ and downloads/ in
+    `workdir`. Must run before anything else imports the bot's modules,
+    since they read their settings at import time.
+    """
+    os.environ.update(upstream.env())
+    os.environ['DATA_DIR'] = os.path.join(workdir, 'data')
+    os.environ['TIKWM_RATE_PER_SECOND'] = str(tikwm_rate)
+    os.environ['TIKWM_BURST'] = str(max(1, int(tikwm_rate)))
+    os.environ.setdefault('TELEGRAM_BOT_TOKEN', 'benchmark')
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    os.chdir(workdir)
+    os.makedirs('downloads', exist_ok=True)
+
+    import bot
+    from providers import OPEN, provider_health
+
+    # yt-dlp would need the real sites; keep its circuits open for the whole run
+    for name in ('yt-dlp:tiktok', 'yt-dlp:instagram', 'yt-dlp:other'):
+        stats = provider_health.get(name)
+        stats.state, stats.opened_at, stats.cooldown = OPEN, time.monotonic(), float('inf')
+    return bot
+
+
+def scenarios(bot) -> dict:
+    """command -> coroutine function(fake_bot, iteration) running one request."""
+
+    async def handle_message(fb, i):
+        url = f"https://www.tiktok.com/@bench/video/{7400000000000000000 + i}"
+        await bot.handle_message(FakeUpdate(fb, CHAT_ID, USER_ID, text=url), FakeContext(fb))
+
+    async def download_callback(fb, i):
+        url = f"https://www.tiktok.com/@bench/video/{7500000000000000000 + i}"
+        video_id = bot.media_key(url)
+        bot.video_cache[video_id] = url
+        update = FakeUpdate(fb, CHAT_ID, USER_ID, callback_data=f"download_{video_id}")
+        await bot.download_callback(update, FakeContext(fb))
+
+    async def viral_callback(fb, i):
+        update = FakeUpdate(fb, CHAT_ID, USER_ID, callback_data=f"viral_{REGIONS[i % len(REGIONS)]}")
+        await bot.viral_callback(update, FakeContext(fb))
+
+    async def viral_hashtag_search(fb, i):
+        hashtag = f"bench{i}"
+        update = FakeUpdate(fb, CHAT_ID, USER_ID, text=f"/viral #{hashtag} BR")
+        await bot.viral_hashtag_search(update, FakeContext(fb, [f"#{hashtag}", 'BR']), hashtag, 'BR')
+
+    async def tendencias(fb, i):
+        await bot.tendencias(FakeUpdate(fb, CHAT_ID, USER_ID, text='/tendencias'), FakeContext(fb))
+
+    async def analisar(fb, i):
+        username = f"@creator{i}"
+        update = FakeUpdate(fb, CHAT_ID, USER_ID, text=f"/analisar {username}")
+        await bot.analisar(update, FakeContext(fb, [username]))
+
+    async def musicas(fb, i):
+        await bot.musicas(FakeUpdate(fb, CHAT_ID, USER_ID, text='/musicas'), FakeContext(fb))
+
+    return {
+        'handle_message': handle_message,
+        'download_callback': download_callback,
+        'viral_callback': viral_callback,
+        'viral_hashtag_search': viral_hashtag_search,
+        'tendencias': tendencias,
+        'analisar': analisar,
+        'musicas': musicas,
+    }
+
+
+def _upstream_bytes(upstream: FakeUpstream) -> int:
+    with upstream._lock:
+        return sum(s['bytes'] for s in upstream.stats.values())
+
+
+async def run(commands: dict, iterations: int, api_latency: float, upstream: FakeUpstream) -> dict:
+    results = {}
+    for name, command in commands.items():
+        seconds, calls, api_bytes, upstream_bytes = [], [], [], []
+        for i in range(iterations):
+            fb = FakeBot(api_latency)
+            before = _upstream_bytes(upstream)
+            started = time.perf_counter()
+            await command(fb, i)
+            seconds.append(time.perf_counter() - started)
+            calls.append(len(fb.calls))
+            api_bytes.append(sum(c.bytes for c in fb.calls))
+            upstream_bytes.append(_upstream_bytes(upstream) - before)
+
+        results[name] = {
+            'p50': percentile(seconds, 50),
+            'p95': percentile(seconds, 95),
+            'p99': percentile(seconds, 99),
+            'api_calls': mean(calls),
+            'api_bytes': mean(api_bytes),
+            'upstream_bytes': mean(upstream_bytes),
+        }
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Human-readable regressions of `results` against `baseline`."""
+    regressions = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for key in ('p50', 'p95', 'p99'):
+            if r[key] > base[key] * (1 + tolerance) and r[key] - base[key] > MIN_REGRESSION_SECONDS:
+                regressions.append(f"{name}: {key} {base[key] * 1000:.0f} -> {r[key] * 1000:.0f} ms")
+        if r['api_calls'] > base['api_calls'] + 0.5:
+            regressions.append(f"{name}: Bot API calls {base['api_calls']:.1f} -> {r['api_calls']:.1f}")
+        for key in ('api_bytes', 'upstream_bytes'):
+            if r[key] > base[key] * (1 + tolerance) and r[key] - base[key] > 1024:
+                regressions.append(f"{name}: {key} {base[key] / 1024:.0f} -> {r[key] / 1024:.0f} KiB")
+    return regressions
+
+
+def print_table(results: dict, baseline: dict):
+    print(f"{'command':<22}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'API calls':>11}{'API KiB':>10}{'upstream KiB':>14}{'Δp95':>8}")
+    for name, r in results.items():
+        base = baseline.get(name)
+        delta = f"{(r['p95'] / base['p95'] - 1) * 100:+.0f}%" if base and base['p95'] else ''
+        print(
+            f"{name:<22}{r['p50'] * 1000:>9.0f}{r['p95'] * 1000:>9.0f}{r['p99'] * 1000:>9.0f}"
+            f"{r['api_calls']:>11.1f}{r['api_bytes'] / 1024:>10.1f}{r['upstream_bytes'] / 1024:>14.1f}{delta:>8}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20, help='requests per command')
+    parser.add_argument('--only', help='comma-separated commands to run')
+    parser.add_argument('--api-latency', type=float, default=0.03, help='simulated seconds per Bot API call')
+    parser.add_argument('--upstream-latency', type=float, default=0.05, help='stand-in upstream latency')
+    parser.add_argument('--tikwm-rate', type=float, default=50, help='tikwm client requests per second per endpoint')
+    parser.add_argument('--video-mb', type=float, default=2.0, help='size of downloaded videos')
+    parser.add_argument('--baseline', help='compare against this saved baseline')
+    parser.add_argument('--save-baseline', help='save the results as a baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown ratio before flagging')
+    parser.add_argument('--verbose', action='store_true', help="keep the bot's INFO logs")
+    args = parser.parse_args()
+
+    upstream = FakeUpstream(faults=Faults(latency=args.upstream_latency), video_size=int(args.video_mb * MB))
+    upstream.start()
+    workdir = tempfile.TemporaryDirectory(prefix='bench-handlers-')
+    cwd = os.getcwd()
+    try:
+        bot = load_bot(workdir.name, upstream, args.tikwm_rate)
+        if not args.verbose:
+            logging.getLogger().setLevel(logging.WARNING)
+
+        commands = scenarios(bot)
+        if args.only:
+            wanted = args.only.split(',')
+            unknown = set(wanted) - set(commands)
+            if unknown:
+                parser.error(f"unknown commands: {', '.join(sorted(unknown))}")
+            commands = {name: commands[name] for name in wanted}
+
+        results = asyncio.run(run(commands, args.iterations, args.api_latency, upstream))
+    finally:
+        os.chdir(cwd)
+        upstream.stop()
+        workdir.cleanup()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['commands']
+
+    print_table(results, baseline)
+
+    if args.save_baseline:
+        meta = {
+            'iterations': args.iterations,
+            'api_latency': args.api_latency,
+            'upstream_latency': args.upstream_latency,
+            'python': platform.python_version(),
+            'saved_at': int(time.time()),
+        }
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'meta': meta, 'commands': results}, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print('\nRegressions:')
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
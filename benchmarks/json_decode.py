@@ -0,0 +1,77 @@
+"""
+CPU time and memory per decoded tikwm feed page, before (plain
+json.loads, what response.json() did) and after (jsondecode with the
+endpoint's projection).
+
+    python -m benchmarks.json_decode [--items 200] [--pages 50]
+"""
+import gc
+import json
+import time
+import argparse
+import tracemalloc
+
+import jsondecode
+from tikwm import PROJECTIONS
+from benchmarks.fixtures import feed_page_bytes
+
+
+def _stdlib(fn):
+    """Runs `fn` with orjson hidden from jsondecode."""
+    def run(body):
+        saved, jsondecode.orjson = jsondecode.orjson, None
+        try:
+            return fn(body)
+        finally:
+            jsondecode.orjson = saved
+    return run
+
+
+def modes(endpoint: str) -> dict:
+    spec, stream = PROJECTIONS[endpoint]
+    result = {
+        'json.loads (before)': json.loads,
+        'stdlib + projection': _stdlib(lambda body: jsondecode.project(json.loads(body), spec)),
+        'stdlib streaming': _stdlib(lambda body: jsondecode.decode(body, spec, stream)),
+    }
+    if jsondecode.orjson is not None:
+        result['orjson + projection'] = lambda body: jsondecode.decode(body, spec, stream)
+    return result
+
+
+def measure(fn, body: bytes, pages: int) -> dict:
+    fn(body)  # warm up
+    gc.collect()
+    started = time.process_time()
+    for _ in range(pages):
+        fn(body)
+    cpu = (time.process_time() - started) / pages
+
+    peak = retained = float('inf')
+    for _ in range(3):
+        gc.collect()
+        tracemalloc.start()
+        result = fn(body)
+        kept, top = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del result
+        peak, retained = min(peak, top), min(retained, kept)
+    return {'cpu_ms': cpu * 1000, 'peak_kib': peak / 1024, 'retained_kib': retained / 1024}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--items', type=int, default=200, help='videos per page')
+    parser.add_argument('--pages', type=int, default=50, help='pages decoded per mode')
+    args = parser.parse_args()
+
+    body = feed_page_bytes(args.items)
+    print(f"Page: {args.items} items, {len(body) / 1024:.0f} KiB; orjson {'installed' if jsondecode.orjson else 'not installed'}")
+    print(f"{'mode':<24}{'CPU ms/page':>14}{'peak KiB':>12}{'kept KiB':>12}")
+    for name, fn in modes('/api/feed/list').items():
+        m = measure(fn, body, args.pages)
+        print(f"{name:<24}{m['cpu_ms']:>14.2f}{m['peak_kib']:>12.0f}{m['retained_kib']:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+"""
+Load test: hundreds of simulated chats sending mixed traffic (links,
+/viral, filter clicks, download taps) through the real PTB Application,
+against a local Bot API (benchmarks.fake_telegram.FakeBotApi) and the
+stand-in upstreams. Throughput, update latency, queue growth, RSS, open
+file descriptors and disk usage are sampled over time.
+
+    python -m benchmarks.load_test [--chats 50,100,200,400] [--stage-seconds 60] [--csv timeline.csv]
+
+Stages ramp up the number of chats to find where the one-VM setup in
+fly.toml (512 MB, 1 shared CPU) breaks: the first stage whose p95 latency
+exceeds --slo or whose RSS exceeds MEMORY_LIMIT_MB is reported. The fake
+servers run in this process, so RSS and fds include them (a few MB).
+"""
+import os
+import csv
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+
+from benchmarks.fake_telegram import FakeBotApi
+from benchmarks.fake_upstream import MB, Faults, FakeUpstream
+from benchmarks.handlers import load_bot, percentile
+
+# Share of each simulated user action
+ACTIONS = {
+    'link': 0.35,
+    'viral_region': 0.15,
+    'viral_hashtag': 0.2,
+    'filter': 0.1,
+    'download': 0.2,
+}
+HASHTAGS = ['dance', 'funny', 'food', 'pet', 'travel', 'receita', 'humor', 'futebol']
+REGIONS = ['BR', 'US', 'JP', 'GB', 'FR', 'GLOBAL']
+SORTS = ['likes', 'views', 'date', 'viral']
+
+# A chat gives up waiting for the bot after this long and moves on
+UPDATE_TIMEOUT = 300
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _open_fds() -> int:
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return -1
+
+
+class LoadTest:
+    """Drives simulated chats into `application` and samples the process."""
+
+    def __init__(self, bot, application, api: FakeBotApi, think: float, seed: int = 0):
+        self.bot = bot
+        self.application = application
+        self.api = api
+        self.think = think
+        self.rng = random.Random(seed)
+        self.update_ids = iter(range(1, 10 ** 9))
+        self.pending = {}  # update_id -> (action, enqueued_at, future)
+        self.latencies = []  # (stage, action, seconds)
+        self.enqueued = 0
+        self.completed = 0
+        self.timed_out = 0
+        self.stage = 0
+        self.samples = []
+        self.durations = []
+
+    async def done(self, update, context):
+        """Runs after the bot's handler for every update (handler group 1)."""
+        entry = self.pending.pop(update.update_id, None)
+        if entry:
+            action, enqueued_at, future = entry
+            self.completed += 1
+            self.latencies.append((self.stage, action, time.monotonic() - enqueued_at))
+            if not future.done():
+                future.set_result(None)
+
+    def _user(self, chat_id: int) -> dict:
+        return {'id': chat_id, 'is_bot': False, 'first_name': f"User {chat_id}"}
+
+    def _message(self, chat_id: int, text: str) -> dict:
+        message = {
+            'message_id': self.rng.randrange(10 ** 9),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': self._user(chat_id),
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return message
+
+    def _next_action(self, chat_id: int, state: dict) -> tuple:
+        """(action, update payload) for the chat's next move."""
+        action = self.rng.choices(list(ACTIONS), weights=list(ACTIONS.values()))[0]
+        buttons = self.api.buttons.get(str(chat_id))
+        if action == 'download' and not buttons:
+            action = 'viral_region'
+        if action == 'filter' and 'hashtag' not in state:
+            action = 'viral_hashtag'
+
+        if action == 'link':
+            if self.rng.random() < 0.8:
+                text = f"https://www.tiktok.com/@load/video/{self.rng.randrange(7 * 10 ** 18, 8 * 10 ** 18)}"
+            else:
+                text = f"https://www.instagram.com/reel/{self.rng.getrandbits(48):x}/"
+            return action, {'message': self._message(chat_id, text)}
+        if action == 'viral_hashtag':
+            state['hashtag'] = self.rng.choice(HASHTAGS)
+            state['region'] = self.rng.choice(REGIONS[:-1])
+            return action, {'message': self._message(chat_id, f"/viral #{state['hashtag']} {state['region']}")}
+
+        if action == 'viral_region':
+            data = f"viral_{self.rng.choice(REGIONS)}"
+        elif action == 'filter':
+            data = f"filter_{state['hashtag']}_{state['region']}_{self.rng.choice(SORTS)}"
+        else:
+            data = self.rng.choice(buttons)
+        return action, {'callback_query': {
+            'id': str(self.rng.randrange(10 ** 12)),
+            'from': self._user(chat_id),
+            'chat_instance': str(chat_id),
+            'data': data,
+            'message': self._message(chat_id, 'resultados'),
+        }}
+
+    async def chat(self, chat_id: int, until: float):
+        """One simulated user: think, act, wait for the bot, repeat."""
+        from telegram import Update
+
+        state = {}
+        while time.monotonic() < until:
+            await asyncio.sleep(min(self.rng.expovariate(1 / self.think), max(0.0, until - time.monotonic())))
+            if time.monotonic() >= until:
+                return
+            action, payload = self._next_action(chat_id, state)
+            update_id = next(self.update_ids)
+            future = asyncio.get_running_loop().create_future()
+            self.pending[update_id] = (action, time.monotonic(), future)
+            self.enqueued += 1
+            await self.application.update_queue.put(Update.de_json({'update_id': update_id, **payload}, self.application.bot))
+            try:
+                await asyncio.wait_for(future, UPDATE_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+
+    def sample(self, started: float, chats: int):
+        from janitor import janitor
+        from memory import current_rss
+
+        admission = self.bot.admission
+        self.samples.append({
+            't': round(time.monotonic() - started, 1),
+            'stage': self.stage,
+            'chats': chats,
+            'enqueued': self.enqueued,
+            'completed': self.completed,
+            'in_progress': len(self.pending),
+            'update_queue': self.application.update_queue.qsize(),
+            'downloads_running': admission.in_flight,
+            'downloads_queued': admission.queue_depth,
+            'rss_mb': round(current_rss() / MB, 1),
+            'fds': _open_fds(),
+            'downloads_mb': round(janitor.usage() / MB, 1),
+            'data_mb': round(_dir_size(os.environ['DATA_DIR']) / MB, 1),
+            'error_replies': sum(self.api.errors.values()),
+        })
+
+    async def run(self, stages: list, stage_seconds: float, interval: float):
+        started = time.monotonic()
+        for self.stage, count in enumerate(stages):
+            stage_started = time.monotonic()
+            until = stage_started + stage_seconds
+            # Chats stop acting at `until`; the stage ends once their last updates are handled
+            chats = [asyncio.create_task(self.chat(10_000 + n, until)) for n in range(count)]
+            while not all(chat.done() for chat in chats):
+                self.sample(started, count)
+                await asyncio.sleep(interval)
+            self.sample(started, count)
+            self.durations.append(time.monotonic() - stage_started)
+
+
+def summarize(test: LoadTest, stages: list, slo: float, memory_limit_mb: float) -> list:
+    rows = []
+    for stage, chats in enumerate(stages):
+        latencies = [s for st, _, s in test.latencies if st == stage]
+        samples = [s for s in test.samples if s['stage'] == stage]
+        by_action = {}
+        for st, action, seconds in test.latencies:
+            if st == stage:
+                by_action.setdefault(action, []).append(seconds)
+        p95 = percentile(latencies, 95) if latencies else float('inf')
+        peak_rss = max(s['rss_mb'] for s in samples)
+        rows.append({
+            'stage': stage,
+            'chats': chats,
+            'throughput': len(latencies) / test.durations[stage],
+            'p50': percentile(latencies, 50) if latencies else float('inf'),
+            'p95': p95,
+            'actions_p95': {a: percentile(v, 95) for a, v in sorted(by_action.items())},
+            'peak_in_progress': max(s['in_progress'] for s in samples),
+            'peak_rss_mb': peak_rss,
+            'peak_fds': max(s['fds'] for s in samples),
+            'peak_downloads_mb': max(s['downloads_mb'] for s in samples),
+            'broken': p95 > slo or peak_rss > memory_limit_mb,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--chats', default='50,100,200', help='comma-separated concurrent chats per stage')
+    parser.add_argument('--stage-seconds', type=float, default=60)
+    parser.add_argument('--think', type=float, default=5.0, help='mean seconds a user waits between actions')
+    parser.add_argument('--interval', type=float, default=1.0, help='seconds between samples')
+    parser.add_argument('--slo', type=float, default=30.0, help='p95 update latency (s) a stage must stay under')
+    parser.add_argument('--api-latency', type=float, default=0.05, help='fake Bot API seconds per call')
+    parser.add_argument('--upstream-latency', type=float, default=0.2, help='stand-in upstream latency')
+    parser.add_argument('--bandwidth', type=float, default=5 * MB, help='fake CDN bytes per second per download')
+    parser.add_argument('--video-mb', type=float, default=4.0)
+    parser.add_argument('--tikwm-rate', type=float, default=1, help='tikwm client requests per second per endpoint')
+    parser.add_argument('--csv', help='write the timeline here')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbose', action='store_true', help="keep the bot's INFO logs")
+    args = parser.parse_args()
+    stages = [int(n) for n in args.chats.split(',')]
+
+    upstream = FakeUpstream(faults=Faults(latency=args.upstream_latency, bandwidth=args.bandwidth),
+                            video_size=int(args.video_mb * MB), seed=args.seed)
+    upstream.start()
+    api = FakeBotApi(latency=args.api_latency)
+    api.start()
+    workdir = tempfile.TemporaryDirectory(prefix='bench-load-')
+    cwd = os.getcwd()
+    try:
+        bot = load_bot(workdir.name, upstream, args.tikwm_rate)
+        if not args.verbose:
+            logging.getLogger().setLevel(logging.WARNING)
+        bot.start_background_services()
+
+        async def run():
+            from telegram import Update
+            from telegram.ext import TypeHandler
+
+            application = bot.build_application('123456:benchmark', base_url=api.base_url)
+            test = LoadTest(bot, application, api, args.think, args.seed)
+            application.add_handler(TypeHandler(Update, test.done), group=1)
+            async with application:
+                await application.start()
+                try:
+                    await test.run(stages, args.stage_seconds, args.interval)
+                finally:
+                    await application.stop()
+            return test
+
+        test = asyncio.run(run())
+    finally:
+        os.chdir(cwd)
+        api.stop()
+        upstream.stop()
+        workdir.cleanup()
+
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(test.samples[0]))
+            writer.writeheader()
+            writer.writerows(test.samples)
+
+    memory_limit_mb = float(os.getenv('MEMORY_LIMIT_MB', 512))
+    rows = summarize(test, stages, args.slo, memory_limit_mb)
+    print(f"{'chats':>6}{'upd/s':>8}{'p50 s':>8}{'p95 s':>8}{'in prog':>9}{'RSS MB':>8}{'fds':>6}{'disk MB':>9}  status")
+    for r in rows:
+        print(
+            f"{r['chats']:>6}{r['throughput']:>8.2f}{r['p50']:>8.2f}{r['p95']:>8.2f}{r['peak_in_progress']:>9}"
+            f"{r['peak_rss_mb']:>8.0f}{r['peak_fds']:>6}{r['peak_downloads_mb']:>9.0f}  {'BROKEN' if r['broken'] else 'ok'}"
+        )
+        print('       p95 by action: ' + ', '.join(f"{a} {s:.1f}s" for a, s in r['actions_p95'].items()))
+
+    print(f"\nUpdates: {test.enqueued} sent, {test.completed} handled, {test.timed_out} timed out; "
+          f"error replies: {sum(api.errors.values())}")
+    for text, count in sorted(api.errors.items(), key=lambda e: -e[1]):
+        print(f"  {count:>5}  {text}")
+    print('Bot API calls: ' + ', '.join(f"{m} {s['calls']}" for m, s in sorted(api.stats.items())))
+    print('Upstream: ' + ', '.join(f"{name} {s['requests']} req/{s['bytes'] / MB:.0f} MB" for name, s in sorted(upstream.stats.items())))
+    broken = next((r for r in rows if r['broken']), None)
+    if broken:
+        print(f"Breaking point: {broken['chats']} concurrent chats")
+    else:
+        print(f"No stage broke the SLO (p95 < {args.slo:.0f}s, RSS < {memory_limit_mb:.0f} MB)")
+
+
+if __name__ == '__main__':
+    main()
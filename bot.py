@@ -1,16 +1,34 @@
 import os
+import time
+import hashlib
+import tempfile
 import logging
 import asyncio
+from typing import Optional
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
 from telegram.constants import ChatAction
 from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, MessageHandler, CallbackQueryHandler, filters
-from telegram.error import TelegramError
-from downloader import download_video, DownloadError, download_instagram_alternative, download_tiktok_alternative, get_tiktok_trending
+from telegram.error import TelegramError, BadRequest
+from telegram.helpers import escape_markdown
 
-# Load environment variables
+# Load environment variables (before our modules read their settings)
 load_dotenv()
 
+from downloader import download_with_fallbacks, DownloadError, ContentUnavailableError, download_tiktok_alternative, get_tiktok_trending, download_audio, extract_audio
+from admission import AdmissionController, AdmissionError
+from progress import ChatEditThrottle, ProgressReporter, format_bytes
+from metrics import metrics
+from memory import governor, shed_oldest, current_rss
+from janitor import janitor
+from sounds import sound_pipeline
+from hashtag_index import hashtag_index
+from timeseries import timeseries
+from providers import provider_health
+from cache import caches
+from media_cache import RecentMediaCache
+from profiling import profiler, ProfilerBusy
+
 # Configure logging
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -20,8 +38,165 @@ logger = logging.getLogger(__name__)
 
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 
+# Display names of the feed regions, shared by every /viral screen
+REGION_NAMES = {
+    'GLOBAL': 'Mundial',
+    'US': 'EUA',
+    'BR': 'Brasil',
+    'JP': 'Japão',
+    'GB': 'Reino Unido',
+    'FR': 'França'
+}
+
 # Store video URLs temporarily for download callbacks
 video_cache = {}
+governor.register_cache('video_cache', lambda: shed_oldest(video_cache), on_loop=True)
+
+# Recently sent videos, reused by the "audio only" button
+media_cache = RecentMediaCache()
+governor.register_cache('media_cache', media_cache.shed)
+
+# Global limit on concurrent/queued downloads (the VM only has 512 MB)
+admission = AdmissionController(
+    max_in_flight=int(os.getenv("MAX_CONCURRENT_DOWNLOADS", 2)),
+    max_queue=int(os.getenv("MAX_QUEUE_LENGTH", 20)),
+    per_user=int(os.getenv("MAX_DOWNLOADS_PER_USER", 2)),
+)
+
+# PTB handles one update at a time by default. Admission has to be the bound on
+# downloads, so allow all of its slots plus room for commands and button taps
+CONCURRENT_UPDATES = admission.max_in_flight + admission.max_queue + 32
+
+# Telegram user ids allowed to use the admin commands
+ADMIN_USER_IDS = {int(i) for i in os.getenv("ADMIN_USER_IDS", "").replace(' ', '').split(',') if i}
+
+# On-demand profiling (/debug and /debug/* on the web server), off unless enabled
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "").lower() in ('1', 'true', 'yes')
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+
+
+def is_admin(update: Update) -> bool:
+    return bool(update.effective_user) and update.effective_user.id in ADMIN_USER_IDS
+
+
+def queue_position_updater(status_msg):
+    """Returns a callback that shows the live queue position in `status_msg`."""
+    async def update(position: int):
+        await status_msg.edit_text(
+            f"🕒 Você está na fila: posição {position}\n\n"
+            f"Seu download começa assim que houver uma vaga."
+        )
+    return update
+
+
+# At most one progress edit every 2 s per chat to save Bot API quota
+progress_throttle = ChatEditThrottle(min_interval=2.0)
+
+
+async def upload_media(message, status_msg, media, caption: str, kind: str = 'video', reply_markup=None):
+    """
+    Uploads a downloaded video (or audio, with kind='audio') as a reply to
+    `message`, recording upload metrics. `media` is a path or an open spool
+    file (see downloader spool mode).
+    """
+    if isinstance(media, str):
+        with open(media, 'rb') as media_file:
+            return await upload_media(message, status_msg, media_file, caption, kind, reply_markup)
+    
+    file_size = media.seek(0, os.SEEK_END)
+    media.seek(0)
+    
+    # Spools still in memory (downloader spool mode, up to SPOOL_MAX_MB) have
+    # `.name == None`, and PTB fails on it while guessing a filename even when
+    # one is passed. PTB reads the whole file into memory anyway, so hand it the bytes
+    if getattr(media, 'name', None) is None:
+        media = media.read()
+    
+    started = time.monotonic()
+    if kind == 'audio':
+        await status_msg.edit_text(f"📤 Enviando áudio... ({format_bytes(file_size)})")
+        await message.reply_audio(
+            audio=media,
+            filename="audio.m4a",
+            caption=caption,
+            reply_markup=reply_markup,
+            write_timeout=60,
+            read_timeout=60
+        )
+    else:
+        await status_msg.edit_text(f"📤 Enviando vídeo... ({format_bytes(file_size)})")
+        await message.reply_video(
+            video=media,
+            filename="video.mp4",
+            caption=caption,
+            reply_markup=reply_markup,
+            write_timeout=60,
+            read_timeout=60
+        )
+    
+    metrics.observe('upload_seconds', time.monotonic() - started)
+    metrics.incr('upload_bytes', file_size)
+
+
+def discard_media(media):
+    """Frees a downloaded file: closes a spool file or removes a path."""
+    if media is None:
+        return
+    try:
+        if isinstance(media, str):
+            if os.path.exists(media):
+                os.remove(media)
+                logger.info(f"Cleaned up file: {media}")
+        else:
+            media.close()
+    except Exception as e:
+        logger.warning(f"Failed to cleanup {media}: {e}")
+
+
+def media_key(url: str) -> str:
+    """Short id for `url` that fits in callback_data."""
+    return hashlib.sha1(url.encode()).hexdigest()[:16]
+
+
+def audio_keyboard(video_id: str):
+    """Keyboard with the "audio only" button for a cached video id."""
+    return InlineKeyboardMarkup([[InlineKeyboardButton("🎵 Baixar Áudio", callback_data=f"audio_{video_id}")]])
+
+
+def fetch_audio(video_url: str, progress_callback=None):
+    """
+    Gets the audio of `video_url` as an open file. Reuses the recently sent
+    video when it's still cached; otherwise downloads audio only, falling
+    back to the alternative TikTok download + ffmpeg extraction.
+    Runs in an executor.
+    """
+    with tempfile.NamedTemporaryFile(dir="downloads", suffix=".mp4") as cached_video:
+        if media_cache.copy_to(video_url, cached_video):
+            cached_video.flush()
+            logger.info(f"Extracting audio from cached video for {video_url}")
+            return extract_audio(cached_video.name, spool=True)
+    
+    if "tiktok.com" not in video_url:
+        return provider_health.call('yt-dlp-audio:instagram', download_audio, video_url, progress_callback, spool=True)
+    
+    try:
+        # Skip yt-dlp while its TikTok audio circuit is open. Audio has its own
+        # circuits: ffmpeg/post-processing failures say nothing about video downloads
+        if provider_health.is_open('yt-dlp-audio:tiktok'):
+            raise DownloadError("yt-dlp indisponível para TikTok no momento.")
+        return provider_health.call('yt-dlp-audio:tiktok', download_audio, video_url, progress_callback, spool=True)
+    except ContentUnavailableError:
+        raise
+    except DownloadError as e:
+        try:
+            video_path = download_tiktok_alternative(video_url, progress_callback)
+        except Exception:
+            raise e
+        try:
+            return extract_audio(video_path, spool=True)
+        finally:
+            discard_media(video_path)
+
 
 def get_main_menu_keyboard():
     """Creates the main menu keyboard."""
@@ -92,7 +267,7 @@ async def viral(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # No arguments - show region selection (original behavior)
     keyboard = [
         [
-            InlineKeyboardButton("🌎 Mundial", callback_data="viral_US"),
+            InlineKeyboardButton("🌎 Mundial", callback_data="viral_GLOBAL"),
             InlineKeyboardButton("🇧🇷 Brasil", callback_data="viral_BR"),
         ],
         [
@@ -133,15 +308,7 @@ async def viral_hashtag_search(update: Update, context: ContextTypes.DEFAULT_TYP
     """Searches and displays TikTok videos by hashtag."""
     from downloader import search_tiktok_by_hashtag
     
-    region_names = {
-        'US': 'Mundial',
-        'BR': 'Brasil',
-        'JP': 'Japão',
-        'GB': 'Reino Unido',
-        'FR': 'França'
-    }
-    
-    region_name = region_names.get(region, region)
+    region_name = REGION_NAMES.get(region, region)
     
     # Send initial message
     status_msg = await update.message.reply_text(
@@ -170,7 +337,8 @@ async def viral_hashtag_search(update: Update, context: ContextTypes.DEFAULT_TYP
         sort_emoji = {
             'likes': '❤️',
             'views': '👁️',
-            'date': '🆕'
+            'date': '🆕',
+            'viral': '🚀'
         }
         current_emoji = sort_emoji.get(sort_by, '❤️')
         
@@ -188,6 +356,12 @@ async def viral_hashtag_search(update: Update, context: ContextTypes.DEFAULT_TYP
                     f"{'✅ ' if sort_by == 'date' else ''}🆕 Recentes",
                     callback_data=f"filter_{hashtag}_{region}_date"
                 ),
+            ],
+            [
+                InlineKeyboardButton(
+                    f"{'✅ ' if sort_by == 'viral' else ''}🚀 Viralizando agora",
+                    callback_data=f"filter_{hashtag}_{region}_viral"
+                ),
             ]
         ]
         filter_markup = InlineKeyboardMarkup(filter_keyboard)
@@ -211,22 +385,22 @@ async def viral_hashtag_search(update: Update, context: ContextTypes.DEFAULT_TYP
         for i, v in enumerate(videos, 1):
             try:
                 # Store video URL in cache for download callback
-                video_id = v['url'].split('/')[-1]
-                video_cache[video_id] = v['url']
+                video_id = v.video_id
+                video_cache[video_id] = v.url
                 
                 # Format stats
-                likes = format_number(v['digg_count'])
-                views = format_number(v['play_count'])
+                likes = format_number(v.digg_count)
+                views = format_number(v.play_count)
                 
                 # Create caption
-                title = v['title'][:100] + "..." if len(v['title']) > 100 else v['title']
+                title = v.caption
                 caption = (
                     f"🔥 *Vídeo #{i}* - #{hashtag}\n\n"
                     f"📝 {title}\n\n"
-                    f"👤 {v['author']}\n"
+                    f"👤 {v.author}\n"
                     f"❤️ {likes} curtidas\n"
                     f"👁️ {views} visualizações\n\n"
-                    f"🔗 [Ver no TikTok]({v['url']})"
+                    f"🔗 [Ver no TikTok]({v.url})"
                 )
                 
                 # Create download button
@@ -234,11 +408,11 @@ async def viral_hashtag_search(update: Update, context: ContextTypes.DEFAULT_TYP
                 reply_markup = InlineKeyboardMarkup(keyboard)
                 
                 # Send photo with caption and button
-                if v.get('cover'):
+                if v.cover:
                     try:
                         await context.bot.send_photo(
                             chat_id=update.effective_chat.id,
-                            photo=v['cover'],
+                            photo=v.cover,
                             caption=caption,
                             parse_mode='Markdown',
                             reply_markup=reply_markup
@@ -286,15 +460,7 @@ async def viral_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     region = query.data.replace("viral_", "")
     
-    region_names = {
-        'US': 'Mundial',
-        'BR': 'Brasil',
-        'JP': 'Japão',
-        'GB': 'Reino Unido',
-        'FR': 'França'
-    }
-    
-    region_name = region_names.get(region, region)
+    region_name = REGION_NAMES.get(region, region)
     
     await query.edit_message_text(f"🔥 Buscando vídeos virais ({region_name})... aguarde!")
     
@@ -321,22 +487,22 @@ async def viral_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         for i, v in enumerate(videos, 1):
             try:
                 # Store video URL in cache for download callback
-                video_id = v['url'].split('/')[-1]
-                video_cache[video_id] = v['url']
+                video_id = v.video_id
+                video_cache[video_id] = v.url
                 
                 # Format stats
-                likes = format_number(v['digg_count'])
-                views = format_number(v['play_count'])
+                likes = format_number(v.digg_count)
+                views = format_number(v.play_count)
                 
                 # Create caption
-                title = v['title'][:100] + "..." if len(v['title']) > 100 else v['title']
+                title = v.caption
                 caption = (
                     f"🔥 *Vídeo #{i}*\n\n"
                     f"📝 {title}\n\n"
-                    f"👤 {v['author']}\n"
+                    f"👤 {v.author}\n"
                     f"❤️ {likes} curtidas\n"
                     f"👁️ {views} visualizações\n\n"
-                    f"🔗 [Ver no TikTok]({v['url']})"
+                    f"🔗 [Ver no TikTok]({v.url})"
                 )
                 
                 # Create download button
@@ -344,11 +510,11 @@ async def viral_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 reply_markup = InlineKeyboardMarkup(keyboard)
                 
                 # Send photo with caption and button
-                if v.get('cover'):
+                if v.cover:
                     try:
                         await context.bot.send_photo(
                             chat_id=query.message.chat_id,
-                            photo=v['cover'],
+                            photo=v.cover,
                             caption=caption,
                             parse_mode='Markdown',
                             reply_markup=reply_markup
@@ -388,69 +554,87 @@ async def viral_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text("❌ Ocorreu um erro ao buscar os vídeos.")
 
 async def download_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handles download button clicks."""
+    """Handles download button clicks (download_<id> for video, audio_<id> for audio only)."""
     query = update.callback_query
     await query.answer("📥 Iniciando download...")
     
-    video_id = query.data.replace("download_", "")
+    mode, video_id = query.data.split("_", 1)
     video_url = video_cache.get(video_id)
+    metrics.incr('video_cache_hits' if video_url else 'video_cache_misses')
     
     if not video_url:
         await query.answer("❌ Link expirado. Use /viral novamente.", show_alert=True)
         return
     
-    status_msg = await query.message.reply_text("⏳ Baixando vídeo... aguarde!")
+    label = "⏳ Baixando áudio... aguarde!" if mode == "audio" else "⏳ Baixando vídeo... aguarde!"
+    status_msg = await query.message.reply_text(label)
+    
+    user_id = update.effective_user.id
+    try:
+        queued = await admission.acquire(user_id, queue_position_updater(status_msg))
+    except AdmissionError as e:
+        await status_msg.edit_text(str(e))
+        return
+    
+    reporter = ProgressReporter(status_msg, progress_throttle, label)
+    video = None
     
     try:
+        if queued:
+            await status_msg.edit_text(label)
+        
+        loop = asyncio.get_running_loop()
+        
+        if mode == "audio":
+            await context.bot.send_chat_action(chat_id=query.message.chat_id, action=ChatAction.UPLOAD_VOICE)
+            
+            started = time.monotonic()
+            video = await loop.run_in_executor(None, fetch_audio, video_url, reporter.callback)
+            reporter.close()
+            metrics.observe('download_seconds', time.monotonic() - started)
+            
+            await upload_media(query.message, status_msg, video, "✅ Áudio extraído! 🎵", kind='audio')
+            await status_msg.delete()
+            return
+        
         # Send typing action
         await context.bot.send_chat_action(chat_id=query.message.chat_id, action=ChatAction.UPLOAD_VIDEO)
         
         # Download video
-        loop = asyncio.get_running_loop()
+        started = time.monotonic()
         
-        try:
-            file_path = await loop.run_in_executor(None, download_video, video_url)
-        except DownloadError as e:
-            # Try alternative method for TikTok
-            if "tiktok.com" in video_url:
-                await status_msg.edit_text("⏳ Tentando método alternativo...")
-                try:
-                    file_path = await loop.run_in_executor(None, download_tiktok_alternative, video_url)
-                except Exception:
-                    raise e
-            else:
-                raise e
+        on_fallback = lambda name: reporter.set_label("⏳ Tentando método alternativo...")
+        video = await loop.run_in_executor(None, download_with_fallbacks, video_url, reporter.callback, True, on_fallback)
         
-        if not os.path.exists(file_path):
-            await status_msg.edit_text("❌ Erro: Arquivo não encontrado.")
-            return
+        reporter.close()
+        metrics.observe('download_seconds', time.monotonic() - started)
         
         # Send video
-        await status_msg.edit_text("📤 Enviando vídeo...")
-        
-        with open(file_path, 'rb') as video_file:
-            await query.message.reply_video(
-                video=video_file,
-                caption="✅ Download concluído! 🎥",
-                write_timeout=60,
-                read_timeout=60
-            )
+        await upload_media(
+            query.message, status_msg, video, "✅ Download concluído! 🎥",
+            reply_markup=audio_keyboard(video_id)
+        )
         
         await status_msg.delete()
         
+        # Keep it around briefly so the audio button doesn't download it again
+        if media_cache.put(video_url, video):
+            video = None
+        
     except DownloadError as e:
+        reporter.close()
+        metrics.incr('download_errors')
         logger.error(f"Download error: {e}")
         await status_msg.edit_text(f"❌ Erro no download:\n\n{str(e)}")
     except Exception as e:
+        reporter.close()
         logger.error(f"Unexpected error in download: {e}")
         await status_msg.edit_text("❌ Erro inesperado ao baixar o vídeo.")
     finally:
+        admission.release(user_id)
+        
         # Cleanup
-        if 'file_path' in locals() and os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except Exception as e:
-                logger.warning(f"Failed to cleanup: {e}")
+        discard_media(video)
 
 
 async def viral_filter_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -472,15 +656,7 @@ async def viral_filter_callback(update: Update, context: ContextTypes.DEFAULT_TY
     
     from downloader import search_tiktok_by_hashtag
     
-    region_names = {
-        'US': 'Mundial',
-        'BR': 'Brasil',
-        'JP': 'Japão',
-        'GB': 'Reino Unido',
-        'FR': 'França'
-    }
-    
-    region_name = region_names.get(region, region)
+    region_name = REGION_NAMES.get(region, region)
     
     await query.edit_message_text(
         f"🔍 Reordenando vídeos de *#{hashtag}* ({region_name})...\n\n"
@@ -515,6 +691,12 @@ async def viral_filter_callback(update: Update, context: ContextTypes.DEFAULT_TY
                     f"{'✅ ' if sort_by == 'date' else ''}🆕 Recentes",
                     callback_data=f"filter_{hashtag}_{region}_date"
                 ),
+            ],
+            [
+                InlineKeyboardButton(
+                    f"{'✅ ' if sort_by == 'viral' else ''}🚀 Viralizando agora",
+                    callback_data=f"filter_{hashtag}_{region}_viral"
+                ),
             ]
         ]
         filter_markup = InlineKeyboardMarkup(filter_keyboard)
@@ -522,7 +704,8 @@ async def viral_filter_callback(update: Update, context: ContextTypes.DEFAULT_TY
         sort_emoji = {
             'likes': '❤️',
             'views': '👁️',
-            'date': '🆕'
+            'date': '🆕',
+            'viral': '🚀'
         }
         current_emoji = sort_emoji.get(sort_by, '❤️')
         
@@ -544,30 +727,30 @@ async def viral_filter_callback(update: Update, context: ContextTypes.DEFAULT_TY
         # Send each video
         for i, v in enumerate(videos, 1):
             try:
-                video_id = v['url'].split('/')[-1]
-                video_cache[video_id] = v['url']
+                video_id = v.video_id
+                video_cache[video_id] = v.url
                 
-                likes = format_number(v['digg_count'])
-                views = format_number(v['play_count'])
+                likes = format_number(v.digg_count)
+                views = format_number(v.play_count)
                 
-                title = v['title'][:100] + "..." if len(v['title']) > 100 else v['title']
+                title = v.caption
                 caption = (
                     f"🔥 *Vídeo #{i}* - #{hashtag}\n\n"
                     f"📝 {title}\n\n"
-                    f"👤 {v['author']}\n"
+                    f"👤 {v.author}\n"
                     f"❤️ {likes} curtidas\n"
                     f"👁️ {views} visualizações\n\n"
-                    f"🔗 [Ver no TikTok]({v['url']})"
+                    f"🔗 [Ver no TikTok]({v.url})"
                 )
                 
                 keyboard = [[InlineKeyboardButton("📥 Baixar Vídeo", callback_data=f"download_{video_id}")]]
                 reply_markup = InlineKeyboardMarkup(keyboard)
                 
-                if v.get('cover'):
+                if v.cover:
                     try:
                         await context.bot.send_photo(
                             chat_id=query.message.chat_id,
-                            photo=v['cover'],
+                            photo=v.cover,
                             caption=caption,
                             parse_mode='Markdown',
                             reply_markup=reply_markup
@@ -661,9 +844,17 @@ async def tendencias(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
             top_video_link = f"[📹 Ver Exemplo]({topic.get('top_video', '')})" if topic.get('top_video') else ""
             
+            if topic.get('new'):
+                growth_line = "   🆕 Novo nas últimas horas\n"
+            elif topic.get('growth') is not None:
+                growth_line = f"   🚀 Crescimento: {topic['growth']:+.1f}/h\n"
+            else:
+                growth_line = ""
+            
             message += (
                 f"{i}. #{topic['name']}\n"
                 f"   📊 {topic['count']} vídeos\n"
+                f"{growth_line}"
                 f"   {comp_emoji} Competição: {topic['competition']}\n"
                 f"   👁️ Média: {format_number(topic['avg_views'])} views\n"
                 f"   {top_video_link}\n\n"
@@ -708,22 +899,30 @@ async def analisar(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(
             "❌ *Uso incorreto!*\n\n"
             "Use: `/analisar @username`\n\n"
-            "Exemplo: `/analisar @whinderssonnunes`",
+            "Exemplo: `/analisar @whinderssonnunes`\n\n"
+            "🔬 Análise profunda: `/analisar @username deep [200] [30d]`",
             parse_mode='Markdown'
         )
         return
     
     username = context.args[0]
     
+    if len(context.args) > 1 and context.args[1].lower() in ('deep', 'profundo'):
+        await analisar_profundo(update, context, username, context.args[2:])
+        return
+    
     status_msg = await update.message.reply_text(
         f"📊 Analisando @{username.lstrip('@')}...\n\nAguarde! ⏳",
         parse_mode='Markdown'
     )
     
     try:
-        # Fetch creator info
+        # Fetch creator info and recent videos concurrently
         loop = asyncio.get_running_loop()
-        creator_info = await loop.run_in_executor(None, get_creator_info, username)
+        creator_info, videos = await asyncio.gather(
+            loop.run_in_executor(None, get_creator_info, username),
+            loop.run_in_executor(None, get_creator_videos, username, 5),
+        )
         
         if not creator_info:
             await status_msg.edit_text(
@@ -736,9 +935,6 @@ async def analisar(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
         
-        # Fetch recent videos
-        videos = await loop.run_in_executor(None, get_creator_videos, username, 5)
-        
         # Helper function to format numbers
         def format_number(num):
             if num >= 1000000:
@@ -772,17 +968,17 @@ async def analisar(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if videos:
             message += f"\n🎬 *Top {len(videos)} Vídeos Recentes:*\n\n"
             for i, v in enumerate(videos[:3], 1):
-                title = v['title'][:50] + "..." if len(v['title']) > 50 else v['title']
+                title = v.title[:50] + "..." if len(v.title) > 50 else v.title
                 message += (
                     f"{i}. {title}\n"
-                    f"   👁️ {format_number(v['play_count'])} views\n"
-                    f"   ❤️ {format_number(v['digg_count'])} curtidas\n"
-                    f"   💬 {format_number(v['comment_count'])} comentários\n\n"
+                    f"   👁️ {format_number(v.play_count)} views\n"
+                    f"   ❤️ {format_number(v.digg_count)} curtidas\n"
+                    f"   💬 {format_number(v.comment_count)} comentários\n\n"
                 )
         
-        # Analyze content
-        from downloader import analyze_creator_content
-        analysis = analyze_creator_content(videos)
+        # Analyze content (memoized per creator + latest video)
+        from downloader import get_creator_analysis
+        analysis = get_creator_analysis(username, videos)
         
         message += (
             f"\n💡 *Inteligência Artificial (Análise):*\n"
@@ -820,28 +1016,28 @@ async def analisar(update: Update, context: ContextTypes.DEFAULT_TYPE):
             for i, v in enumerate(videos[:3], 1):
                 try:
                     # Store video URL in cache
-                    video_id = v['url'].split('/')[-1]
-                    video_cache[video_id] = v['url']
+                    video_id = v.video_id
+                    video_cache[video_id] = v.url
                     
                     # Create download button
                     keyboard = [[InlineKeyboardButton("📥 Baixar Vídeo", callback_data=f"download_{video_id}")]]
                     reply_markup = InlineKeyboardMarkup(keyboard)
                     
-                    title = v['title'][:100] + "..." if len(v['title']) > 100 else v['title']
+                    title = v.caption
                     caption = (
                         f"🔥 *Top #{i}*\n\n"
                         f"📝 {title}\n\n"
-                        f"👁️ {format_number(v['play_count'])} views\n"
-                        f"❤️ {format_number(v['digg_count'])} curtidas\n"
-                        f"💬 {format_number(v['comment_count'])} comentários\n\n"
-                        f"🔗 [Ver no TikTok]({v['url']})"
+                        f"👁️ {format_number(v.play_count)} views\n"
+                        f"❤️ {format_number(v.digg_count)} curtidas\n"
+                        f"💬 {format_number(v.comment_count)} comentários\n\n"
+                        f"🔗 [Ver no TikTok]({v.url})"
                     )
                     
-                    if v.get('cover'):
+                    if v.cover:
                         try:
                             await context.bot.send_photo(
                                 chat_id=update.effective_chat.id,
-                                photo=v['cover'],
+                                photo=v.cover,
                                 caption=caption,
                                 parse_mode='Markdown',
                                 reply_markup=reply_markup
@@ -870,6 +1066,117 @@ async def analisar(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 
+def format_deep_analysis(username: str, acc, done: bool) -> str:
+    """Builds the (partial or final) deep analysis message."""
+    def format_number(num):
+        if num >= 1000000:
+            return f"{num/1000000:.1f}M"
+        elif num >= 1000:
+            return f"{num/1000:.1f}K"
+        return str(num)
+    
+    analysis = acc.result()
+    message = f"🔬 *Análise profunda de @{username}*\n\n"
+    
+    if not analysis:
+        return message + "⏳ Carregando vídeos..."
+    
+    message += f"🎬 *Vídeos analisados:* {analysis['video_count']}\n"
+    if acc.oldest_time:
+        from datetime import datetime
+        message += f"📆 *Desde:* {datetime.fromtimestamp(acc.oldest_time).strftime('%d/%m/%Y')}\n"
+    
+    message += (
+        f"\n📈 *Médias por vídeo:*\n"
+        f"• 👁️ {format_number(analysis['avg_views'])} views\n"
+        f"• ❤️ {format_number(analysis['avg_likes'])} curtidas\n"
+        f"• 💬 {format_number(analysis['avg_comments'])} comentários\n\n"
+        f"💡 *Padrões:*\n"
+        f"🕒 *Melhor Horário:* {analysis['best_time']}\n"
+        f"📅 *Melhor Dia:* {analysis['best_day']}\n"
+        f"⏱️ *Duração Ideal:* {analysis['avg_duration']}s\n"
+    )
+    
+    if analysis['top_hashtags']:
+        message += f"🏷️ *Top Hashtags:* {' '.join(escape_markdown(tag) for tag in analysis['top_hashtags'][:5])}\n"
+    
+    top = acc.top_videos()
+    if top:
+        message += "\n🏆 *Melhores vídeos:*\n"
+        for i, v in enumerate(top, 1):
+            title = v.title[:40] + "..." if len(v.title) > 40 else v.title
+            # Link text is literal in Markdown except for the ']' that closes it
+            title = title.replace('[', '(').replace(']', ')')
+            message += f"{i}. [{title or 'Vídeo'}]({v.url}) - ❤️ {format_number(v.digg_count)}\n"
+    
+    if not done:
+        message += "\n⏳ Carregando mais vídeos..."
+    
+    return message
+
+
+async def analisar_profundo(update: Update, context: ContextTypes.DEFAULT_TYPE, username: str, options: list):
+    """
+    Deep creator analysis: pages through the creator's history and updates
+    the message with partial results while later pages load.
+    
+    Options: a number of videos (default 200, max 1000) and/or a window like `30d`.
+    """
+    from downloader import iter_creator_video_pages, CreatorStatsAccumulator
+    
+    username = username.strip().lstrip('@')
+    max_videos = 200
+    since_days = None
+    for option in options:
+        option = option.lower()
+        if option.isdigit():
+            max_videos = max(10, min(int(option), 1000))
+        elif option.endswith('d') and option[:-1].isdigit():
+            since_days = int(option[:-1])
+    
+    status_msg = await update.message.reply_text(
+        f"🔬 Análise profunda de @{username}...\n\nAguarde! ⏳"
+    )
+    
+    acc = CreatorStatsAccumulator()
+    pages = iter_creator_video_pages(username, max_videos, since_days)
+    loop = asyncio.get_running_loop()
+    
+    try:
+        while True:
+            # Fetch the next page in the executor; aggregate it here and drop it
+            page = await loop.run_in_executor(None, next, pages, None)
+            if page is None:
+                break
+            acc.add_page(page, username)
+            progress_throttle.submit(status_msg, format_deep_analysis(username, acc, done=False), parse_mode='Markdown')
+        
+        progress_throttle.cancel(status_msg)
+        
+        if not acc.count:
+            await status_msg.edit_text(
+                f"❌ Não foi possível carregar os vídeos de @{username}\n\n"
+                f"💡 Verifique se o perfil existe e é público."
+            )
+            return
+        
+        result = format_deep_analysis(username, acc, done=True)
+        try:
+            await status_msg.edit_text(result, parse_mode='Markdown', disable_web_page_preview=True)
+        except BadRequest as e:
+            # Some title still broke the Markdown: better unformatted than lost
+            logger.warning(f"Deep analysis of @{username} rejected as Markdown, sending plain: {e}")
+            await status_msg.edit_text(result, disable_web_page_preview=True)
+        
+    except Exception as e:
+        progress_throttle.cancel(status_msg)
+        logger.error(f"Error in analisar_profundo: {e}")
+        await status_msg.edit_text(
+            "❌ Ocorreu um erro na análise profunda.\n\n"
+            "Tente novamente mais tarde."
+        )
+
+
 async def musicas(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Shows trending sounds/music on TikTok."""
     from downloader import get_trending_sounds
@@ -905,6 +1212,9 @@ async def musicas(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Build message
         message = "🎵 *Trending Sounds no TikTok*\n\n"
         
+        # Download/normalize uncached sounds in parallel while we send the cached ones
+        sound_pipeline.prefetch(sounds[:5])
+        
         for i, sound in enumerate(sounds[:5], 1):
             # Truncate title if too long
             title = sound['title'][:40] + "..." if len(sound['title']) > 40 else sound['title']
@@ -918,22 +1228,18 @@ async def musicas(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 f"   🔗 [Ver no TikTok]({sound.get('url', '')})"
             )
             
-            # Try to send audio
-            sent_audio = False
-            if sound.get('url'):
-                try:
-                    await context.bot.send_audio(
-                        chat_id=update.effective_chat.id,
-                        audio=sound['url'],
-                        title=title,
-                        performer=author,
-                        caption=caption,
-                        parse_mode='Markdown'
-                    )
-                    sent_audio = True
-                    await asyncio.sleep(0.5) # Avoid rate limits
-                except Exception:
-                    pass
+            # Try to send audio (cached file_id, or downloaded and uploaded once)
+            sent_audio = await sound_pipeline.send(
+                context.bot,
+                update.effective_chat.id,
+                sound,
+                title=title,
+                performer=author,
+                caption=caption,
+                parse_mode='Markdown'
+            )
+            if sent_audio:
+                await asyncio.sleep(0.5) # Avoid rate limits
             
             if not sent_audio:
                 message += f"{caption}\n\n"
@@ -996,7 +1302,8 @@ async def menu_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "📝 *Como Baixar Vídeos*\n\n"
             "1. Copie o link do vídeo (TikTok ou Instagram)\n"
             "2. Cole aqui no chat e envie\n"
-            "3. Aguarde o download!\n\n"
+            "3. Aguarde o download!\n"
+            "4. Quer só o som? Toque em 🎵 *Baixar Áudio* no vídeo recebido\n\n"
             "⚠️ *Importante:*\n"
             "• O perfil deve ser público\n"
             "• Stories do Instagram também funcionam!\n\n"
@@ -1022,60 +1329,62 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     status_msg = await update.message.reply_text("⏳ Processando seu vídeo...\n\nIsso pode levar alguns segundos.")
     
-    file_path = None
+    # Remember the URL so the "audio only" button on the result can find it
+    video_id = media_key(url)
+    video_cache[video_id] = url
+    
+    user_id = update.effective_user.id
+    try:
+        queued = await admission.acquire(user_id, queue_position_updater(status_msg))
+    except AdmissionError as e:
+        await status_msg.edit_text(str(e))
+        return
+    
+    video = None
+    reporter = ProgressReporter(status_msg, progress_throttle, "⏳ Processando seu vídeo...")
     
     try:
+        if queued:
+            await status_msg.edit_text("⏳ Processando seu vídeo...\n\nIsso pode levar alguns segundos.")
+        
         # Send typing action
         await context.bot.send_chat_action(chat_id=update.effective_chat.id, action=ChatAction.UPLOAD_VIDEO)
         
         # Download video
         # Run in executor to avoid blocking the async loop
         loop = asyncio.get_running_loop()
+        started = time.monotonic()
         
-        try:
-            file_path = await loop.run_in_executor(None, download_video, url)
-        except DownloadError as e:
-            # If main method fails, try alternative methods
-            if "instagram.com" in url:
-                await status_msg.edit_text("⏳ Tentando método alternativo de download...")
-                try:
-                    file_path = await loop.run_in_executor(None, download_instagram_alternative, url)
-                except Exception:
-                    raise e  # Re-raise original error
-            elif "tiktok.com" in url:
-                await status_msg.edit_text("⏳ Tentando método alternativo de download...")
-                try:
-                    file_path = await loop.run_in_executor(None, download_tiktok_alternative, url)
-                except Exception:
-                    raise e  # Re-raise original error
-            else:
-                raise e
+        # yt-dlp and the alternative APIs, healthiest first
+        on_fallback = lambda name: reporter.set_label("⏳ Tentando método alternativo de download...")
+        video = await loop.run_in_executor(None, download_with_fallbacks, url, reporter.callback, True, on_fallback)
         
-        if not os.path.exists(file_path):
-            await status_msg.edit_text("❌ Erro: O arquivo não foi encontrado após o download.")
-            return
-
-        # Update status
-        await status_msg.edit_text("📤 Enviando vídeo...")
+        reporter.close()
+        metrics.observe('download_seconds', time.monotonic() - started)
 
         # Send video
-        with open(file_path, 'rb') as video_file:
-            await update.message.reply_video(
-                video=video_file,
-                caption="✅ Aqui está seu vídeo! 🎥\n\n💡 Envie outro link para baixar mais vídeos.",
-                write_timeout=60,
-                read_timeout=60
-            )
+        await upload_media(
+            update.message, status_msg, video,
+            "✅ Aqui está seu vídeo! 🎥\n\n💡 Envie outro link para baixar mais vídeos.",
+            reply_markup=audio_keyboard(video_id)
+        )
         
         # Cleanup
         await status_msg.delete()
         
+        # Keep it around briefly so the audio button doesn't download it again
+        if media_cache.put(url, video):
+            video = None
+        
     except DownloadError as e:
+        reporter.close()
+        metrics.incr('download_errors')
         logger.error(f"Download error for URL {url}: {e}")
         error_message = f"❌ *Erro no download:*\n\n{str(e)}\n\n💡 *Dicas:*\n• Verifique se o vídeo é público\n• Tente copiar o link novamente\n• Certifique-se de que o vídeo ainda existe"
         await status_msg.edit_text(error_message, parse_mode='Markdown')
         
     except TelegramError as e:
+        reporter.close()
         logger.error(f"Telegram error for URL {url}: {e}")
         await status_msg.edit_text(
             f"❌ *Erro ao enviar o vídeo:*\n\n"
@@ -1086,6 +1395,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         
     except Exception as e:
+        reporter.close()
         logger.error(f"Unexpected error processing URL {url}: {e}", exc_info=True)
         await status_msg.edit_text(
             f"❌ *Erro inesperado:*\n\n"
@@ -1095,37 +1405,185 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
     
     finally:
+        admission.release(user_id)
+        
         # Cleanup file if it exists
-        if file_path and os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-                logger.info(f"Cleaned up file: {file_path}")
-            except Exception as e:
-                logger.warning(f"Failed to cleanup file {file_path}: {e}")
+        discard_media(video)
 
-def main():
-    if not TOKEN:
-        print("Erro: TELEGRAM_BOT_TOKEN não encontrado no arquivo .env")
+def format_ratio(hits: int, misses: int) -> str:
+    total = hits + misses
+    return f"{hits / total:.0%} de acertos ({hits}/{total})" if total else "sem acessos"
+
+
+def format_duration(seconds: float) -> str:
+    minutes = int(seconds) // 60
+    days, hours, minutes = minutes // 1440, minutes // 60 % 24, minutes % 60
+    return f"{days}d {hours}h {minutes}min" if days else f"{hours}h {minutes}min"
+
+
+def format_timings(name: str) -> str:
+    """p50/p95 of a metrics window (the last hour) as "p50 1.2s · p95 3.4s (n)"."""
+    window = metrics.window(name)
+    count = window.count()
+    if not count:
+        return "sem dados"
+    return f"p50 {window.percentile(50):.1f}s · p95 {window.percentile(95):.1f}s ({count})"
+
+
+def format_stats(disk_bytes: int) -> str:
+    """Live counters for /stats, all from in-process metrics."""
+    lines = [
+        "📊 Estatísticas",
+        "",
+        f"⏱️ Online há {format_duration(time.time() - metrics.started_at)}",
+        f"⬇️ Downloads: {admission.in_flight} em andamento, {admission.queue_depth} na fila",
+        f"   Download (1h): {format_timings('download_seconds')}",
+        f"   Envio (1h): {format_timings('upload_seconds')}",
+        f"   Erros: {metrics.counter('download_errors')}",
+        "",
+        "🗂️ Caches",
+        f"   video_cache: {len(video_cache)} links · "
+        f"{format_ratio(metrics.counter('video_cache_hits'), metrics.counter('video_cache_misses'))}",
+        f"   media_cache: {len(media_cache)} vídeos · {format_ratio(media_cache.hits, media_cache.misses)}",
+        f"   hashtag_index: {len(hashtag_index)} vídeos, {hashtag_index.tag_count} hashtags · "
+        f"{format_ratio(metrics.counter('hashtag_index_hits'), metrics.counter('hashtag_index_misses'))}",
+    ]
+    for name, cache in caches.items():
+        lines.append(f"   {name}: {len(cache)} itens · {format_ratio(cache.hits, cache.misses)}")
+    lines.append(
+        f"   file_id (sons): {len(sound_pipeline.cache)} · "
+        f"{format_ratio(metrics.counter('sound_file_id_hits'), metrics.counter('sound_file_id_misses'))}"
+    )
+    
+    lines += ["", "🔌 Provedores"]
+    for name, p in sorted(provider_health.snapshot().items()):
+        latency = f" · p50 {p['p50']:.1f}s · p95 {p['p95']:.1f}s" if p['p50'] is not None else ""
+        if p['attempts']:
+            rate = f"{p['successes'] / p['attempts']:.0%} de sucesso ({p['successes']}/{p['attempts']})"
+        else:
+            rate = "sem tentativas"
+        lines.append(f"   {name}: {rate}, circuito {p['state']}{latency}")
+    
+    lines += [
+        "",
+        f"💾 downloads/: {format_bytes(disk_bytes)} · RSS: {format_bytes(current_rss())}",
+    ]
+    return "\n".join(lines)
+
+
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin-only live performance counters."""
+    if not is_admin(update):
         return
+    
+    # Walks downloads/, keep it off the event loop
+    loop = asyncio.get_running_loop()
+    disk_bytes = await loop.run_in_executor(None, janitor.usage)
+    await update.message.reply_text(format_stats(disk_bytes))
+
+
+DEBUG_USAGE = (
+    "🩺 *Diagnóstico*\n\n"
+    "`/debug cpu [segundos]` - cProfile do loop de eventos\n"
+    "`/debug sample [segundos]` - amostras das pilhas de todas as threads\n"
+    "`/debug mem` - liga o tracemalloc / snapshot e diferença\n"
+    "`/debug mem stop` - desliga o tracemalloc\n"
+    "`/debug tasks` - tarefas asyncio pendentes com pilha e idade"
+)
+
+
+async def debug(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin-only profiling; results are sent as files (see profiling.Profiler)."""
+    if not is_admin(update):
+        return
+    
+    what = context.args[0].lower() if context.args else ''
+    option = context.args[1].lower() if len(context.args) > 1 else ''
+    loop = asyncio.get_running_loop()
+    
+    try:
+        if what in ('cpu', 'sample'):
+            seconds = profiler.clamp(float(option) if option.replace('.', '', 1).isdigit() else 10)
+            status_msg = await update.message.reply_text(f"⏱️ Coletando por {seconds:.0f}s...")
+            if what == 'cpu':
+                files = await profiler.cpu_profile(seconds)
+            else:
+                files = await loop.run_in_executor(None, profiler.sample, seconds)
+            await status_msg.delete()
+        elif what == 'mem' and option == 'stop':
+            profiler.memory_stop()
+            await update.message.reply_text("🧠 tracemalloc desligado.")
+            return
+        elif what == 'mem':
+            files = await loop.run_in_executor(None, profiler.memory_snapshot)
+            if not files:
+                await update.message.reply_text(
+                    "🧠 tracemalloc ligado (deixa o bot mais lento).\n"
+                    "Envie `/debug mem` de novo para o snapshot e `/debug mem stop` para desligar.",
+                    parse_mode='Markdown'
+                )
+                return
+        elif what == 'tasks':
+            files = await profiler.task_dump()
+        else:
+            await update.message.reply_text(DEBUG_USAGE, parse_mode='Markdown')
+            return
+    except ProfilerBusy:
+        await update.message.reply_text("⏳ Já existe uma coleta em andamento, tente de novo em instantes.")
+        return
+    
+    for filename, data in files:
+        await update.message.reply_document(document=data, filename=filename)
 
-    # Ensure downloads directory exists
-    if not os.path.exists("downloads"):
-        os.makedirs("downloads")
 
-    application = ApplicationBuilder().token(TOKEN).build()
+async def post_init(application):
+    """
+    post_init hook: hands the event loop to the memory governor (caches the
+    handlers own are shed on it) and, when enabled, to the profiler.
+    """
+    loop = asyncio.get_running_loop()
+    governor.attach_loop(loop)
+    if PROFILING_ENABLED:
+        profiler.install(loop)
+
+
+def start_background_services():
+    """Starts the periodic maintenance threads (cleanup, memory, persistence)."""
+    janitor.start()
+
+    # Watch RSS and shed caches before the 512 MB VM gets OOM-killed
+    governor.start_monitor()
+
+    # Persist the hashtag index built from feed/search pages
+    hashtag_index.start()
+
+    # Downsample and expire old feed snapshots
+    timeseries.start()
+
+
+def build_application(token: str, base_url: Optional[str] = None):
+    """
+    Builds the Application with every handler registered. `base_url`
+    points it at another Bot API server (benchmarks/load_test.py).
+    """
+    builder = ApplicationBuilder().token(token).concurrent_updates(CONCURRENT_UPDATES).post_init(post_init)
+    if base_url:
+        builder = builder.base_url(base_url)
+    application = builder.build()
 
     start_handler = CommandHandler('start', start)
     viral_handler = CommandHandler('viral', viral)
     tendencias_handler = CommandHandler('tendencias', tendencias)
     analisar_handler = CommandHandler('analisar', analisar)
     musicas_handler = CommandHandler('musicas', musicas)
+    stats_handler = CommandHandler('stats', stats)
     msg_handler = MessageHandler(filters.TEXT & (~filters.COMMAND), handle_message)
     
     
     # Callback handlers for buttons
     menu_callback_handler = CallbackQueryHandler(menu_callback, pattern='^menu_')
     viral_callback_handler = CallbackQueryHandler(viral_callback, pattern='^viral_')
-    download_callback_handler = CallbackQueryHandler(download_callback, pattern='^download_')
+    download_callback_handler = CallbackQueryHandler(download_callback, pattern='^(download|audio)_')
     filter_callback_handler = CallbackQueryHandler(viral_filter_callback, pattern='^filter_')
 
     application.add_handler(start_handler)
@@ -1133,23 +1591,84 @@ def main():
     application.add_handler(tendencias_handler)
     application.add_handler(analisar_handler)
     application.add_handler(musicas_handler)
+    application.add_handler(stats_handler)
     application.add_handler(menu_callback_handler)
     application.add_handler(viral_callback_handler)
     application.add_handler(filter_callback_handler)
     application.add_handler(download_callback_handler)
     application.add_handler(msg_handler)
+    return application
 
 
+def main():
+    if not TOKEN:
+        print("Erro: TELEGRAM_BOT_TOKEN não encontrado no arquivo .env")
+        return
+
+    # Ensure downloads directory exists
+    if not os.path.exists("downloads"):
+        os.makedirs("downloads")
+
+    # Nothing can be in use yet: drop leftovers from a crash/OOM kill, then keep sweeping
+    reclaimed = janitor.sweep(everything=True)
+    print(f"Limpeza inicial de downloads/: {reclaimed / (1024 * 1024):.1f} MB liberados")
+    start_background_services()
+
+    application = build_application(TOKEN)
+    if PROFILING_ENABLED:
+        application.add_handler(CommandHandler('debug', debug))
+
     # Start dummy web server for Render
     from threading import Thread
-    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 
     class SimpleHTTPRequestHandler(BaseHTTPRequestHandler):
         def do_GET(self):
+            if PROFILING_ENABLED and self.path.startswith('/debug/'):
+                return self.send_diagnostics()
             self.send_response(200)
             self.end_headers()
             self.wfile.write(b'Bot is running!')
 
+        def send_diagnostics(self):
+            """/debug/{cpu,sample,memory,memory-stop,tasks}?token=...&seconds=10 as a zip of the result files."""
+            import io
+            import zipfile
+            from urllib.parse import urlparse, parse_qs
+
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            # Without a token the endpoints stay closed; /debug still works for admins
+            if not PROFILING_TOKEN or params.get('token', [''])[0] != PROFILING_TOKEN:
+                self.send_response(403)
+                self.end_headers()
+                return
+
+            what = url.path[len('/debug/'):]
+            try:
+                files = profiler.collect(what, float(params.get('seconds', ['10'])[0]))
+            except ProfilerBusy:
+                self.send_response(409)
+                self.end_headers()
+                return
+            except (ValueError, RuntimeError) as e:
+                self.send_response(400)
+                self.end_headers()
+                self.wfile.write(str(e).encode())
+                return
+
+            archive = io.BytesIO()
+            with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as z:
+                for filename, data in files:
+                    z.writestr(filename, data)
+            body = archive.getvalue()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/zip')
+            self.send_header('Content-Disposition', f'attachment; filename="debug-{what}.zip"')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
         def do_HEAD(self):
             self.send_response(200)
             self.end_headers()
@@ -1157,7 +1676,8 @@ def main():
     def start_web_server():
         port = int(os.environ.get('PORT', 8080))
         try:
-            server = HTTPServer(('0.0.0.0', port), SimpleHTTPRequestHandler)
+            # Threaded: a profiling request must not block health checks
+            server = ThreadingHTTPServer(('0.0.0.0', port), SimpleHTTPRequestHandler)
             print(f"Server started on port {port}")
             server.serve_forever()
         except Exception as e:
@@ -0,0 +1,55 @@
+import time
+import threading
+from collections import OrderedDict
+
+from memory import governor
+
+# Every TTLCache by name, for /stats and debugging
+caches = {}
+
+
+class TTLCache:
+    """
+    Small thread-safe LRU cache whose entries expire after `ttl` seconds.
+    Registered with the memory governor so it is shed under pressure.
+    """
+
+    def __init__(self, name: str, ttl: float, max_items: int = 256):
+        self.name = name
+        self.ttl = ttl
+        self.max_items = max_items
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        caches[name] = self
+        governor.register_cache(name, self.shed)
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def shed(self) -> int:
+        """Drops every entry. Returns how many were dropped."""
+        with self._lock:
+            count = len(self._data)
+            self._data.clear()
+            return count
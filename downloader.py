@@ -1,8 +1,22 @@
 import os
 import logging
 import uuid
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 import yt_dlp
-from typing import Optional
+from typing import BinaryIO, Callable, Optional, Union
+
+from memory import governor, MB
+from cache import TTLCache
+from providers import provider_health, ContentError
+from tikwm import tikwm, TikwmError
+from videos import VideoRecord, parse_video, parse_videos
+import analytics
+import ranking
+from hashtag_index import hashtag_index
+from timeseries import timeseries
+from traffic import traffic
+import numpy as np
 
 # Configure logging
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
@@ -12,26 +26,46 @@ class DownloadError(Exception):
     """Custom exception for download errors"""
     pass
 
-def download_video(url: str) -> str:
+class ContentUnavailableError(DownloadError, ContentError):
+    """The video is private, removed or needs login: no other provider will get it either"""
+    pass
+
+# Progress hook signature: (downloaded_bytes, total_bytes or None)
+ProgressCallback = Callable[[int, Optional[int]], None]
+
+# Projected memory cost used by the memory governor when nothing better is known
+DEFAULT_VIDEO_COST = 16 * MB
+FEED_ITEM_COST = 32 * 1024
+
+# Regions offered in the bot; GLOBAL_REGION fans out to all of them concurrently
+SUPPORTED_REGIONS = ['US', 'BR', 'JP', 'GB', 'FR']
+GLOBAL_REGION = 'GLOBAL'
+_region_pool = ThreadPoolExecutor(max_workers=len(SUPPORTED_REGIONS), thread_name_prefix='region')
+
+# Rolling window for topic/sound growth rankings
+TRENDS_WINDOW = int(os.getenv('TRENDS_WINDOW_HOURS', 6)) * 3600
+
+# In spool mode, videos up to this size stay in memory; bigger ones spill to downloads/
+SPOOL_MAX_BYTES = int(float(os.getenv('SPOOL_MAX_MB', 10)) * MB)
+
+# Result of a download: a path on disk, or an open binary file in spool mode
+DownloadResult = Union[str, BinaryIO]
+
+# Alternative download APIs; overridable to point at a stand-in server (benchmarks/fake_upstream.py)
+SNAPINSTA_URL = os.getenv('SNAPINSTA_BASE_URL', 'https://snapinsta.app') + '/api/ajaxSearch'
+SNAPTIK_URL = os.getenv('SNAPTIK_BASE_URL', 'https://snaptik.app') + '/abc2.php'
+
+# Creator lookups are repeated a lot for popular creators; tikwm data changes slowly
+creator_info_cache = TTLCache('creator_info', ttl=600)
+creator_videos_cache = TTLCache('creator_videos', ttl=600)
+creator_analysis_cache = TTLCache('creator_analysis', ttl=3600)
+
+
+def _build_ydl_opts(url: str, output_template: str, progress_callback: Optional[ProgressCallback] = None) -> dict:
     """
-    Downloads a video from Instagram or TikTok using yt-dlp.
-    Returns the path to the downloaded file.
-    Raises DownloadError if download fails.
-    
-    Args:
-        url: URL of the video to download
-        
-    Returns:
-        str: Path to the downloaded video file
+    Builds the yt-dlp options shared by video and audio downloads.
+    Raises DownloadError for unsupported URLs.
     """
-    
-    # Ensure downloads directory exists
-    os.makedirs("downloads", exist_ok=True)
-    
-    # Generate unique filename
-    unique_id = str(uuid.uuid4())
-    output_template = f"downloads/{unique_id}.%(ext)s"
-    
     # Configure yt-dlp options
     ydl_opts = {
         'format': 'best',  # Download best quality
@@ -68,10 +102,45 @@ def download_video(url: str) -> str:
     else:
         raise DownloadError("URL não suportada. Apenas Instagram e TikTok são suportados.")
     
+    if progress_callback:
+        def _progress_hook(d):
+            if d.get('status') == 'downloading':
+                total = d.get('total_bytes') or d.get('total_bytes_estimate')
+                progress_callback(d.get('downloaded_bytes') or 0, int(total) if total else None)
+        
+        ydl_opts['progress_hooks'] = [_progress_hook]
+    
+    return ydl_opts
+
+
+def download_video(url: str, progress_callback: Optional[ProgressCallback] = None, spool: bool = False) -> DownloadResult:
+    """
+    Downloads a video from Instagram or TikTok using yt-dlp.
+    Returns the path to the downloaded file.
+    Raises DownloadError if download fails.
+    
+    Args:
+        url: URL of the video to download
+        progress_callback: Optional hook called with (downloaded, total) bytes
+        spool: Return an open file (memory-backed up to SPOOL_MAX_BYTES) instead of a path
+        
+    Returns:
+        str: Path to the downloaded video file, or an open binary file in spool mode
+    """
+    
+    # Ensure downloads directory exists
+    os.makedirs("downloads", exist_ok=True)
+    
+    # Generate unique filename
+    unique_id = str(uuid.uuid4())
+    output_template = f"downloads/{unique_id}.%(ext)s"
+    
+    ydl_opts = _build_ydl_opts(url, output_template, progress_callback)
+    
     try:
         logger.info(f"Starting download from: {url}")
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        with traffic.YoutubeDL(ydl_opts) as ydl:
             # Extract info first to check if video is available
             info = ydl.extract_info(url, download=False)
             
@@ -80,8 +149,15 @@ def download_video(url: str) -> str:
             
             logger.info(f"Video info extracted: {info.get('title', 'Unknown')}")
             
+            # Single progressive file: stream it straight into the spool
+            if spool and info.get('url') and info.get('protocol') in ('http', 'https') and not info.get('requested_formats'):
+                platform = 'instagram' if "instagram.com" in url else 'tiktok'
+                return _download_from_direct_url(info['url'], platform, progress_callback, spool=True, headers=_direct_headers(info))
+            
             # Download the video
-            ydl.download([url])
+            estimated_size = info.get('filesize') or info.get('filesize_approx') or DEFAULT_VIDEO_COST
+            with governor.budget(int(estimated_size), 'download'):
+                ydl.download([url])
             
             # Find the downloaded file
             expected_filename = f"downloads/{unique_id}.mp4"
@@ -113,219 +189,480 @@ def download_video(url: str) -> str:
                 os.remove(downloaded_file)
                 raise DownloadError("Arquivo baixado é muito pequeno, provavelmente inválido.")
             
+            if spool:
+                return _open_unlinked(downloaded_file)
+            
             return downloaded_file
             
+    except DownloadError:
+        raise
+    
     except yt_dlp.utils.DownloadError as e:
-        error_msg = str(e)
-        logger.error(f"yt-dlp download error: {error_msg}")
-        
-        # Provide more specific error messages
-        if "Private video" in error_msg or "private" in error_msg.lower():
-            raise DownloadError("Este vídeo é privado e não pode ser baixado.")
-        elif "not available" in error_msg.lower():
-            raise DownloadError("Este vídeo não está disponível. Pode ter sido removido ou está privado.")
-        elif "login" in error_msg.lower() or "sign in" in error_msg.lower():
-            raise DownloadError("Este vídeo requer login. Apenas vídeos públicos podem ser baixados.")
-        else:
-            raise DownloadError(f"Erro ao baixar o vídeo: {error_msg}")
+        raise _translate_ytdlp_error(e)
             
     except Exception as e:
         logger.error(f"Unexpected error downloading {url}: {e}")
         raise DownloadError(f"Erro inesperado: {str(e)}")
 
 
-def download_instagram_alternative(url: str) -> str:
+def _translate_ytdlp_error(e: Exception) -> DownloadError:
+    """Maps a yt-dlp error to a DownloadError with a user-friendly message."""
+    error_msg = str(e)
+    logger.error(f"yt-dlp download error: {error_msg}")
+    
+    # Provide more specific error messages
+    if "Private video" in error_msg or "private" in error_msg.lower():
+        return ContentUnavailableError("Este vídeo é privado e não pode ser baixado.")
+    elif "not available" in error_msg.lower() and "format" not in error_msg.lower():
+        return ContentUnavailableError("Este vídeo não está disponível. Pode ter sido removido ou está privado.")
+    elif "login" in error_msg.lower() or "sign in" in error_msg.lower():
+        return ContentUnavailableError("Este vídeo requer login. Apenas vídeos públicos podem ser baixados.")
+    else:
+        return DownloadError(f"Erro ao baixar o vídeo: {error_msg}")
+
+
+def _direct_headers(info: dict) -> dict:
     """
-    Alternative method to download Instagram videos using API fallbacks.
-    This is a backup method if yt-dlp fails.
+    Headers yt-dlp would use to fetch the format in `info` itself: its
+    http_headers plus the extractor's cookies for that URL (TikTok's CDN
+    answers 403 without e.g. tt_chain_token). yt-dlp keeps those out of
+    http_headers and lists them in `info['cookies']`, Set-Cookie style.
+    """
+    headers = dict(info.get('http_headers') or {})
+    pairs = [
+        part.strip() for part in (info.get('cookies') or '').split(';')
+        if '=' in part and part.split('=', 1)[0].strip().lower() not in ('domain', 'path', 'expires', 'version')
+    ]
+    if pairs:
+        headers['Cookie'] = '; '.join(pairs)
+    return headers
+
+
+def download_audio(url: str, progress_callback: Optional[ProgressCallback] = None, spool: bool = False) -> DownloadResult:
+    """
+    Downloads only the audio of an Instagram or TikTok video using yt-dlp.
+    Audio-only formats are preferred; otherwise the video is fetched and
+    the audio extracted with ffmpeg.
+    Raises DownloadError if download fails.
     
     Args:
-        url: Instagram video URL
+        url: URL of the video
+        progress_callback: Optional hook called with (downloaded, total) bytes
+        spool: Return an open file instead of a path (see download_video)
         
     Returns:
-        str: Path to the downloaded video file
+        str: Path to the downloaded .m4a file, or an open binary file in spool mode
     """
-    import requests
-    import re
+    os.makedirs("downloads", exist_ok=True)
     
-    logger.info(f"Trying alternative Instagram download method for: {url}")
+    unique_id = str(uuid.uuid4())
+    ydl_opts = _build_ydl_opts(url, f"downloads/{unique_id}.%(ext)s", progress_callback)
+    ydl_opts.update({
+        'format': 'bestaudio/best',
+        'postprocessors': [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'm4a'}],
+    })
     
-    # Method 1: Try SnapInsta API
     try:
-        api_url = "https://snapinsta.app/api/ajaxSearch"
+        logger.info(f"Starting audio download from: {url}")
         
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-            'X-Requested-With': 'XMLHttpRequest'
-        }
+        with traffic.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=False)
+            
+            if not info:
+                raise DownloadError("Não foi possível extrair informações do vídeo. Verifique se o link é válido e público.")
+            
+            # Audio-only progressive stream: no ffmpeg pass needed, stream it into the spool
+            if (spool and info.get('vcodec') == 'none' and info.get('url')
+                    and info.get('protocol') in ('http', 'https') and info.get('ext') in ('m4a', 'mp3', 'aac')):
+                platform = 'instagram' if "instagram.com" in url else 'tiktok'
+                return _download_from_direct_url(info['url'], platform, progress_callback, spool=True, headers=_direct_headers(info))
+            
+            estimated_size = info.get('filesize') or info.get('filesize_approx') or DEFAULT_VIDEO_COST
+            with governor.budget(int(estimated_size), 'download'):
+                ydl.download([url])
         
-        data = {
-            'q': url,
-            'lang': 'en'
-        }
+        audio_file = f"downloads/{unique_id}.m4a"
+        if not os.path.exists(audio_file):
+            raise DownloadError("O áudio não foi encontrado após o download.")
         
-        response = requests.post(api_url, headers=headers, data=data, timeout=30)
+        logger.info(f"Audio downloaded successfully: {audio_file} ({os.path.getsize(audio_file)} bytes)")
+        return _open_unlinked(audio_file) if spool else audio_file
         
-        if response.status_code == 200:
-            result = response.json()
-            
-            if result.get('status') == 'ok':
-                html = result.get('data', '')
-                
-                # Look for video download link
-                patterns = [
-                    r'href="([^"]+)"[^>]*class="[^"]*download[^"]*"',
-                    r'<a[^>]+href="([^"]+)"[^>]*>\s*Download',
-                    r'href="(https://[^"]+\.cdninstagram\.com[^"]+)"',
-                    r'href="(https://scontent[^"]+)"'
-                ]
-                
-                for pattern in patterns:
-                    match = re.search(pattern, html, re.IGNORECASE)
-                    if match:
-                        video_url = match.group(1)
-                        if 'cdninstagram' in video_url or 'scontent' in video_url:
-                            return _download_from_direct_url(video_url, "instagram")
+    except DownloadError:
+        raise
+    
+    except yt_dlp.utils.DownloadError as e:
+        raise _translate_ytdlp_error(e)
+    
     except Exception as e:
-        logger.warning(f"SnapInsta API failed: {e}")
+        logger.error(f"Unexpected error downloading audio {url}: {e}")
+        raise DownloadError(f"Erro inesperado: {str(e)}")
+
+
+def extract_audio(video_path: str, spool: bool = False) -> DownloadResult:
+    """
+    Extracts the audio track of an already downloaded video with ffmpeg.
+    The stream is copied when possible and re-encoded to AAC otherwise.
     
-    raise DownloadError("Método alternativo de download também falhou.")
+    Args:
+        video_path: Path to the video file
+        spool: Return an open file instead of a path
+        
+    Returns:
+        str: Path to the .m4a file, or an open binary file in spool mode
+    """
+    import shutil
+    import subprocess
+    
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        raise DownloadError("Extração de áudio indisponível (ffmpeg não instalado).")
+    
+    audio_file = f"downloads/{uuid.uuid4()}.m4a"
+    for codec_args in (['-c:a', 'copy'], ['-c:a', 'aac', '-b:a', '128k']):
+        cmd = [ffmpeg, '-y', '-hide_banner', '-loglevel', 'error', '-i', video_path, '-vn', *codec_args, audio_file]
+        try:
+            subprocess.run(cmd, check=True, timeout=120, capture_output=True)
+            break
+        except (subprocess.SubprocessError, OSError) as e:
+            logger.warning(f"ffmpeg audio extraction with {codec_args} failed: {e}")
+            if os.path.exists(audio_file):
+                os.remove(audio_file)
+    else:
+        raise DownloadError("Não foi possível extrair o áudio do vídeo.")
+    
+    logger.info(f"Audio extracted: {audio_file} ({os.path.getsize(audio_file)} bytes)")
+    return _open_unlinked(audio_file) if spool else audio_file
+
+
+def download_instagram_alternative(url: str, progress_callback: Optional[ProgressCallback] = None, spool: bool = False) -> DownloadResult:
+    """
+    Alternative method to download Instagram videos using API fallbacks.
+    This is a backup method if yt-dlp fails.
+    
+    Args:
+        url: Instagram video URL
+        progress_callback: Optional hook called with (downloaded, total) bytes
+        spool: Return an open file instead of a path (see download_video)
+        
+    Returns:
+        str: Path to the downloaded video file, or an open binary file in spool mode
+    """
+    logger.info(f"Trying alternative Instagram download method for: {url}")
+    return _run_providers(ALTERNATIVE_PROVIDERS['instagram'], url, progress_callback, spool)
 
 
-def download_tiktok_alternative(url: str) -> str:
+def download_tiktok_alternative(url: str, progress_callback: Optional[ProgressCallback] = None, spool: bool = False) -> DownloadResult:
     """
     Alternative method to download TikTok videos using API fallbacks.
     This is a backup method if yt-dlp fails.
     
     Args:
         url: TikTok video URL
+        progress_callback: Optional hook called with (downloaded, total) bytes
+        spool: Return an open file instead of a path (see download_video)
         
     Returns:
-        str: Path to the downloaded video file
+        str: Path to the downloaded video file, or an open binary file in spool mode
     """
-    import requests
-    import re
-    
     logger.info(f"Trying alternative TikTok download method for: {url}")
+    return _run_providers(ALTERNATIVE_PROVIDERS['tiktok'], url, progress_callback, spool)
+
+
+def download_with_fallbacks(url: str, progress_callback: Optional[ProgressCallback] = None, spool: bool = False,
+                            on_fallback: Optional[Callable[[str], None]] = None) -> DownloadResult:
+    """
+    Downloads a video trying yt-dlp and the alternative APIs for its
+    platform, ordered by provider health (see providers.ProviderHealth):
+    providers with an open circuit are skipped and the cheapest expected
+    time-to-success goes first.
     
-    # Method 1: Try TikWM API
-    try:
-        api_url = "https://www.tikwm.com/api/"
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-        }
-        
-        params = {
-            'url': url,
-            'hd': '1'
-        }
-        
-        response = requests.post(api_url, headers=headers, data=params, timeout=30)
+    Args:
+        url: Video URL
+        progress_callback: Optional hook called with (downloaded, total) bytes
+        spool: Return an open file instead of a path (see download_video)
+        on_fallback: Called with the provider name before each attempt after the first
         
-        if response.status_code == 200:
-            result = response.json()
-            
-            if result.get('code') == 0:
-                data = result.get('data', {})
-                
-                # Try HD video first, then fall back to regular
-                video_url = data.get('hdplay') or data.get('play')
-                
-                if video_url:
-                    logger.info(f"Found TikTok video URL via TikWM API")
-                    return _download_from_direct_url(video_url, "tiktok")
-    except Exception as e:
-        logger.warning(f"TikWM API failed: {e}")
+    Returns:
+        str: Path to the downloaded video file, or an open binary file in spool mode
+    """
+    platform = _platform(url)
+    names = [f"yt-dlp:{platform or 'other'}"] + ALTERNATIVE_PROVIDERS.get(platform, [])
+    return _run_providers(names, url, progress_callback, spool, on_fallback)
+
+
+def _platform(url: str) -> Optional[str]:
+    if "tiktok.com" in url:
+        return "tiktok"
+    if "instagram.com" in url:
+        return "instagram"
+    return None
+
+
+def _run_providers(names: list, url: str, progress_callback: Optional[ProgressCallback] = None, spool: bool = False,
+                   on_fallback: Optional[Callable[[str], None]] = None) -> DownloadResult:
+    """
+    Tries providers in health order until one succeeds. Raises yt-dlp's
+    error if it was tried (its messages are the most helpful), otherwise
+    the first provider error. A ContentUnavailableError stops right away.
+    """
+    errors = {}
+    for attempt, name in enumerate(provider_health.order(names)):
+        if attempt and on_fallback:
+            on_fallback(name)
+        fn = download_video if name.startswith("yt-dlp:") else PROVIDER_FUNCTIONS[name]
+        try:
+            return provider_health.call(name, fn, url, progress_callback, spool)
+        except ContentUnavailableError:
+            raise
+        except Exception as e:
+            logger.warning(f"Provider {name} failed for {url}: {e}")
+            errors[name] = e
     
-    # Method 2: Try SnapTik API
-    try:
-        api_url = "https://snaptik.app/abc2.php"
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-        }
-        
-        data = {
-            'url': url,
-            'lang': 'en'
-        }
-        
-        response = requests.post(api_url, headers=headers, data=data, timeout=30)
+    ytdlp_error = next((e for name, e in errors.items() if name.startswith("yt-dlp:")), None)
+    error = ytdlp_error or next(iter(errors.values()), None)
+    if isinstance(error, DownloadError):
+        raise error
+    raise DownloadError("Método alternativo de download também falhou.")
+
+
+def _download_snapinsta(url: str, progress_callback: Optional[ProgressCallback] = None, spool: bool = False) -> DownloadResult:
+    """Downloads an Instagram video through the SnapInsta API."""
+    import re
+    
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+        'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+        'X-Requested-With': 'XMLHttpRequest'
+    }
+    
+    data = {
+        'q': url,
+        'lang': 'en'
+    }
+    
+    response = traffic.post(SNAPINSTA_URL, headers=headers, data=data, timeout=30)
+    
+    if response.status_code == 200:
+        result = response.json()
         
-        if response.status_code == 200:
-            html = response.text
+        if result.get('status') == 'ok':
+            html = result.get('data', '')
             
             # Look for video download link
             patterns = [
                 r'href="([^"]+)"[^>]*class="[^"]*download[^"]*"',
                 r'<a[^>]+href="([^"]+)"[^>]*>\s*Download',
-                r'href="(https://[^"]+\.tiktokcdn\.com[^"]+)"',
+                r'href="(https://[^"]+\.cdninstagram\.com[^"]+)"',
+                r'href="(https://scontent[^"]+)"'
             ]
             
             for pattern in patterns:
                 match = re.search(pattern, html, re.IGNORECASE)
                 if match:
                     video_url = match.group(1)
-                    if 'tiktokcdn' in video_url or 'tiktok' in video_url:
-                        logger.info(f"Found TikTok video URL via SnapTik API")
-                        return _download_from_direct_url(video_url, "tiktok")
-    except Exception as e:
-        logger.warning(f"SnapTik API failed: {e}")
+                    if 'cdninstagram' in video_url or 'scontent' in video_url:
+                        return _download_from_direct_url(video_url, "instagram", progress_callback, spool)
     
-    raise DownloadError("Método alternativo de download também falhou.")
+    raise DownloadError("SnapInsta não retornou um link de download.")
+
+
+def _download_tikwm(url: str, progress_callback: Optional[ProgressCallback] = None, spool: bool = False) -> DownloadResult:
+    """Downloads a TikTok video through the TikWM API."""
+    params = {
+        'url': url,
+        'hd': '1'
+    }
+    
+    try:
+        result = tikwm.post('/api/', params)
+    except TikwmError as e:
+        raise DownloadError(f"TikWM falhou: {e}")
+    
+    data = result.get('data', {})
+    
+    # Try HD video first, then fall back to regular
+    video_url = data.get('hdplay') or data.get('play')
+    
+    if video_url:
+        logger.info(f"Found TikTok video URL via TikWM API")
+        return _download_from_direct_url(video_url, "tiktok", progress_callback, spool)
+    
+    raise DownloadError("TikWM não retornou um link de download.")
+
+
+def _download_snaptik(url: str, progress_callback: Optional[ProgressCallback] = None, spool: bool = False) -> DownloadResult:
+    """Downloads a TikTok video through the SnapTik API."""
+    import re
+    
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+        'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+    }
+    
+    data = {
+        'url': url,
+        'lang': 'en'
+    }
+    
+    response = traffic.post(SNAPTIK_URL, headers=headers, data=data, timeout=30)
+    
+    if response.status_code == 200:
+        html = response.text
+        
+        # Look for video download link
+        patterns = [
+            r'href="([^"]+)"[^>]*class="[^"]*download[^"]*"',
+            r'<a[^>]+href="([^"]+)"[^>]*>\s*Download',
+            r'href="(https://[^"]+\.tiktokcdn\.com[^"]+)"',
+        ]
+        
+        for pattern in patterns:
+            match = re.search(pattern, html, re.IGNORECASE)
+            if match:
+                video_url = match.group(1)
+                if 'tiktokcdn' in video_url or 'tiktok' in video_url:
+                    logger.info(f"Found TikTok video URL via SnapTik API")
+                    return _download_from_direct_url(video_url, "tiktok", progress_callback, spool)
+    
+    raise DownloadError("SnapTik não retornou um link de download.")
+
+
+# Alternative download APIs per platform, in their default (cold start) order
+ALTERNATIVE_PROVIDERS = {
+    'tiktok': ['tikwm', 'snaptik'],
+    'instagram': ['snapinsta'],
+}
+
+PROVIDER_FUNCTIONS = {
+    'tikwm': _download_tikwm,
+    'snaptik': _download_snaptik,
+    'snapinsta': _download_snapinsta,
+}
 
 
-def _download_from_direct_url(video_url: str, platform: str) -> str:
+def _download_from_direct_url(video_url: str, platform: str, progress_callback: Optional[ProgressCallback] = None,
+                              spool: bool = False, headers: Optional[dict] = None) -> DownloadResult:
     """
     Download video from a direct URL.
     
     Args:
         video_url: Direct URL to the video file
         platform: Platform name (for filename)
+        progress_callback: Optional hook called with (downloaded, total) bytes
+        spool: Write into a memory-backed spool instead of downloads/ and return it
+        headers: HTTP headers to use instead of the default ones
         
     Returns:
-        str: Path to the downloaded video file
+        str: Path to the downloaded video file, or an open binary file in spool mode
     """
-    import requests
-    
+    out = None
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Referer': 'https://www.instagram.com/' if platform == 'instagram' else 'https://www.tiktok.com/'
-        }
+        if not headers:
+            headers = {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+                'Referer': 'https://www.instagram.com/' if platform == 'instagram' else 'https://www.tiktok.com/'
+            }
         
         logger.info(f"Downloading video from direct URL: {video_url[:100]}...")
         
-        video_response = requests.get(video_url, headers=headers, timeout=120, stream=True)
+        video_response = traffic.get(video_url, headers=headers, timeout=120, stream=True)
         video_response.raise_for_status()
         
-        # Save to file
+        # Save to file (or to an in-memory spool that only spills to disk when large)
         os.makedirs("downloads", exist_ok=True)
-        filename = f"downloads/{uuid.uuid4()}_{platform}.mp4"
+        if spool:
+            filename = None
+            out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, dir="downloads", suffix=f"_{platform}.mp4")
+        else:
+            filename = f"downloads/{uuid.uuid4()}_{platform}.mp4"
+            out = open(filename, 'wb')
         
-        with open(filename, 'wb') as f:
-            for chunk in video_response.iter_content(chunk_size=8192):
+        total = int(video_response.headers.get('Content-Length') or 0) or None
+        downloaded = 0
+        
+        with governor.budget(total or DEFAULT_VIDEO_COST, 'download'):
+            for chunk in video_response.iter_content(chunk_size=64 * 1024):
                 if chunk:
-                    f.write(chunk)
+                    out.write(chunk)
+                    downloaded += len(chunk)
+                    if progress_callback:
+                        progress_callback(downloaded, total)
         
-        file_size = os.path.getsize(filename)
-        logger.info(f"Video downloaded successfully: {filename} ({file_size} bytes)")
+        file_size = downloaded
+        logger.info(f"Video downloaded successfully: {filename or 'spool'} ({file_size} bytes, in memory: {spool and file_size <= SPOOL_MAX_BYTES})")
         
         if file_size < 1000:  # Less than 1KB, probably an error
-            os.remove(filename)
             raise DownloadError("Arquivo baixado é muito pequeno, provavelmente inválido.")
         
+        if spool:
+            out.seek(0)
+            return out
+        
+        out.close()
         return filename
         
     except Exception as e:
+        if out:
+            out.close()
+            if not spool and os.path.exists(filename):
+                os.remove(filename)
         logger.error(f"Error downloading from direct URL: {e}")
         raise DownloadError(f"Erro ao baixar do URL direto: {str(e)}")
 
 
+def _open_unlinked(path: str) -> BinaryIO:
+    """Opens `path` for reading and removes it from downloads/ right away."""
+    f = open(path, 'rb')
+    try:
+        os.remove(path)
+    except OSError:
+        # Windows can't unlink open files; the janitor/caller cleans it up later
+        pass
+    return f
+
+
+
+
+def download_sound(sound_url: str, music_id: str) -> str:
+    """
+    Downloads a TikTok sound (music track) to downloads/.
+    
+    Args:
+        sound_url: Direct URL of the sound (music_info.play)
+        music_id: TikTok music id (for filename)
+        
+    Returns:
+        str: Path to the downloaded audio file
+    """
+    os.makedirs("downloads", exist_ok=True)
+    filename = f"downloads/sound_{music_id}_{uuid.uuid4().hex[:8]}.mp3"
+    
+    try:
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+            'Referer': 'https://www.tiktok.com/'
+        }
+        
+        response = traffic.get(sound_url, headers=headers, timeout=60, stream=True)
+        response.raise_for_status()
+        
+        with open(filename, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                if chunk:
+                    f.write(chunk)
+        
+        if os.path.getsize(filename) < 1000:
+            raise DownloadError("Áudio baixado é muito pequeno, provavelmente inválido.")
+        
+        logger.info(f"Sound {music_id} downloaded: {filename}")
+        return filename
+        
+    except Exception as e:
+        if os.path.exists(filename):
+            os.remove(filename)
+        logger.error(f"Error downloading sound {music_id}: {e}")
+        raise DownloadError(f"Erro ao baixar o áudio: {str(e)}")
 
 
 def search_tiktok_by_hashtag(hashtag: str, limit: int = 15, region: str = 'US', sort_by: str = 'likes') -> list:
@@ -336,27 +673,22 @@ def search_tiktok_by_hashtag(hashtag: str, limit: int = 15, region: str = 'US',
         hashtag: Hashtag to search for (with or without #)
         limit: Number of videos to return
         region: Region code (e.g. 'BR', 'US'). Defaults to 'US' (Global/International).
-        sort_by: Sort criteria - 'likes', 'views', or 'date'
+        sort_by: Sort criteria - 'likes', 'views', 'date' or another ranking.SCORES name (e.g. 'viral')
         
     Returns:
-        list: List of dictionaries with video info
+        list: List of VideoRecords
     """
-    import requests
-    from datetime import datetime
-    
     # Clean hashtag (remove # if present)
     hashtag = hashtag.strip().lstrip('#')
     
     logger.info(f"Searching TikTok for #{hashtag} (limit={limit}, region={region}, sort={sort_by})")
     
     try:
-        # TikWM Search API
-        api_url = "https://www.tikwm.com/api/feed/search"
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-        }
+        # Answer from the hashtag index while this search is fresh
+        processed_videos = hashtag_index.search(hashtag, region)
+        if processed_videos is not None:
+            logger.info(f"Answering #{hashtag} from the hashtag index ({len(processed_videos)} videos)")
+            return ranking.top_k(processed_videos, limit, sort_by)
         
         # Request more videos to allow for filtering
         params = {
@@ -365,56 +697,87 @@ def search_tiktok_by_hashtag(hashtag: str, limit: int = 15, region: str = 'US',
             'region': region
         }
         
-        response = requests.post(api_url, headers=headers, data=params, timeout=30)
-        
-        if response.status_code != 200:
-            logger.error(f"TikWM API error: {response.status_code}")
+        try:
+            # TikWM Search API
+            with governor.budget(params['count'] * FEED_ITEM_COST, 'feed'):
+                result = tikwm.post('/api/feed/search', params)
+        except TikwmError as e:
+            logger.error(f"TikWM API error: {e}")
             return []
-            
-        result = response.json()
-        if result.get('code') != 0:
-            logger.error(f"TikWM API returned error code: {result.get('msg')}")
-            return []
-            
+        
         videos = result.get('data', {}).get('videos', [])
         
         if not videos:
             logger.warning(f"No videos found for #{hashtag}")
             return []
         
-        # Process video data
-        processed_videos = []
-        for v in videos:
-            video_data = {
-                'title': v.get('title', 'Sem título'),
-                'play_count': v.get('play_count', 0),
-                'digg_count': v.get('digg_count', 0),
-                'author': v.get('author', {}).get('nickname', 'Desconhecido'),
-                'url': f"https://www.tiktok.com/@{v.get('author', {}).get('unique_id', 'user')}/video/{v.get('video_id')}",
-                'cover': v.get('cover', ''),
-                'create_time': v.get('create_time', 0)
-            }
-            processed_videos.append(video_data)
-        
-        # Sort based on criteria
-        if sort_by == 'likes':
-            processed_videos.sort(key=lambda x: x['digg_count'], reverse=True)
-        elif sort_by == 'views':
-            processed_videos.sort(key=lambda x: x['play_count'], reverse=True)
-        elif sort_by == 'date':
-            processed_videos.sort(key=lambda x: x['create_time'], reverse=True)
-        else:
-            # Default to likes
-            processed_videos.sort(key=lambda x: x['digg_count'], reverse=True)
+        hashtag_index.add_items(videos, region, hashtag=hashtag)
+        
+        processed_videos = parse_videos(videos)
         
         logger.info(f"Found {len(processed_videos)} videos for #{hashtag}")
-        return processed_videos[:limit]
+        return ranking.top_k(processed_videos, limit, sort_by)
         
     except Exception as e:
         logger.error(f"Error searching for #{hashtag}: {e}")
         return []
 
 
+def _fetch_feed_region(region: str, count: int) -> list:
+    """
+    Fetches one region's tikwm feed page and records it in the hashtag index
+    and time series store. Returns the raw video items ([] on errors).
+    """
+    params = {
+        'region': region,
+        'count': count
+    }
+    
+    try:
+        with governor.budget(params['count'] * FEED_ITEM_COST, 'feed'):
+            result = tikwm.post('/api/feed/list', params)
+    except Exception as e:
+        logger.error(f"Error fetching {region} feed: {e}")
+        return []
+    
+    videos = result.get('data', [])
+    hashtag_index.add_items(videos, region)
+    return videos
+
+
+def fetch_feed(region: str, count: int) -> tuple:
+    """
+    Fetches the feed for `region`, or for every SUPPORTED_REGIONS region
+    concurrently when region is GLOBAL_REGION (total latency is about the
+    slowest region's). Global results are deduplicated by video_id.
+
+    Returns (videos, columns): the raw items and their analytics.FeedColumns.
+    The snapshot is recorded in the time series store under `region`.
+    """
+    if region != GLOBAL_REGION:
+        videos = _fetch_feed_region(region, count)
+    else:
+        pages = list(_region_pool.map(lambda r: _fetch_feed_region(r, count), SUPPORTED_REGIONS))
+        
+        seen = set()
+        videos = []
+        for page in pages:
+            for v in page:
+                video_id = v.get('video_id')
+                if video_id in seen:
+                    continue
+                seen.add(video_id)
+                videos.append(v)
+        logger.info(f"Global feed: {len(videos)} unique videos from {sum(map(len, pages))} across {len(pages)} regions")
+    
+    cols = analytics.FeedColumns(videos)
+    try:
+        timeseries.record_feed(cols, region)
+    except Exception as e:
+        logger.warning(f"Failed to record feed snapshot: {e}")
+    return videos, cols
+
+
 def get_tiktok_trending(limit: int = 15, days: int = 5, region: str = 'US') -> list:
 
     """
@@ -424,78 +787,32 @@ def get_tiktok_trending(limit: int = 15, days: int = 5, region: str = 'US') -> l
     Args:
         limit: Number of videos to return
         days: How many days back to look
-        region: Region code (e.g. 'BR', 'US'). Defaults to 'US' (Global/International).
+        region: Region code (e.g. 'BR', 'US'), or GLOBAL_REGION for all supported regions.
         
     Returns:
-        list: List of dictionaries with video info
+        list: List of VideoRecords
     """
-    import requests
-    import time
     from datetime import datetime, timedelta
     
     logger.info(f"Fetching trending TikTok videos (limit={limit}, days={days}, region={region})")
     
     try:
-        # TikWM Feed API
-        api_url = "https://www.tikwm.com/api/feed/list"
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-        }
-        
         # Request more videos to allow for filtering
-        params = {
-            'region': region,
-            'count': 200  # Increased to ensure we get enough videos
-        }
-        
-        response = requests.post(api_url, headers=headers, data=params, timeout=30)
-        
-        if response.status_code != 200:
-            logger.error(f"TikWM API error: {response.status_code}")
-            return []
-            
-        result = response.json()
-        if result.get('code') != 0:
-            logger.error(f"TikWM API returned error code: {result.get('msg')}")
-            return []
-            
-        videos = result.get('data', [])
+        videos, _ = fetch_feed(region, 200)
         
         # Filter by date
         cutoff_date = datetime.now() - timedelta(days=days)
         cutoff_timestamp = cutoff_date.timestamp()
         
-        filtered_videos = []
-        all_videos = []  # Fallback without date filter
-        
-        for v in videos:
-            video_data = {
-                'title': v.get('title', 'Sem título'),
-                'play_count': v.get('play_count', 0),
-                'digg_count': v.get('digg_count', 0),
-                'author': v.get('author', {}).get('nickname', 'Desconhecido'),
-                'url': f"https://www.tiktok.com/@{v.get('author', {}).get('unique_id', 'user')}/video/{v.get('video_id')}",
-                'cover': v.get('cover', '')
-            }
-            all_videos.append(video_data)
-            
-            # create_time is unix timestamp
-            create_time = v.get('create_time', 0)
-            if create_time >= cutoff_timestamp:
-                filtered_videos.append(video_data)
-        
-        # Sort by digg_count (likes) descending
-        filtered_videos.sort(key=lambda x: x['digg_count'], reverse=True)
-        all_videos.sort(key=lambda x: x['digg_count'], reverse=True)
+        # Top N by likes among recent videos, falling back to all of them, in one pass
+        # (create_time is unix timestamp)
+        top, recent_count = ranking.top_k_recent(parse_videos(videos), limit, cutoff_timestamp, 'likes')
         
         # If we don't have enough filtered videos, use all videos
-        if len(filtered_videos) < limit:
-            logger.warning(f"Only {len(filtered_videos)} videos in last {days} days, using all trending videos")
-            return all_videos[:limit]
+        if recent_count < limit:
+            logger.warning(f"Only {recent_count} videos in last {days} days, using all trending videos")
         
-        return filtered_videos[:limit]
+        return top
         
     except Exception as e:
         logger.error(f"Error fetching trending videos: {e}")
@@ -508,110 +825,194 @@ def get_trending_topics(category: str = 'all', region: str = 'US', limit: int =
     
     Args:
         category: Category filter ('all', 'food', 'fashion', 'gaming', 'music', etc.)
-        region: Region code (e.g. 'BR', 'US')
+        region: Region code (e.g. 'BR', 'US'), or GLOBAL_REGION for all supported regions
         limit: Number of topics to return
         
     Returns:
         dict: Dictionary with 'trending' and 'content_gaps' lists
     """
-    import requests
-    
     logger.info(f"Fetching trending topics (category={category}, region={region}, limit={limit})")
     
     try:
+        # Rank from the hashtag index while a feed for this region is fresh
+        trending = hashtag_index.topic_stats(region, None)
+        if trending is not None:
+            logger.info(f"Ranking topics for {region} from the hashtag index")
+            return _topics_result(_rank_by_growth('hashtag', region, trending, 'name', limit))
+        
         # Get trending videos to extract popular hashtags
-        api_url = "https://www.tikwm.com/api/feed/list"
+        _, cols = fetch_feed(region, 100)
         
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-        }
+        # Count hashtags with a vectorized group-by over the feed
+        trending = cols.hashtag_stats(None)
+        return _topics_result(_rank_by_growth('hashtag', region, trending, 'name', limit))
         
-        params = {
-            'region': region,
-            'count': 100
-        }
-        
-        response = requests.post(api_url, headers=headers, data=params, timeout=30)
+    except Exception as e:
+        logger.error(f"Error fetching trending topics: {e}")
+        return {'trending': [], 'content_gaps': []}
+
+
+def _rank_by_growth(kind: str, region: str, items: list, key: str, limit: int) -> list:
+    """
+    Sorts items by growth velocity over TRENDS_WINDOW and returns the top
+    `limit`. Sets item['growth'] (None without history) and item['new'];
+    items without history keep their order after the others.
+    """
+    try:
+        growth = timeseries.growth(kind, region, [item[key] for item in items], TRENDS_WINDOW)
+    except Exception as e:
+        logger.warning(f"Failed to read {kind} growth: {e}")
+        growth = {}
+    
+    for item in items:
+        velocity, new = growth.get(item[key]) or (None, False)
+        item['growth'] = velocity
+        item['new'] = new
+    
+    return ranking.top_k(items, limit, lambda item: item['growth'] if item['growth'] is not None else float('-inf'))
+
+
+def _topics_result(trending: list) -> dict:
+    """Adds competition/potential to ranked hashtags and picks content gaps."""
+    # Calculate competition level and identify content gaps
+    for topic in trending:
+        avg_views = topic['total_views'] / topic['count'] if topic['count'] > 0 else 0
+        avg_likes = topic['total_likes'] / topic['count'] if topic['count'] > 0 else 0
+        
+        # Competition level based on number of videos
+        if topic['count'] > 50:
+            topic['competition'] = 'ALTA'
+        elif topic['count'] > 20:
+            topic['competition'] = 'MÉDIA'
+        else:
+            topic['competition'] = 'BAIXA'
         
-        if response.status_code != 200:
-            logger.error(f"API error: {response.status_code}")
-            return {'trending': [], 'content_gaps': []}
+        topic['avg_views'] = int(avg_views)
+        topic['avg_likes'] = int(avg_likes)
         
-        result = response.json()
-        if result.get('code') != 0:
-            logger.error(f"API returned error: {result.get('msg')}")
-            return {'trending': [], 'content_gaps': []}
-        
-        videos = result.get('data', [])
-        
-        # Extract and count hashtags
-        hashtag_stats = {}
-        for video in videos:
-            title = video.get('title', '')
-            # Simple hashtag extraction
-            words = title.split()
-            for word in words:
-                if word.startswith('#'):
-                    hashtag = word.strip('#').lower()
-                    if hashtag:
-                        if hashtag not in hashtag_stats:
-                            hashtag_stats[hashtag] = {
-                                'name': hashtag,
-                                'count': 0,
-                                'total_views': 0,
-                                'total_likes': 0,
-                                'top_video': f"https://www.tiktok.com/@{video.get('author', {}).get('unique_id', 'user')}/video/{video.get('video_id')}"
-                            }
-                        hashtag_stats[hashtag]['count'] += 1
-                        hashtag_stats[hashtag]['total_views'] += video.get('play_count', 0)
-                        hashtag_stats[hashtag]['total_likes'] += video.get('digg_count', 0)
-                        
-                        # Update top video if this one has more likes
-                        if video.get('digg_count', 0) > hashtag_stats[hashtag]['total_likes'] / hashtag_stats[hashtag]['count']:
-                             hashtag_stats[hashtag]['top_video'] = f"https://www.tiktok.com/@{video.get('author', {}).get('unique_id', 'user')}/video/{video.get('video_id')}"
-        
-        # Sort by count
-        trending = sorted(hashtag_stats.values(), key=lambda x: x['count'], reverse=True)[:limit]
-        
-        # Calculate competition level and identify content gaps
-        for topic in trending:
-            avg_views = topic['total_views'] / topic['count'] if topic['count'] > 0 else 0
-            avg_likes = topic['total_likes'] / topic['count'] if topic['count'] > 0 else 0
-            
-            # Competition level based on number of videos
-            if topic['count'] > 50:
-                topic['competition'] = 'ALTA'
-            elif topic['count'] > 20:
-                topic['competition'] = 'MÉDIA'
-            else:
-                topic['competition'] = 'BAIXA'
-            
-            topic['avg_views'] = int(avg_views)
-            topic['avg_likes'] = int(avg_likes)
-            
-            # Calculate potential (high engagement, lower competition)
-            engagement_score = avg_likes / max(avg_views, 1) * 100
-            if topic['competition'] == 'BAIXA' and engagement_score > 5:
-                topic['potential'] = 'ALTO'
-            elif topic['competition'] == 'MÉDIA' and engagement_score > 3:
-                topic['potential'] = 'MÉDIO'
-            else:
-                topic['potential'] = 'BAIXO'
+        # Calculate potential (high engagement, lower competition)
+        engagement_score = avg_likes / max(avg_views, 1) * 100
+        if topic['competition'] == 'BAIXA' and engagement_score > 5:
+            topic['potential'] = 'ALTO'
+        elif topic['competition'] == 'MÉDIA' and engagement_score > 3:
+            topic['potential'] = 'MÉDIO'
+        else:
+            topic['potential'] = 'BAIXO'
+    
+    # Content gaps: topics with medium/high engagement but low competition
+    content_gaps = [t for t in trending if t['competition'] in ['BAIXA', 'MÉDIA'] and t['potential'] in ['ALTO', 'MÉDIO']]
+    
+    logger.info(f"Found {len(trending)} trending topics, {len(content_gaps)} content gaps")
+    
+    return {
+        'trending': trending,
+        'content_gaps': content_gaps[:5]  # Top 5 opportunities
+    }
+
+
+class CreatorStatsAccumulator:
+    """
+    Incrementally aggregates creator videos (best time block, best weekday,
+    hashtags, duration, totals) so long histories can be analyzed page by
+    page without keeping every video in memory. Each page is aggregated
+    with vectorized group-bys (see analytics.FeedColumns).
+    """
+    
+    def __init__(self, top_n: int = 3):
+        from collections import Counter
+        
+        self.top_n = top_n
+        self.count = 0
+        self.total_views = 0
+        self.total_likes = 0
+        self.total_comments = 0
+        self.oldest_time = None
+        self._block_sum = np.zeros(len(analytics.TIME_BLOCKS), dtype=np.int64)
+        self._block_count = np.zeros(len(analytics.TIME_BLOCKS), dtype=np.int64)
+        self._day_sum = np.zeros(len(analytics.WEEKDAYS), dtype=np.int64)
+        self._day_count = np.zeros(len(analytics.WEEKDAYS), dtype=np.int64)
+        self._hashtags = Counter()
+        self._duration_sum = 0
+        self._top = []  # min-heap of (engagement, seq, video)
+    
+    def add(self, v: dict, username: str = 'user'):
+        """Adds one video (processed dict or raw tikwm item)."""
+        self.add_page([v], username)
+    
+    def add_page(self, videos: list, username: str = 'user'):
+        """Adds a page of videos (processed dicts or raw tikwm items)."""
+        import heapq
         
-        # Content gaps: topics with medium/high engagement but low competition
-        content_gaps = [t for t in trending if t['competition'] in ['BAIXA', 'MÉDIA'] and t['potential'] in ['ALTO', 'MÉDIO']]
+        if not videos:
+            return
+        
+        cols = analytics.FeedColumns(videos, default_author=username)
+        self.count += cols.size
+        self.total_views += int(cols.play.sum())
+        self.total_likes += int(cols.digg.sum())
+        self.total_comments += int(cols.comment.sum())
+        self._duration_sum += int(cols.duration.sum())
+        
+        # Time analysis: engagement (likes + comments) per hour block and weekday
+        block, weekday, engagement = cols.time_groups()
+        if len(block):
+            oldest = int(cols.create_time[cols.create_time > 0].min())
+            self.oldest_time = oldest if self.oldest_time is None else min(self.oldest_time, oldest)
+            self._block_sum += np.bincount(block, weights=engagement, minlength=len(self._block_sum)).astype(np.int64)
+            self._block_count += np.bincount(block, minlength=len(self._block_count))
+            self._day_sum += np.bincount(weekday, weights=engagement, minlength=len(self._day_sum)).astype(np.int64)
+            self._day_count += np.bincount(weekday, minlength=len(self._day_count))
         
-        logger.info(f"Found {len(trending)} trending topics, {len(content_gaps)} content gaps")
+        # Hashtag analysis
+        if len(cols.tag_codes):
+            tag_counts = np.bincount(cols.tag_codes, minlength=len(cols.tags))
+            for tag, count in zip(cols.tags.values, tag_counts.tolist()):
+                self._hashtags[f"#{tag}"] += count
+        
+        # Top videos by engagement (likes + comments + shares): only this page's best can qualify
+        scores = cols.digg + cols.comment + cols.share
+        candidates = np.argsort(-scores, kind='stable')[:self.top_n]
+        for i in candidates.tolist():
+            score = int(scores[i])
+            if len(self._top) >= self.top_n and score <= self._top[0][0]:
+                break
+            v = videos[i]
+            video = v if isinstance(v, VideoRecord) else parse_video(v, unique_id=cols.authors.values[cols.author[i]])
+            item = (score, -(self.count - cols.size + i), video)
+            if len(self._top) < self.top_n:
+                heapq.heappush(self._top, item)
+            else:
+                heapq.heapreplace(self._top, item)
+    
+    def top_videos(self) -> list:
+        return [video for _, _, video in sorted(self._top, key=lambda x: (x[0], x[1]), reverse=True)]
+    
+    def result(self) -> dict:
+        """Returns the analysis in the analyze_creator_content format (plus totals)."""
+        if not self.count:
+            return {}
+        
+        # Best time block / weekday by average engagement
+        best_time = "N/A"
+        if self._block_count.any():
+            averages = np.where(self._block_count > 0, self._block_sum / np.maximum(self._block_count, 1), -1)
+            best_time = analytics.TIME_BLOCKS[int(averages.argmax())]
+        
+        best_day = "N/A"
+        if self._day_count.any():
+            averages = np.where(self._day_count > 0, self._day_sum / np.maximum(self._day_count, 1), -1)
+            best_day = analytics.WEEKDAYS[int(averages.argmax())]
         
         return {
-            'trending': trending,
-            'content_gaps': content_gaps[:5]  # Top 5 opportunities
+            'best_time': best_time,
+            'best_day': best_day,
+            'top_hashtags': [h for h, c in self._hashtags.most_common(5)],
+            'avg_duration': int(self._duration_sum / self.count),
+            'video_count': self.count,
+            'avg_views': self.total_views // self.count,
+            'avg_likes': self.total_likes // self.count,
+            'avg_comments': self.total_comments // self.count,
         }
-        
-    except Exception as e:
-        logger.error(f"Error fetching trending topics: {e}")
-        return {'trending': [], 'content_gaps': []}
 
 
 def analyze_creator_content(videos: list) -> dict:
@@ -619,77 +1020,95 @@ def analyze_creator_content(videos: list) -> dict:
     Analyzes a list of videos to extract insights about best times, hashtags, etc.
     
     Args:
-        videos: List of video dictionaries
+        videos: List of VideoRecords or raw tikwm items
         
     Returns:
         dict: Analysis results
     """
-    from datetime import datetime
-    from collections import Counter
-    
     if not videos:
         return {}
+    
+    acc = CreatorStatsAccumulator()
+    acc.add_page(videos)
+    
+    result = acc.result()
+    return {key: result[key] for key in ('best_time', 'best_day', 'top_hashtags', 'avg_duration')}
+
+
+def iter_creator_video_pages(username: str, max_videos: int = 200, since_days: Optional[int] = None,
+                             page_size: int = 35, page_delay: float = 0.0):
+    """
+    Pages through a creator's posts with the tikwm cursor.
+    Yields raw tikwm video items one page (list) at a time, newest first,
+    stopping after `max_videos` or once posts are older than `since_days`.
+    
+    Args:
+        username: TikTok username (with or without @)
+        max_videos: Maximum number of videos to yield in total
+        since_days: Only yield videos from the last N days (None = no limit)
+        page_size: Videos requested per page
+        page_delay: Extra pause between pages (the tikwm client already rate limits)
+    """
+    import time
+    
+    username = username.strip().lstrip('@')
+    cutoff = time.time() - since_days * 86400 if since_days else 0
+    
+    cursor = 0
+    yielded = 0
+    while yielded < max_videos:
+        params = {
+            'unique_id': username,
+            'count': min(page_size, max_videos - yielded),
+            'cursor': cursor
+        }
         
-    hour_stats = {}
-    day_stats = {}
-    hashtags = []
-    durations = []
-    
-    for v in videos:
-        # Time analysis
-        ts = v.get('create_time', 0)
-        if ts:
-            dt = datetime.fromtimestamp(ts)
-            hour = dt.hour
-            day = dt.strftime('%A') # e.g., Monday
-            
-            # Group hours into blocks
-            if 6 <= hour < 12: time_block = 'Manhã (6h-12h)'
-            elif 12 <= hour < 18: time_block = 'Tarde (12h-18h)'
-            elif 18 <= hour < 24: time_block = 'Noite (18h-00h)'
-            else: time_block = 'Madrugada (00h-6h)'
-            
-            # Engagement score (likes + comments)
-            engagement = v.get('digg_count', 0) + v.get('comment_count', 0)
-            
-            if time_block not in hour_stats: hour_stats[time_block] = []
-            hour_stats[time_block].append(engagement)
-            
-            if day not in day_stats: day_stats[day] = []
-            day_stats[day].append(engagement)
-            
-        # Hashtag analysis
-        title = v.get('title', '')
-        for word in title.split():
-            if word.startswith('#'):
-                hashtags.append(word.lower())
-                
-        # Duration analysis
-        durations.append(v.get('duration', 0))
-        
-    # Calculate best times
-    best_time = max(hour_stats.items(), key=lambda x: sum(x[1])/len(x[1]))[0] if hour_stats else "N/A"
-    
-    # Translate days
-    day_translation = {
-        'Monday': 'Segunda', 'Tuesday': 'Terça', 'Wednesday': 'Quarta',
-        'Thursday': 'Quinta', 'Friday': 'Sexta', 'Saturday': 'Sábado', 'Sunday': 'Domingo'
-    }
-    best_day_en = max(day_stats.items(), key=lambda x: sum(x[1])/len(x[1]))[0] if day_stats else "N/A"
-    best_day = day_translation.get(best_day_en, best_day_en)
+        try:
+            result = tikwm.post('/api/user/posts', params)
+        except TikwmError as e:
+            logger.error(f"Error fetching posts page for @{username} (cursor={cursor}): {e}")
+            return
+        
+        data = result.get('data', {})
+        videos = data.get('videos', [])
+        
+        # Pinned posts can be old, so only stop when a whole page is past the window
+        page = [v for v in videos if v.get('create_time', 0) >= cutoff][:max_videos - yielded]
+        if page:
+            yielded += len(page)
+            yield page
+        
+        if not data.get('hasMore') or not videos or (cutoff and not page):
+            return
+        
+        cursor = data.get('cursor', 0)
+        if page_delay:
+            time.sleep(page_delay)
+
+
+def get_creator_analysis(username: str, videos: list) -> dict:
+    """
+    Memoized analyze_creator_content, keyed by creator and latest video.
+    A new post changes the key, so results never go stale for long.
     
-    # Top hashtags
-    top_hashtags = [h for h, c in Counter(hashtags).most_common(5)]
+    Args:
+        username: TikTok username (with or without @)
+        videos: List of VideoRecords from get_creator_videos
+        
+    Returns:
+        dict: Analysis results
+    """
+    if not videos:
+        return {}
     
-    # Avg duration
-    avg_duration = sum(durations) / len(durations) if durations else 0
+    latest = max(videos, key=lambda v: v.create_time)
+    key = (username.strip().lstrip('@').lower(), latest.video_id, len(videos))
     
-    return {
-        'best_time': best_time,
-        'best_day': best_day,
-        'top_hashtags': top_hashtags,
-        'avg_duration': int(avg_duration)
-    }
+    analysis = creator_analysis_cache.get(key)
+    if analysis is None:
+        analysis = analyze_creator_content(videos)
+        creator_analysis_cache.set(key, analysis)
+    return analysis
 
 
 def get_creator_info(username: str) -> dict:
@@ -702,35 +1121,26 @@ def get_creator_info(username: str) -> dict:
     Returns:
         dict: Creator information including stats and recent videos
     """
-    import requests
-    
     # Clean username
     username = username.strip().lstrip('@')
     
+    cached = creator_info_cache.get(username.lower())
+    if cached is not None:
+        logger.info(f"Creator info for @{username} served from cache")
+        return cached
+    
     logger.info(f"Fetching creator info for @{username}")
     
     try:
-        # TikWM user info API
-        api_url = "https://www.tikwm.com/api/user/info"
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-        }
-        
         params = {
             'unique_id': username
         }
         
-        response = requests.post(api_url, headers=headers, data=params, timeout=30)
-        
-        if response.status_code != 200:
-            logger.error(f"API error: {response.status_code}")
-            return None
-        
-        result = response.json()
-        if result.get('code') != 0:
-            logger.error(f"API returned error: {result.get('msg')}")
+        # TikWM user info API
+        try:
+            result = tikwm.post('/api/user/info', params)
+        except TikwmError as e:
+            logger.error(f"API error: {e}")
             return None
         
         user_data = result.get('data', {}).get('user', {})
@@ -762,6 +1172,7 @@ def get_creator_info(username: str) -> dict:
             creator_info['engagement_rate'] = 0
         
         logger.info(f"Successfully fetched info for @{username}")
+        creator_info_cache.set(username.lower(), creator_info)
         return creator_info
         
     except Exception as e:
@@ -778,144 +1189,81 @@ def get_creator_videos(username: str, limit: int = 10) -> list:
         limit: Number of videos to return
         
     Returns:
-        list: List of video dictionaries with performance metrics
+        list: List of VideoRecords, most engaging first
     """
-    import requests
-    
     username = username.strip().lstrip('@')
     
+    cached = creator_videos_cache.get((username.lower(), limit))
+    if cached is not None:
+        logger.info(f"Videos for @{username} served from cache")
+        return cached
+    
     logger.info(f"Fetching videos for @{username}")
     
     try:
-        # Search for user's videos
-        api_url = "https://www.tikwm.com/api/user/posts"
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-        }
-        
         params = {
             'unique_id': username,
             'count': limit
         }
         
-        response = requests.post(api_url, headers=headers, data=params, timeout=30)
-        
-        if response.status_code != 200:
-            logger.error(f"API error: {response.status_code}")
-            return []
-        
-        result = response.json()
-        if result.get('code') != 0:
-            logger.error(f"API returned error: {result.get('msg')}")
+        # Search for user's videos
+        try:
+            result = tikwm.post('/api/user/posts', params)
+        except TikwmError as e:
+            logger.error(f"API error: {e}")
             return []
         
         videos = result.get('data', {}).get('videos', [])
         
-        processed_videos = []
-        for v in videos:
-            video_data = {
-                'title': v.get('title', 'Sem título'),
-                'play_count': v.get('play_count', 0),
-                'digg_count': v.get('digg_count', 0),
-                'comment_count': v.get('comment_count', 0),
-                'share_count': v.get('share_count', 0),
-                'url': f"https://www.tiktok.com/@{username}/video/{v.get('video_id')}",
-                'cover': v.get('cover', ''),
-                'create_time': v.get('create_time', 0),
-                'duration': v.get('duration', 0)
-            }
-            processed_videos.append(video_data)
+        processed_videos = parse_videos(videos, unique_id=username)
         
-        # Sort by engagement (likes + comments + shares)
-        processed_videos.sort(
-            key=lambda x: x['digg_count'] + x['comment_count'] + x['share_count'],
-            reverse=True
-        )
+        # Top by engagement (likes + comments + shares)
+        processed_videos = ranking.top_k(processed_videos, limit, 'interactions')
         
         logger.info(f"Found {len(processed_videos)} videos for @{username}")
-        return processed_videos[:limit]
+        creator_videos_cache.set((username.lower(), limit), processed_videos)
+        return processed_videos
         
     except Exception as e:
         logger.error(f"Error fetching videos for @{username}: {e}")
         return []
 
 
-def get_trending_sounds(category: str = 'all', limit: int = 15) -> list:
+def get_trending_sounds(category: str = 'all', limit: int = 15, region: str = GLOBAL_REGION) -> list:
     """
     Fetches trending sounds/music on TikTok.
     
     Args:
         category: Category filter (optional)
         limit: Number of sounds to return
+        region: Region code, or GLOBAL_REGION (default) for all supported regions
         
     Returns:
         list: List of trending sounds with usage statistics
     """
-    import requests
-    
-    logger.info(f"Fetching trending sounds (category={category}, limit={limit})")
+    logger.info(f"Fetching trending sounds (category={category}, limit={limit}, region={region})")
     
     try:
         # Get trending videos to extract popular sounds
-        api_url = "https://www.tikwm.com/api/feed/list"
+        _, cols = fetch_feed(region, 100)
         
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-        }
-        
-        params = {
-            'region': 'US',
-            'count': 100
-        }
-        
-        response = requests.post(api_url, headers=headers, data=params, timeout=30)
+        # Count sounds with a vectorized group-by over the feed, rank by growth
+        trending_sounds = _rank_by_growth('sound', region, cols.sound_stats(), 'id', limit)
         
-        if response.status_code != 200:
-            logger.error(f"API error: {response.status_code}")
-            return []
-        
-        result = response.json()
-        if result.get('code') != 0:
-            logger.error(f"API returned error: {result.get('msg')}")
-            return []
-        
-        videos = result.get('data', [])
-        
-        # Extract and count sounds
-        sound_stats = {}
-        for video in videos:
-            music = video.get('music_info', {})
-            if not music:
-                continue
-            
-            music_id = music.get('id', '')
-            if not music_id:
+        for sound in trending_sounds:
+            if sound['growth'] is not None:
+                # Usage growth per 100 feed videos per hour
+                if sound['new']:
+                    sound['status'] = '🆕 Novo'
+                elif sound['growth'] >= 1:
+                    sound['status'] = '🔥 VIRAL'
+                elif sound['growth'] > 0:
+                    sound['status'] = '📈 Em Alta'
+                else:
+                    sound['status'] = '➡️ Estável'
                 continue
             
-            if music_id not in sound_stats:
-                sound_stats[music_id] = {
-                    'id': music_id,
-                    'title': music.get('title', 'Unknown'),
-                    'author': music.get('author', 'Unknown'),
-                    'duration': music.get('duration', 0),
-                    'usage_count': 0,
-                    'total_views': 0,
-                    'total_likes': 0,
-                    'url': music.get('play', '')
-                }
-            
-            sound_stats[music_id]['usage_count'] += 1
-            sound_stats[music_id]['total_views'] += video.get('play_count', 0)
-            sound_stats[music_id]['total_likes'] += video.get('digg_count', 0)
-        
-        # Sort by usage count
-        trending_sounds = sorted(sound_stats.values(), key=lambda x: x['usage_count'], reverse=True)
-        
-        # Calculate growth indicator (simplified)
-        for sound in trending_sounds:
+            # No history yet: single-snapshot heuristic
             avg_engagement = sound['total_likes'] / max(sound['total_views'], 1) * 100
             if sound['usage_count'] > 10 and avg_engagement > 5:
                 sound['status'] = '🔥 VIRAL'
@@ -925,7 +1273,7 @@ def get_trending_sounds(category: str = 'all', limit: int = 15) -> list:
                 sound['status'] = '🆕 Novo'
         
         logger.info(f"Found {len(trending_sounds)} trending sounds")
-        return trending_sounds[:limit]
+        return trending_sounds
         
     except Exception as e:
         logger.error(f"Error fetching trending sounds: {e}")
@@ -0,0 +1,277 @@
+import os
+import json
+import time
+import logging
+import threading
+from typing import Optional
+
+import ranking
+from analytics import extract_hashtags
+from memory import governor
+from metrics import metrics
+from videos import VideoRecord
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+
+
+class HashtagIndex:
+    """
+    Inverted index from normalized hashtag to video ids, built from every
+    feed/search page the bot fetches.
+
+    Lets /viral #tag and /tendencias be answered locally while the pages
+    they need were indexed recently (`fresh_for` seconds). Videos are kept
+    for `ttl` seconds (at most `max_videos`) and the index is saved as JSON
+    in the background so it survives restarts.
+    """
+
+    def __init__(self, path: str, fresh_for: float = 900, ttl: float = 2 * 86400, max_videos: int = 20000):
+        self.path = path
+        self.fresh_for = fresh_for
+        self.ttl = ttl
+        self.max_videos = max_videos
+        self._lock = threading.Lock()
+        self._videos = {}    # video_id -> record
+        self._postings = {}  # tag -> set of video_ids
+        self._searched = {}  # "region:tag" -> when a search page for it was indexed
+        self._feeds = {}     # region -> when a feed page was indexed
+        self._dirty = False
+        self._load()
+
+    def __len__(self):
+        return len(self._videos)
+
+    @property
+    def tag_count(self) -> int:
+        return len(self._postings)
+
+    def add_items(self, items: list, region: str, hashtag: Optional[str] = None):
+        """
+        Indexes raw tikwm video items. Pass `hashtag` for search pages so
+        later searches for it can be answered from the index.
+        """
+        now = time.time()
+        with self._lock:
+            for v in items:
+                video_id = str(v.get('video_id') or '')
+                if not video_id:
+                    continue
+                author = v.get('author') or {}
+                old = self._videos.get(video_id)
+                # Hashtags whose search pages returned the video, title or not
+                searched = set(old.get('searched', ())) if old else set()
+                if hashtag:
+                    searched.add(hashtag.lower())
+                # Every region the video showed up in, not just the latest
+                regions = set(old['regions']) if old else set()
+                regions.add(region)
+                # region -> when the video was last on a feed page of it (for topic_stats)
+                feeds = dict(old.get('feeds', {})) if old else {}
+                if not hashtag:
+                    feeds[region] = now
+                record = {
+                    'title': v.get('title', 'Sem título'),
+                    'play_count': v.get('play_count', 0),
+                    'digg_count': v.get('digg_count', 0),
+                    'comment_count': v.get('comment_count', 0),
+                    'share_count': v.get('share_count', 0),
+                    'duration': v.get('duration', 0),
+                    'author': author.get('nickname', 'Desconhecido'),
+                    'unique_id': author.get('unique_id', 'user'),
+                    'cover': v.get('cover', ''),
+                    'create_time': v.get('create_time', 0),
+                    'regions': sorted(regions),
+                    'seen_at': now,
+                    # Titles don't change; only tokenize videos we haven't seen
+                    'tags': old['tags'] if old and old['title'] == v.get('title', 'Sem título') else extract_hashtags(v.get('title') or ''),
+                    'searched': sorted(searched),
+                    'feeds': feeds,
+                }
+                if old:
+                    self._unlink(video_id, old)
+                self._videos[video_id] = record
+                self._link(video_id, record)
+
+            if hashtag:
+                self._searched[f"{region}:{hashtag.lower()}"] = now
+            else:
+                self._feeds[region] = now
+            self._dirty = True
+            self._evict(now)
+
+    def search(self, hashtag: str, region: str) -> Optional[list]:
+        """
+        VideoRecords tagged `hashtag` in `region` (in their title, or
+        returned by a search for it), like search_tiktok_by_hashtag returns
+        them (unsorted). Returns None when
+        the tag wasn't searched in `region` recently, so the caller has to
+        ask the API.
+        """
+        tag = hashtag.lower()
+        now = time.time()
+        with self._lock:
+            searched = self._searched.get(f"{region}:{tag}", 0)
+            records = [(vid, self._videos[vid]) for vid in self._postings.get(tag, ())]
+        records = [(vid, r) for vid, r in records if region in r['regions']]
+
+        if now - searched > self.fresh_for or not records:
+            metrics.incr('hashtag_index_misses')
+            return None
+
+        metrics.incr('hashtag_index_hits')
+        return [
+            VideoRecord(
+                vid,
+                title=r['title'],
+                author=r['author'],
+                unique_id=r['unique_id'],
+                play_count=r['play_count'],
+                digg_count=r['digg_count'],
+                # Absent from records saved before they were indexed
+                comment_count=r.get('comment_count', 0),
+                share_count=r.get('share_count', 0),
+                create_time=r['create_time'],
+                duration=r.get('duration', 0),
+                cover=r['cover'],
+            )
+            for vid, r in records
+        ]
+
+    def topic_stats(self, region: str, limit: int) -> Optional[list]:
+        """
+        Hashtags of the videos on the latest `region` feed page, in
+        FeedColumns.hashtag_stats' format (so counts keep the single-page
+        scale the competition thresholds assume). Search pages don't count.
+        Returns None when no feed page for the region was indexed recently.
+        """
+        now = time.time()
+        with self._lock:
+            latest = self._feeds.get(region, 0)
+            if now - latest > self.fresh_for:
+                metrics.incr('hashtag_index_misses')
+                return None
+            stats = {}
+            for video_id, r in self._videos.items():
+                if r.get('feeds', {}).get(region) != latest:
+                    continue
+                for tag in r['tags']:
+                    s = stats.get(tag)
+                    if s is None:
+                        s = stats[tag] = {'name': tag, 'count': 0, 'total_views': 0, 'total_likes': 0, '_top': (-1, None)}
+                    s['count'] += 1
+                    s['total_views'] += r['play_count']
+                    s['total_likes'] += r['digg_count']
+                    if r['digg_count'] > s['_top'][0]:
+                        s['_top'] = (r['digg_count'], f"https://www.tiktok.com/@{r['unique_id']}/video/{video_id}")
+
+        metrics.incr('hashtag_index_hits')
+        trending = ranking.top_k(stats.values(), limit, lambda s: s['count'])
+        for s in trending:
+            s['top_video'] = s.pop('_top')[1]
+        return trending
+
+    def shed(self) -> int:
+        """
+        Drops the older half of the videos. Returns how many were dropped.
+        Pages are now incomplete, so nothing counts as fresh any more.
+        """
+        with self._lock:
+            oldest = sorted(self._videos, key=lambda vid: self._videos[vid]['seen_at'])
+            dropped = oldest[:len(oldest) // 2]
+            for video_id in dropped:
+                self._unlink(video_id, self._videos.pop(video_id))
+            if dropped:
+                self._searched.clear()
+                self._feeds.clear()
+                self._dirty = True
+            return len(dropped)
+
+    def save(self):
+        """Writes the index to disk if it changed since the last save."""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {
+                'videos': self._videos,
+                'searched': self._searched,
+                'feeds': self._feeds,
+            }
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                tmp_path = self.path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.path)
+                self._dirty = False
+            except OSError as e:
+                logger.warning(f"Failed to save hashtag index {self.path}: {e}")
+
+    def start(self, interval: float = 300):
+        """Saves the index every `interval` seconds in a daemon thread."""
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.save()
+                except Exception as e:
+                    logger.error(f"Hashtag index save failed: {e}")
+
+        thread = threading.Thread(target=run, name='hashtag-index', daemon=True)
+        thread.start()
+        return thread
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable hashtag index {self.path}: {e}")
+            return
+
+        self._videos = data.get('videos', {})
+        self._searched = data.get('searched', {})
+        self._feeds = data.get('feeds', {})
+        for video_id, record in self._videos.items():
+            if 'region' in record:
+                record['regions'] = [record.pop('region')]
+            self._link(video_id, record)
+        self._evict(time.time())
+
+    def _link(self, video_id: str, record: dict):
+        for tag in {*record['tags'], *record.get('searched', ())}:
+            self._postings.setdefault(tag, set()).add(video_id)
+
+    def _unlink(self, video_id: str, record: dict):
+        for tag in {*record['tags'], *record.get('searched', ())}:
+            ids = self._postings.get(tag)
+            if ids is not None:
+                ids.discard(video_id)
+                if not ids:
+                    del self._postings[tag]
+
+    def _evict(self, now: float):
+        cutoff = now - self.ttl
+        expired = [vid for vid, r in self._videos.items() if r['seen_at'] < cutoff]
+        if len(self._videos) - len(expired) > self.max_videos:
+            alive = sorted(
+                (vid for vid, r in self._videos.items() if r['seen_at'] >= cutoff),
+                key=lambda vid: self._videos[vid]['seen_at'],
+            )
+            expired.extend(alive[:len(alive) - self.max_videos])
+        for video_id in expired:
+            self._unlink(video_id, self._videos.pop(video_id))
+
+        for marks in (self._searched, self._feeds):
+            for key in [k for k, ts in marks.items() if ts < now - self.fresh_for]:
+                del marks[key]
+
+
+hashtag_index = HashtagIndex(
+    os.path.join(DATA_DIR, 'hashtag_index.json'),
+    fresh_for=int(os.getenv('HASHTAG_INDEX_FRESH_MINUTES', 15)) * 60,
+)
+governor.register_cache('hashtag_index', hashtag_index.shed)
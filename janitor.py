@@ -0,0 +1,126 @@
+import os
+import re
+import time
+import logging
+import threading
+
+from metrics import metrics
+from memory import MB
+
+logger = logging.getLogger(__name__)
+
+# yt-dlp leftovers: .part, .ytdl, .part-Frag12, .temp, unmerged .f137.mp4 streams
+FRAGMENT_PATTERN = re.compile(r'(\.part(-Frag\d+)?|\.ytdl|\.temp|\.f\d+\.\w+)$')
+
+
+class DownloadsJanitor:
+    """
+    Keeps downloads/ bounded when the normal cleanup in the handlers
+    doesn't run (crash, OOM kill, cancelled task, failed yt-dlp run).
+
+    Each sweep removes yt-dlp fragments older than `fragment_ttl`, any file
+    older than `ttl`, and then least recently used files until the directory
+    fits in `quota_bytes`. Files touched in the last `grace` seconds are
+    considered in use and never deleted by the quota pass.
+    """
+
+    def __init__(self, directory: str = 'downloads', quota_bytes: int = 500 * MB,
+                 ttl: float = 3600, fragment_ttl: float = 600, grace: float = 120):
+        self.directory = directory
+        self.quota_bytes = quota_bytes
+        self.ttl = ttl
+        self.fragment_ttl = fragment_ttl
+        self.grace = grace
+        self._thread = None
+
+    def _files(self) -> list:
+        files = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    try:
+                        if entry.is_file(follow_symlinks=False):
+                            st = entry.stat(follow_symlinks=False)
+                            files.append((entry.path, st.st_size, max(st.st_atime, st.st_mtime), st.st_mtime))
+                    except OSError:
+                        continue
+        except FileNotFoundError:
+            pass
+        return files
+
+    def _remove(self, path: str, size: int, reason: str) -> int:
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.warning(f"Janitor failed to remove {path}: {e}")
+            return 0
+        logger.info(f"Janitor removed {path} ({size} bytes, {reason})")
+        return size
+
+    def sweep(self, everything: bool = False) -> int:
+        """
+        Runs one cleanup pass.
+
+        Args:
+            everything: Remove every file (used at startup, when nothing can be in use)
+
+        Returns:
+            int: Bytes reclaimed
+        """
+        now = time.time()
+        reclaimed = 0
+        kept = []
+
+        for path, size, last_used, mtime in self._files():
+            age = now - mtime
+            if everything:
+                reclaimed += self._remove(path, size, 'startup')
+            elif FRAGMENT_PATTERN.search(path) and age > self.fragment_ttl:
+                reclaimed += self._remove(path, size, 'fragment')
+            elif age > self.ttl:
+                reclaimed += self._remove(path, size, 'stale')
+            else:
+                kept.append((path, size, last_used))
+
+        total = sum(size for _, size, _ in kept)
+        if total > self.quota_bytes:
+            # Oldest first
+            for path, size, last_used in sorted(kept, key=lambda f: f[2]):
+                if total <= self.quota_bytes:
+                    break
+                if now - last_used < self.grace:
+                    continue
+                freed = self._remove(path, size, 'quota')
+                reclaimed += freed
+                total -= freed
+
+        if reclaimed:
+            logger.info(f"Janitor reclaimed {reclaimed / MB:.1f} MB from {self.directory}/")
+            metrics.incr('janitor_reclaimed_bytes', reclaimed)
+        return reclaimed
+
+    def usage(self) -> int:
+        """Returns the bytes currently used by the directory."""
+        return sum(size for _, size, _, _ in self._files())
+
+    def start(self, interval: float = 300):
+        """Starts a daemon thread that sweeps every `interval` seconds."""
+        if self._thread:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.warning(f"Janitor sweep failed: {e}")
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+
+janitor = DownloadsJanitor(
+    quota_bytes=int(os.getenv('DOWNLOADS_QUOTA_MB', 500)) * MB,
+    ttl=int(os.getenv('DOWNLOADS_TTL_MINUTES', 60)) * 60,
+)
@@ -0,0 +1,85 @@
+import time
+import shutil
+import logging
+import threading
+from collections import OrderedDict
+
+from memory import MB
+
+logger = logging.getLogger(__name__)
+
+
+class RecentMediaCache:
+    """
+    Keeps the last few downloaded videos (open spool files) for a short time,
+    so follow-up actions like "audio only" don't download them again.
+    Entries are closed when evicted, expired or shed.
+    """
+
+    def __init__(self, max_items: int = 3, max_bytes: int = 40 * MB, ttl: float = 600):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def put(self, key: str, media) -> bool:
+        """
+        Stores an open binary file under `key`. The cache takes ownership.
+        Returns False (and closes nothing) if the file is too big to keep.
+        """
+        size = media.seek(0, 2)
+        media.seek(0)
+        if size > self.max_bytes:
+            return False
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                old[0].close()
+            self._entries[key] = (media, size, time.monotonic())
+            self._evict()
+        return True
+
+    def copy_to(self, key: str, dest) -> bool:
+        """Copies the cached file for `key` into the writable file `dest`."""
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if not entry:
+                self.misses += 1
+                return False
+            self._entries.move_to_end(key)
+            media = entry[0]
+            media.seek(0)
+            shutil.copyfileobj(media, dest)
+            media.seek(0)
+            self.hits += 1
+            return True
+
+    def shed(self) -> int:
+        """Closes every entry. Returns how many were dropped."""
+        with self._lock:
+            count = len(self._entries)
+            for media, _, _ in self._entries.values():
+                media.close()
+            self._entries.clear()
+            return count
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        for key in [k for k, (_, _, ts) in self._entries.items() if ts < cutoff]:
+            self._entries.pop(key)[0].close()
+
+    def _evict(self):
+        self._expire()
+        total = sum(size for _, size, _ in self._entries.values())
+        while self._entries and (len(self._entries) > self.max_items or total > self.max_bytes):
+            _, (media, size, _) = self._entries.popitem(last=False)
+            media.close()
+            total -= size
@@ -0,0 +1,179 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+def current_rss() -> int:
+    """Returns the resident set size of this process in bytes."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # Not Linux: fall back to the peak RSS, which is better than nothing
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class MemoryGovernor:
+    """
+    Keeps the process under the VM memory limit.
+
+    Jobs declare a projected cost (estimated file size, feed size) with
+    `budget()`. Heavy jobs wait while RSS plus outstanding reservations is
+    above the admission watermark; above the shed watermark registered
+    caches are asked to drop entries. Caches the event loop owns are shed
+    on the loop (see `attach_loop`), never from the monitor thread.
+    """
+
+    def __init__(self, limit_bytes: int, admit_watermark: float = 0.70,
+                 shed_watermark: float = 0.80, heavy_bytes: int = 20 * MB):
+        self.limit_bytes = limit_bytes
+        self.admit_watermark = admit_watermark
+        self.shed_watermark = shed_watermark
+        self.heavy_bytes = heavy_bytes
+        self._reserved = 0
+        self._caches = {}
+        self._cond = threading.Condition()
+        self._monitor = None
+        self._loop = None
+        self._loop_thread = None
+
+    @property
+    def reserved(self) -> int:
+        return self._reserved
+
+    def register_cache(self, name: str, shed: Callable[[], int], on_loop: bool = False):
+        """
+        Registers a cache that can be shed under pressure.
+
+        Args:
+            name: Name used in logs and metrics
+            shed: Callable that drops entries and returns how many were dropped
+            on_loop: The cache is only touched by the event loop (e.g. a plain
+                dict of the handlers), so `shed` must run on the loop too
+        """
+        self._caches[name] = (shed, on_loop)
+
+    def attach_loop(self, loop: asyncio.AbstractEventLoop):
+        """Sets the loop that sheds on_loop caches. Call it from that loop."""
+        self._loop = loop
+        self._loop_thread = threading.get_ident()
+
+    def projected(self) -> int:
+        return current_rss() + self._reserved
+
+    @contextmanager
+    def budget(self, cost: int, label: str = 'job', timeout: float = 60):
+        """
+        Reserves `cost` bytes for the duration of the block.
+
+        Heavy jobs (cost >= heavy_bytes) wait up to `timeout` seconds for the
+        projected usage to fall under the admission watermark; after that they
+        run anyway rather than failing the user. Light jobs never wait.
+        """
+        if cost >= self.heavy_bytes:
+            self._wait_for_room(cost, label, timeout)
+
+        with self._cond:
+            self._reserved += cost
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._reserved -= cost
+                self._cond.notify_all()
+
+    def _wait_for_room(self, cost: int, label: str, timeout: float):
+        limit = self.limit_bytes * self.admit_watermark
+        if self.projected() + cost <= limit:
+            return
+
+        self.shed()
+        logger.warning(f"Memory pressure: pausing {label} ({cost // MB} MB projected, {self.projected() // MB} MB in use)")
+        metrics.incr('memory_paused_jobs')
+        started = time.monotonic()
+        deadline = started + timeout
+
+        with self._cond:
+            while self.projected() + cost > limit:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning(f"Memory budget wait for {label} timed out, proceeding anyway")
+                    break
+                self._cond.wait(min(remaining, 1.0))
+
+        metrics.observe('memory_pause_seconds', time.monotonic() - started)
+
+    def shed(self) -> int:
+        """
+        Asks every registered cache to drop entries. Returns entries dropped;
+        on_loop caches called from another thread are shed later on the
+        loop and not counted.
+        """
+        total = 0
+        for name, (shed, on_loop) in list(self._caches.items()):
+            if on_loop and self._loop is not None and threading.get_ident() != self._loop_thread:
+                self._loop.call_soon_threadsafe(self._shed_cache, name, shed)
+                continue
+            total += self._shed_cache(name, shed)
+        return total
+
+    def _shed_cache(self, name: str, shed: Callable[[], int]) -> int:
+        try:
+            dropped = shed()
+        except Exception as e:
+            logger.warning(f"Failed to shed cache {name}: {e}")
+            return 0
+        if dropped:
+            logger.info(f"Memory pressure: shed {dropped} entries from {name}")
+            metrics.incr(f'memory_shed_{name}', dropped)
+        return dropped
+
+    def check(self):
+        """Samples RSS and sheds caches if above the shed watermark."""
+        rss = current_rss()
+        metrics.observe('rss_bytes', rss)
+        if rss > self.limit_bytes * self.shed_watermark:
+            logger.warning(f"RSS {rss // MB} MB above shed watermark, shedding caches")
+            self.shed()
+        with self._cond:
+            self._cond.notify_all()
+
+    def start_monitor(self, interval: float = 10):
+        """Starts a daemon thread that calls check() every `interval` seconds."""
+        if self._monitor:
+            return
+
+        def run():
+            while True:
+                try:
+                    self.check()
+                except Exception as e:
+                    logger.warning(f"Memory check failed: {e}")
+                time.sleep(interval)
+
+        self._monitor = threading.Thread(target=run, daemon=True)
+        self._monitor.start()
+
+
+def shed_oldest(cache: dict, fraction: float = 0.5) -> int:
+    """Drops the oldest `fraction` of an insertion-ordered dict. Returns entries dropped."""
+    count = int(len(cache) * fraction)
+    for key in list(cache)[:count]:
+        cache.pop(key, None)
+    return count
+
+
+governor = MemoryGovernor(limit_bytes=int(os.getenv('MEMORY_LIMIT_MB', 512)) * MB)
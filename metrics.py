@@ -0,0 +1,70 @@
+import time
+import threading
+from collections import deque
+
+
+class RollingWindow:
+    """
+    Keeps (timestamp, value) samples for the last `window` seconds.
+    Cheap enough to call from handlers and executor threads.
+    """
+
+    def __init__(self, window: float = 3600, max_samples: int = 5000):
+        self.window = window
+        self._samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def add(self, value: float):
+        with self._lock:
+            self._samples.append((time.monotonic(), value))
+
+    def values(self) -> list:
+        cutoff = time.monotonic() - self.window
+        with self._lock:
+            while self._samples and self._samples[0][0] < cutoff:
+                self._samples.popleft()
+            return [v for _, v in self._samples]
+
+    def percentile(self, p: float):
+        """Returns the p-th percentile (0-100) of the window, or None if empty."""
+        values = sorted(self.values())
+        if not values:
+            return None
+        index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+        return values[index]
+
+    def count(self) -> int:
+        return len(self.values())
+
+
+class Metrics:
+    """In-process counters and rolling windows, no external service needed."""
+
+    def __init__(self):
+        self._counters = {}
+        self._windows = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def incr(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def observe(self, name: str, value: float):
+        self.window(name).add(value)
+
+    def counter(self, name: str) -> int:
+        return self._counters.get(name, 0)
+
+    def window(self, name: str) -> RollingWindow:
+        with self._lock:
+            if name not in self._windows:
+                self._windows[name] = RollingWindow()
+            return self._windows[name]
+
+    def counters(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
+
+
+metrics = Metrics()
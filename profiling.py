@@ -0,0 +1,218 @@
+import io
+import os
+import sys
+import time
+import marshal
+import pstats
+import asyncio
+import cProfile
+import logging
+import tempfile
+import threading
+import tracemalloc
+import weakref
+from collections import Counter
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Longest CPU profiling/sampling session, whatever is asked for
+MAX_SECONDS = 120
+
+# Frames kept per allocation while tracemalloc is on
+TRACEMALLOC_FRAMES = 25
+
+# Lines per text report
+TOP_LINES = 40
+
+
+class ProfilerBusy(Exception):
+    """Another CPU profiling or sampling session is already running."""
+    pass
+
+
+class Profiler:
+    """
+    On-demand diagnostics for a bot that is misbehaving in production:
+
+    - cpu_profile: cProfile on the event loop thread (where the handlers run)
+      for a few seconds, as a pstats report and a .prof file for snakeviz.
+    - sample: periodic stacks of every thread (executor downloads included),
+      as folded stacks for flamegraph.pl / speedscope.
+    - memory_snapshot: tracemalloc top allocations and the diff since the
+      previous snapshot. Tracing is only on between the first call and
+      memory_stop, since it slows every allocation down.
+    - task_dump: every pending asyncio task with its stack and age.
+
+    Results are (filename, bytes) pairs, ready to send as documents.
+    Nothing runs until asked; `install` only stamps task creation times.
+    """
+
+    def __init__(self, max_seconds: float = MAX_SECONDS):
+        self.max_seconds = max_seconds
+        self.loop = None
+        self._session = threading.Lock()
+        self._created = weakref.WeakKeyDictionary()  # task -> monotonic creation time
+        self._snapshot = None
+
+    def install(self, loop: asyncio.AbstractEventLoop):
+        """Records the creation time of the tasks `loop` creates from now on (for task ages)."""
+        self.loop = loop
+        previous = loop.get_task_factory()
+
+        def factory(loop, coro, **kwargs):
+            task = previous(loop, coro, **kwargs) if previous else asyncio.Task(coro, loop=loop, **kwargs)
+            self._created[task] = time.monotonic()
+            return task
+
+        loop.set_task_factory(factory)
+
+    def clamp(self, seconds: float) -> float:
+        return max(1.0, min(float(seconds), self.max_seconds))
+
+    def _acquire(self):
+        if not self._session.acquire(blocking=False):
+            raise ProfilerBusy()
+
+    async def cpu_profile(self, seconds: float) -> list:
+        """Profiles the event loop thread for `seconds`. Must run on the loop."""
+        seconds = self.clamp(seconds)
+        self._acquire()
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profile.disable()
+        finally:
+            self._session.release()
+
+        report = io.StringIO()
+        stats = pstats.Stats(profile, stream=report)
+        report.write(f"cProfile of the event loop thread, {seconds:.0f}s\n\n")
+        stats.sort_stats('cumulative').print_stats(TOP_LINES)
+        stats.sort_stats('tottime').print_stats(TOP_LINES)
+        stamp = _stamp()
+        return [
+            (f"cpu-{stamp}.txt", report.getvalue().encode()),
+            (f"cpu-{stamp}.prof", marshal.dumps(stats.stats)),
+        ]
+
+    def sample(self, seconds: float, interval: float = 0.01) -> list:
+        """Samples every thread's stack for `seconds` (blocking; run it in an executor)."""
+        seconds = self.clamp(seconds)
+        self._acquire()
+        try:
+            me = threading.get_ident()
+            names = {}
+            stacks = Counter()
+            samples = 0
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    if ident not in names:
+                        names.update((t.ident, t.name) for t in threading.enumerate())
+                    stack = []
+                    while frame is not None:
+                        stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                        frame = frame.f_back
+                    stack.append(names.get(ident, str(ident)))
+                    stacks[';'.join(reversed(stack))] += 1
+                samples += 1
+                time.sleep(interval)
+        finally:
+            self._session.release()
+
+        folded = ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        logger.info(f"Sampled {samples} stacks per thread over {seconds:.0f}s")
+        return [(f"samples-{_stamp()}.folded", folded.encode())]
+
+    def memory_snapshot(self) -> list:
+        """
+        Starts tracemalloc on the first call (returns []); later calls return
+        the top allocations, the diff since the previous snapshot and the
+        raw snapshot (tracemalloc.Snapshot.load).
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._snapshot = None
+            logger.info("tracemalloc started")
+            return []
+
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        stamp = _stamp()
+
+        top = io.StringIO()
+        top.write(f"Traced: {current / 2**20:.1f} MiB now, {peak / 2**20:.1f} MiB peak\n\n")
+        for stat in snapshot.statistics('lineno')[:TOP_LINES]:
+            top.write(f"{stat}\n")
+        files = [(f"memory-{stamp}.txt", top.getvalue().encode())]
+
+        if self._snapshot is not None:
+            diff = io.StringIO()
+            diff.write("Growth since the previous snapshot\n\n")
+            for stat in snapshot.compare_to(self._snapshot, 'lineno')[:TOP_LINES]:
+                diff.write(f"{stat}\n")
+            files.append((f"memory-diff-{stamp}.txt", diff.getvalue().encode()))
+
+        with tempfile.NamedTemporaryFile(suffix='.snapshot') as f:
+            snapshot.dump(f.name)
+            files.append((f"memory-{stamp}.snapshot", f.read()))
+
+        self._snapshot = snapshot
+        return files
+
+    def memory_stop(self):
+        """Stops tracemalloc and drops the kept snapshot."""
+        tracemalloc.stop()
+        self._snapshot = None
+        logger.info("tracemalloc stopped")
+
+    async def task_dump(self) -> list:
+        """Every pending asyncio task, oldest first, with its stack. Must run on the loop."""
+        now = time.monotonic()
+        current = asyncio.current_task()
+        tasks = sorted(asyncio.all_tasks(), key=lambda t: self._created.get(t, 0))
+
+        out = io.StringIO()
+        out.write(f"{len(tasks)} pending tasks\n")
+        for task in tasks:
+            created = self._created.get(task)
+            age = f"{now - created:.1f}s" if created is not None else 'unknown'
+            marker = ' (this dump)' if task is current else ''
+            out.write(f"\n--- {task.get_name()}, age {age}{marker}\n{task.get_coro()!r}\n")
+            task.print_stack(file=out)
+        return [(f"tasks-{_stamp()}.txt", out.getvalue().encode())]
+
+    def collect(self, what: str, seconds: float, timeout: Optional[float] = None) -> list:
+        """
+        Runs one diagnostic ('cpu', 'sample', 'memory', 'memory-stop' or
+        'tasks') from a thread other than the loop's, e.g. the health server's.
+        """
+        if what in ('cpu', 'tasks'):
+            if self.loop is None:
+                raise RuntimeError("Profiler is not installed on the event loop")
+            coro = self.cpu_profile(seconds) if what == 'cpu' else self.task_dump()
+            return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout or self.max_seconds + 30)
+        if what == 'sample':
+            return self.sample(seconds)
+        if what == 'memory':
+            return self.memory_snapshot() or [('memory.txt', b"tracemalloc started; ask again for a snapshot\n")]
+        if what == 'memory-stop':
+            self.memory_stop()
+            return []
+        raise ValueError(f"Unknown diagnostic {what!r}")
+
+
+def _stamp() -> str:
+    return time.strftime('%Y%m%d-%H%M%S')
+
+
+profiler = Profiler()
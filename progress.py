@@ -0,0 +1,143 @@
+import time
+import logging
+import asyncio
+from collections import OrderedDict
+from typing import Optional
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def format_bytes(num: float) -> str:
+    """Formats a byte count as a short human readable string."""
+    if num >= 1024 * 1024:
+        return f"{num / (1024 * 1024):.1f} MB"
+    elif num >= 1024:
+        return f"{num / 1024:.0f} KB"
+    return f"{int(num)} B"
+
+
+class ChatEditThrottle:
+    """
+    Coalesces message edits so each chat gets at most one edit every
+    `min_interval` seconds. Only the latest pending text for a message is
+    sent; intermediate updates are dropped. Each chat has one timer and
+    one queue, so several status messages in a chat take turns.
+    """
+
+    def __init__(self, min_interval: float = 2.0):
+        self.min_interval = min_interval
+        self._last_edit = {}
+        self._pending = {}  # chat_id -> OrderedDict message_id -> (message, text, parse_mode)
+        self._handles = {}  # chat_id -> timer handle
+
+    def submit(self, message, text: str, parse_mode: Optional[str] = None):
+        """Schedules `message.edit_text(text)` respecting the per-chat interval."""
+        chat_id = message.chat_id
+        # A message already waiting keeps its turn; only its text is replaced
+        self._pending.setdefault(chat_id, OrderedDict())[message.message_id] = (message, text, parse_mode)
+        if chat_id not in self._handles:
+            self._schedule(chat_id)
+
+    def cancel(self, message):
+        """Drops any pending edit for `message` (e.g. before a final edit)."""
+        chat_id = message.chat_id
+        pending = self._pending.get(chat_id)
+        if pending is None:
+            return
+        pending.pop(message.message_id, None)
+        if not pending:
+            del self._pending[chat_id]
+            handle = self._handles.pop(chat_id, None)
+            if handle:
+                handle.cancel()
+
+    def _schedule(self, chat_id):
+        delay = max(0.0, self._last_edit.get(chat_id, 0) + self.min_interval - time.monotonic())
+        self._handles[chat_id] = asyncio.get_running_loop().call_later(delay, self._flush, chat_id)
+
+    def _flush(self, chat_id):
+        self._handles.pop(chat_id, None)
+        pending = self._pending.get(chat_id)
+        if not pending:
+            return
+
+        # Longest waiting message first; the rest wait for the next slot
+        _, (message, text, parse_mode) = pending.popitem(last=False)
+        self._last_edit[chat_id] = time.monotonic()
+        if pending:
+            self._schedule(chat_id)
+        else:
+            del self._pending[chat_id]
+        metrics.incr('progress_edits')
+        asyncio.get_running_loop().create_task(self._edit(message, text, parse_mode))
+
+    @staticmethod
+    async def _edit(message, text, parse_mode):
+        try:
+            await message.edit_text(text, parse_mode=parse_mode)
+        except Exception as e:
+            logger.debug(f"Progress edit failed: {e}")
+
+
+class ProgressReporter:
+    """
+    Turns byte-level progress events into throttled `status_msg` edits.
+
+    `callback` may be called from executor threads (yt-dlp hooks, the
+    direct-download chunk loop); events are forwarded to the event loop.
+    """
+
+    def __init__(self, status_msg, throttle: ChatEditThrottle, label: str = "⏳ Baixando vídeo..."):
+        self.status_msg = status_msg
+        self.throttle = throttle
+        self.label = label
+        self.downloaded = 0
+        self._loop = asyncio.get_running_loop()
+        self._closed = False
+        self._last_forward = 0.0
+
+    def callback(self, downloaded: int, total: Optional[int] = None):
+        """Progress hook: `downloaded` bytes so far out of `total` (if known)."""
+        if self._closed:
+            return
+        
+        # Chunk loops call this every few KB; only hop to the loop a few times per second
+        now = time.monotonic()
+        if now - self._last_forward < 0.25 and (not total or downloaded < total):
+            return
+        self._last_forward = now
+        self._loop.call_soon_threadsafe(self._update, downloaded, total)
+
+    def _update(self, downloaded, total):
+        if self._closed:
+            return
+
+        # Retries restart from zero; only count bytes we haven't seen yet
+        if downloaded > self.downloaded:
+            metrics.incr('download_bytes', downloaded - self.downloaded)
+        self.downloaded = downloaded
+
+        if total:
+            percent = min(100, int(downloaded * 100 / total))
+            text = f"{self.label}\n\n{percent}% ({format_bytes(downloaded)} de {format_bytes(total)})"
+        else:
+            text = f"{self.label}\n\n{format_bytes(downloaded)} baixados"
+
+        self.throttle.submit(self.status_msg, text)
+
+    def set_label(self, label: str):
+        """Changes the label shown above the progress (thread-safe), e.g. when switching to a fallback."""
+        self._loop.call_soon_threadsafe(self._set_label, label)
+
+    def _set_label(self, label: str):
+        if self._closed:
+            return
+        self.label = label
+        self.throttle.submit(self.status_msg, label)
+
+    def close(self):
+        """Stops reporting and drops pending edits so they can't overwrite later messages."""
+        self._closed = True
+        self.throttle.cancel(self.status_msg)
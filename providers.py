@@ -0,0 +1,178 @@
+import time
+import random
+import logging
+import threading
+
+from metrics import RollingWindow, metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class ContentError(Exception):
+    """
+    The provider answered, but the content itself can't be downloaded
+    (private, removed, login required). Not counted against its health.
+    """
+    pass
+
+
+class ProviderStats:
+    """
+    Rolling outcomes of one download provider plus its circuit breaker.
+
+    After `failure_threshold` consecutive failures the breaker opens for
+    `cooldown` seconds (doubling on every failed probe, up to
+    `max_cooldown`); then a single half-open probe decides whether it
+    closes again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, cooldown: float = 60, max_cooldown: float = 900):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.outcomes = RollingWindow()  # 1 = success, 0 = failure
+        self.success_seconds = RollingWindow()
+        self.failure_seconds = RollingWindow()
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.cooldown = cooldown
+        self.opened_at = 0.0
+        self.probing = False
+
+    def success_rate(self) -> float:
+        """Success rate with a Laplace prior, so new providers start at 50%+."""
+        outcomes = self.outcomes.values()
+        return (sum(outcomes) + 1) / (len(outcomes) + 2)
+
+    def expected_cost(self, default_seconds: float = 10.0) -> float:
+        """
+        Expected seconds spent per successful download when this provider
+        is tried: (p * success time + (1 - p) * failure time) / p.
+        Sorting by this minimizes the expected time-to-success of a chain.
+        """
+        p = self.success_rate()
+        success_time = self.success_seconds.percentile(50) or default_seconds
+        failure_time = self.failure_seconds.percentile(50) or default_seconds
+        return (p * success_time + (1 - p) * failure_time) / p
+
+    def available(self, now: float) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and now - self.opened_at >= self.cooldown:
+            self.state = HALF_OPEN
+        return self.state == HALF_OPEN and not self.probing
+
+
+class ProviderHealth:
+    """
+    Health of every download provider (yt-dlp per platform, TikWM, SnapTik,
+    SnapInsta), used to order fallbacks by expected time-to-success and to
+    skip providers whose circuit breaker is open.
+
+    With probability `explore` a random other provider goes first, so
+    providers that lost the lead once keep getting measured.
+    """
+
+    def __init__(self, explore: float = 0.05):
+        self.explore = explore
+        self._providers = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> ProviderStats:
+        with self._lock:
+            if name not in self._providers:
+                self._providers[name] = ProviderStats(name)
+            return self._providers[name]
+
+    def order(self, names: list) -> list:
+        """
+        Returns the available providers of `names`, cheapest expected cost
+        first (ties keep the given order). If every breaker is open, all of
+        them are returned so the request still gets a chance.
+        """
+        now = time.monotonic()
+        stats = [self.get(name) for name in names]
+        with self._lock:
+            available = [s for s in stats if s.available(now)]
+        ranked = sorted(available or stats, key=lambda s: s.expected_cost())
+        if len(ranked) > 1 and random.random() < self.explore:
+            ranked.insert(0, ranked.pop(random.randrange(1, len(ranked))))
+        return [s.name for s in ranked]
+
+    def is_open(self, name: str) -> bool:
+        """True while `name`'s breaker is open and not yet due for a probe."""
+        stats = self.get(name)
+        with self._lock:
+            return not stats.available(time.monotonic())
+
+    def call(self, name: str, fn, *args, **kwargs):
+        """
+        Runs `fn(*args, **kwargs)` as provider `name`, recording the outcome.
+        ContentError is re-raised without counting as a failure.
+        """
+        stats = self.get(name)
+        with self._lock:
+            if stats.state == HALF_OPEN:
+                stats.probing = True
+
+        started = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except ContentError:
+            # The user's link is at fault, not the provider: a half-open probe may run again
+            with self._lock:
+                stats.probing = False
+            raise
+        except Exception:
+            self._record(stats, False, time.monotonic() - started)
+            raise
+        self._record(stats, True, time.monotonic() - started)
+        return result
+
+    def _record(self, stats: ProviderStats, ok: bool, seconds: float):
+        stats.outcomes.add(1 if ok else 0)
+        (stats.success_seconds if ok else stats.failure_seconds).add(seconds)
+        metrics.incr(f"provider_{stats.name}_{'success' if ok else 'failure'}")
+
+        with self._lock:
+            was_probe = stats.probing
+            stats.probing = False
+            if ok:
+                if stats.state != CLOSED:
+                    logger.info(f"Provider {stats.name} recovered, closing its circuit")
+                stats.state = CLOSED
+                stats.consecutive_failures = 0
+                stats.cooldown = stats.base_cooldown
+                return
+
+            stats.consecutive_failures += 1
+            if was_probe:
+                stats.cooldown = min(stats.cooldown * 2, stats.max_cooldown)
+            if was_probe or (stats.state == CLOSED and stats.consecutive_failures >= stats.failure_threshold):
+                stats.state = OPEN
+                stats.opened_at = time.monotonic()
+                logger.warning(f"Provider {stats.name} failing, circuit open for {stats.cooldown:.0f}s")
+
+    def snapshot(self) -> dict:
+        """Per-provider state, success rate and latency percentiles (for /stats)."""
+        with self._lock:
+            providers = list(self._providers.values())
+        return {
+            s.name: {
+                'state': s.state,
+                'success_rate': s.success_rate(),
+                'attempts': s.outcomes.count(),
+                'successes': int(sum(s.outcomes.values())),
+                'p50': s.success_seconds.percentile(50),
+                'p95': s.success_seconds.percentile(95),
+            }
+            for s in providers
+        }
+
+
+provider_health = ProviderHealth()
@@ -0,0 +1,87 @@
+import time
+import heapq
+from typing import Callable, Optional, Union
+
+# Hacker News style gravity for the recency-decayed viral score
+VIRAL_GRAVITY = 1.5
+
+
+def _interactions(v) -> int:
+    return v.digg_count + v.comment_count + v.share_count
+
+
+def _engagement_rate(v) -> float:
+    return _interactions(v) / max(v.play_count, 1)
+
+
+def _viral(v, now: float) -> float:
+    # Comments and shares signal more than likes; older videos decay
+    age_hours = max(0.0, now - v.create_time) / 3600
+    return (v.digg_count + 2 * v.comment_count + 3 * v.share_count) / (age_hours + 2) ** VIRAL_GRAVITY
+
+
+# Score functions over VideoRecords: fn(video, now) -> number, higher is better
+SCORES = {
+    'likes': lambda v, now: v.digg_count,
+    'views': lambda v, now: v.play_count,
+    'date': lambda v, now: v.create_time,
+    'interactions': lambda v, now: _interactions(v),
+    'engagement': lambda v, now: _engagement_rate(v),
+    'viral': _viral,
+}
+
+Score = Union[str, Callable]
+
+
+def score_key(score: Score, now: Optional[float] = None) -> Callable:
+    """
+    Returns a one-argument key function for `score`: a SCORES name
+    (unknown names fall back to likes) or a callable taking the item.
+    """
+    if callable(score):
+        return score
+    fn = SCORES.get(score, SCORES['likes'])
+    now = now if now is not None else time.time()
+    return lambda v: fn(v, now)
+
+
+def top_k(items, k: Optional[int], score: Score = 'likes', now: Optional[float] = None) -> list:
+    """
+    The `k` best items by `score`, best first, in O(n log k). Ties keep
+    input order, like a stable sort. k=None ranks everything.
+    """
+    key = score_key(score, now)
+    if k is None:
+        return sorted(items, key=key, reverse=True)
+    return heapq.nlargest(k, items, key=key)
+
+
+def top_k_recent(items, k: int, cutoff: float, score: Score = 'likes', now: Optional[float] = None) -> tuple:
+    """
+    One pass over `items` that keeps two bounded heaps: the top `k` of the
+    items created at or after `cutoff`, and the top `k` of all items.
+
+    Returns (ranked, recent_count): the recent top-k when there are at
+    least `k` recent items, otherwise the overall top-k (fallback).
+    """
+    key = score_key(score, now)
+    recent, overall = [], []
+    recent_count = 0
+
+    # (score, -index) keeps earlier items ahead on ties
+    for index, item in enumerate(items):
+        entry = (key(item), -index, item)
+        if len(overall) < k:
+            heapq.heappush(overall, entry)
+        elif entry[:2] > overall[0][:2]:
+            heapq.heapreplace(overall, entry)
+
+        if item.create_time >= cutoff:
+            recent_count += 1
+            if len(recent) < k:
+                heapq.heappush(recent, entry)
+            elif entry[:2] > recent[0][:2]:
+                heapq.heapreplace(recent, entry)
+
+    chosen = recent if recent_count >= k else overall
+    return [item for _, _, item in sorted(chosen, key=lambda e: e[:2], reverse=True)], recent_count
@@ -0,0 +1,210 @@
+import os
+import json
+import shutil
+import logging
+import asyncio
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from downloader import download_sound, DownloadError
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+FFMPEG = shutil.which('ffmpeg')
+
+# Seconds a prefetched sound waits for a send to claim it before its file is removed
+PREFETCH_TTL = 120
+
+
+def normalize_audio(src_path: str) -> str:
+    """
+    Re-encodes a sound to loudness-normalized 128k MP3 with ffmpeg.
+    Returns the new path (the source is removed), or the source if ffmpeg
+    is not installed or fails.
+    """
+    if not FFMPEG:
+        return src_path
+
+    out_path = os.path.splitext(src_path)[0] + '_norm.mp3'
+    cmd = [
+        FFMPEG, '-y', '-hide_banner', '-loglevel', 'error',
+        '-i', src_path, '-vn',
+        '-af', 'loudnorm=I=-16:TP=-1.5:LRA=11',
+        '-ac', '2', '-ar', '44100', '-b:a', '128k',
+        out_path,
+    ]
+    try:
+        subprocess.run(cmd, check=True, timeout=60, capture_output=True)
+    except (subprocess.SubprocessError, OSError) as e:
+        logger.warning(f"ffmpeg normalization failed for {src_path}: {e}")
+        if os.path.exists(out_path):
+            os.remove(out_path)
+        return src_path
+
+    os.remove(src_path)
+    return out_path
+
+
+def prepare_sound(music_id: str, url: str) -> str:
+    """Downloads and normalizes a sound. Runs in the sound worker pool."""
+    return normalize_audio(download_sound(url, music_id))
+
+
+class FileIdCache:
+    """Telegram file_id per key, persisted as JSON so it survives restarts."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = {}
+        try:
+            with open(path, encoding='utf-8') as f:
+                self._data = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable file_id cache {path}: {e}")
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: str) -> Optional[str]:
+        return self._data.get(key)
+
+    def set(self, key: str, file_id: str):
+        with self._lock:
+            self._data[key] = file_id
+            self._save()
+
+    def discard(self, key: str):
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self._save()
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Failed to save file_id cache {self.path}: {e}")
+
+
+class SoundPipeline:
+    """
+    Sends trending sounds as Telegram audio.
+
+    Each sound is downloaded and normalized once (in a small worker pool),
+    uploaded, and its file_id cached by music_id; later sends reuse the
+    file_id and don't touch TikTok's servers at all.
+    """
+
+    def __init__(self, cache: FileIdCache, workers: int = 2):
+        self.cache = cache
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sound')
+        self._inflight = {}  # music_id -> future of the prepared file's path, until a send claims it
+        self._uploads = {}  # music_id -> future of the file_id, set by the sender uploading it
+
+    def prefetch(self, sounds: list):
+        """Starts preparing every uncached sound in the background."""
+        for sound in sounds:
+            music_id = sound.get('id')
+            if music_id and sound.get('url') and not self.cache.get(music_id) and music_id not in self._uploads:
+                self._prepare(sound)
+
+    def _prepare(self, sound: dict) -> asyncio.Future:
+        music_id = sound['id']
+        task = self._inflight.get(music_id)
+        if task is None:
+            loop = asyncio.get_running_loop()
+            task = loop.run_in_executor(self._pool, prepare_sound, music_id, sound['url'])
+            self._inflight[music_id] = task
+            task.add_done_callback(lambda t: loop.call_later(PREFETCH_TTL, self._expire, music_id, t))
+        return task
+
+    def _claim(self, sound: dict) -> asyncio.Future:
+        """The prepared file's future, taken out of _inflight: the caller removes the file."""
+        task = self._prepare(sound)
+        self._inflight.pop(sound['id'], None)
+        return task
+
+    def _expire(self, music_id: str, task: asyncio.Future):
+        """Drops a prefetch that no send claimed, removing its file."""
+        if self._inflight.get(music_id) is not task:
+            return
+        del self._inflight[music_id]
+        if not task.cancelled() and task.exception() is None and os.path.exists(task.result()):
+            os.remove(task.result())
+
+    async def send(self, bot, chat_id: int, sound: dict, **kwargs) -> bool:
+        """
+        Sends `sound` as audio. Extra kwargs go to `bot.send_audio`.
+        Returns False if the sound could not be sent.
+        """
+        music_id = sound.get('id')
+        if not music_id or not sound.get('url'):
+            return False
+
+        file_id = self.cache.get(music_id)
+        if file_id:
+            try:
+                await bot.send_audio(chat_id=chat_id, audio=file_id, **kwargs)
+                metrics.incr('sound_file_id_hits')
+                return True
+            except Exception as e:
+                logger.warning(f"Cached file_id for sound {music_id} failed, re-uploading: {e}")
+                self.cache.discard(music_id)
+
+        metrics.incr('sound_file_id_misses')
+
+        # Another send of the same sound is uploading it: wait for its file_id
+        upload = self._uploads.get(music_id)
+        if upload is not None:
+            file_id = await asyncio.shield(upload)
+            if not file_id:
+                return False
+            try:
+                await bot.send_audio(chat_id=chat_id, audio=file_id, **kwargs)
+                return True
+            except Exception as e:
+                logger.warning(f"Failed to send sound {music_id}: {e}")
+                return False
+
+        upload = asyncio.get_running_loop().create_future()
+        self._uploads[music_id] = upload
+        file_id = None
+        path = None
+        try:
+            path = await self._claim(sound)
+            with open(path, 'rb') as audio_file:
+                message = await bot.send_audio(
+                    chat_id=chat_id,
+                    audio=audio_file,
+                    filename=f"{music_id}.mp3",
+                    **kwargs
+                )
+            if message and message.audio:
+                file_id = message.audio.file_id
+                self.cache.set(music_id, file_id)
+            return True
+        except DownloadError as e:
+            logger.warning(f"Failed to prepare sound {music_id}: {e}")
+            return False
+        except Exception as e:
+            logger.warning(f"Failed to send sound {music_id}: {e}")
+            return False
+        finally:
+            # Only this send uses the file, so it is removed exactly once
+            upload.set_result(file_id)
+            self._uploads.pop(music_id, None)
+            if path and os.path.exists(path):
+                os.remove(path)
+
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+
+sound_pipeline = SoundPipeline(FileIdCache(os.path.join(DATA_DIR, 'sound_file_ids.json')))
@@ -0,0 +1,209 @@
+import os
+import time
+import random
+import logging
+import threading
+from concurrent.futures import Future
+
+import jsondecode
+from metrics import metrics
+from traffic import traffic
+
+logger = logging.getLogger(__name__)
+
+# Overridable to point at a stand-in server (benchmarks/fake_upstream.py)
+BASE_URL = os.getenv('TIKWM_BASE_URL', 'https://www.tikwm.com')
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+}
+
+# Fields of a video item that the bot reads (videos.parse_video,
+# analytics.FeedColumns, the hashtag index); the rest is dropped on decode
+VIDEO_FIELDS = {
+    'video_id': None, 'title': None, 'cover': None, 'duration': None, 'create_time': None,
+    'play_count': None, 'digg_count': None, 'comment_count': None, 'share_count': None,
+    'author': {'unique_id': None, 'nickname': None},
+    'music_info': {'id': None, 'title': None, 'author': None, 'duration': None, 'play': None},
+}
+
+# endpoint -> (projection, path to the big array to stream-decode)
+PROJECTIONS = {
+    '/api/': ({'code': None, 'msg': None, 'data': {'play': None, 'hdplay': None}}, ()),
+    '/api/feed/list': ({'code': None, 'msg': None, 'data': VIDEO_FIELDS}, ('data',)),
+    '/api/feed/search': ({'code': None, 'msg': None, 'data': {'videos': VIDEO_FIELDS}}, ('data', 'videos')),
+    '/api/user/posts': (
+        {'code': None, 'msg': None, 'data': {'videos': VIDEO_FIELDS, 'hasMore': None, 'cursor': None}},
+        ('data', 'videos'),
+    ),
+    '/api/user/info': (
+        {
+            'code': None, 'msg': None,
+            'data': {
+                'user': {'unique_id': None, 'nickname': None, 'avatar': None, 'signature': None, 'verified': None},
+                'stats': {'followerCount': None, 'followingCount': None, 'heartCount': None, 'videoCount': None},
+            },
+        },
+        (),
+    ),
+}
+
+
+class TikwmError(Exception):
+    """A tikwm request failed (network, HTTP status or non-zero `code`) after retries."""
+    pass
+
+
+class TokenBucket:
+    """
+    Token bucket that hands out reservations instead of refusing: callers
+    get how long to wait for their token, so bursts queue up in order.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Takes a token (possibly in the future). Returns seconds to wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+    def pause(self, seconds: float):
+        """Pushes every future token back by `seconds` (upstream said slow down)."""
+        with self._lock:
+            self._tokens = min(self._tokens, 0.0) - seconds * self.rate
+
+
+class TikwmClient:
+    """
+    Shared client for every tikwm endpoint.
+
+    - Per-endpoint token buckets queue requests instead of bursting.
+    - HTTP 429 and throttling `code`s back off exponentially with jitter
+      (pausing the endpoint's bucket for everyone); other non-zero codes
+      get one retry, other 4xx statuses none.
+    - Responses are decoded with jsondecode and projected onto the
+      endpoint's PROJECTIONS entry, keeping only the fields the bot reads.
+    - Identical requests already in flight are coalesced: followers wait
+      for the leader's response instead of sending their own.
+    """
+
+    def __init__(self, rate: float = 1.0, burst: int = 3, max_retries: int = 3,
+                 backoff: float = 1.0, max_backoff: float = 20.0):
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._buckets = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, endpoint: str) -> TokenBucket:
+        with self._lock:
+            if endpoint not in self._buckets:
+                self._buckets[endpoint] = TokenBucket(self.rate, self.burst)
+            return self._buckets[endpoint]
+
+    def post(self, endpoint: str, data: dict, timeout: float = 30) -> dict:
+        """
+        POSTs `data` to `endpoint` (e.g. '/api/feed/list') and returns the
+        decoded response (projected, see PROJECTIONS), whose `code` is 0.
+        Raises TikwmError otherwise.
+        Blocking; call from executor threads.
+        """
+        key = (endpoint, tuple(sorted((k, str(v)) for k, v in data.items())))
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+
+        if not leader:
+            metrics.incr('tikwm_coalesced')
+            return future.result()
+
+        try:
+            result = self._post(endpoint, data, timeout)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _post(self, endpoint: str, data: dict, timeout: float) -> dict:
+        import requests
+
+        bucket = self._bucket(endpoint)
+        retried_code = False
+        attempt = 0
+        while True:
+            wait = bucket.reserve()
+            if wait:
+                metrics.observe('tikwm_queue_seconds', wait)
+                time.sleep(wait)
+
+            metrics.incr('tikwm_requests')
+            try:
+                response = traffic.post(BASE_URL + endpoint, headers=HEADERS, data=data, timeout=timeout)
+            except requests.RequestException as e:
+                error, throttled = TikwmError(f"{endpoint}: {e}"), False
+            else:
+                if response.status_code == 429:
+                    error, throttled = TikwmError(f"{endpoint}: HTTP 429"), True
+                elif response.status_code != 200:
+                    error, throttled = TikwmError(f"{endpoint}: HTTP {response.status_code}"), response.status_code >= 500
+                    # Other 4xx (403, 404...) won't change on retry
+                    if response.status_code < 500:
+                        raise error
+                else:
+                    spec, stream = PROJECTIONS.get(endpoint, (None, ()))
+                    try:
+                        result = jsondecode.decode(response.content, spec, stream)
+                    except ValueError:
+                        error, throttled = TikwmError(f"{endpoint}: invalid JSON"), False
+                    else:
+                        if result.get('code') == 0:
+                            return result
+                        msg = str(result.get('msg', ''))
+                        error = TikwmError(msg or f"{endpoint}: code {result.get('code')}")
+                        # e.g. "Free Api Limit: 1 request/second."
+                        throttled = 'limit' in msg.lower()
+                        if not throttled and retried_code:
+                            raise error
+                        retried_code = True
+
+            if attempt >= self.max_retries:
+                raise error
+
+            delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.5)
+            attempt += 1
+            logger.warning(f"tikwm {endpoint} failed ({error}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+            if throttled:
+                # Everyone queued on this endpoint waits too; our own wait happens in reserve()
+                metrics.incr('tikwm_throttled')
+                bucket.pause(delay)
+            else:
+                time.sleep(delay)
+
+
+# The default burst covers the global feed's fan-out over the 5
+# downloader.SUPPORTED_REGIONS, so those requests leave together instead of
+# the last ones queueing 1-2s. The sustained rate stays TIKWM_RATE_PER_SECOND;
+# if tikwm throttles the burst, the endpoint backs off as for any 429.
+tikwm = TikwmClient(
+    rate=float(os.getenv('TIKWM_RATE_PER_SECOND', 1)),
+    burst=int(os.getenv('TIKWM_BURST', 5)),
+)
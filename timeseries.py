@@ -0,0 +1,222 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    kind TEXT NOT NULL, region TEXT NOT NULL, ts INTEGER NOT NULL,
+    PRIMARY KEY (kind, region, ts)
+);
+CREATE TABLE IF NOT EXISTS samples (
+    kind TEXT NOT NULL, region TEXT NOT NULL, key TEXT NOT NULL, ts INTEGER NOT NULL, value REAL NOT NULL,
+    PRIMARY KEY (kind, region, key, ts)
+);
+CREATE TABLE IF NOT EXISTS rollup_buckets (
+    kind TEXT NOT NULL, region TEXT NOT NULL, bucket INTEGER NOT NULL, snapshots INTEGER NOT NULL,
+    PRIMARY KEY (kind, region, bucket)
+);
+CREATE TABLE IF NOT EXISTS rollups (
+    kind TEXT NOT NULL, region TEXT NOT NULL, key TEXT NOT NULL, bucket INTEGER NOT NULL, value REAL NOT NULL,
+    PRIMARY KEY (kind, region, key, bucket)
+);
+"""
+
+# Absent keys count as zero for these kinds (usage per 100 feed videos);
+# for videos a missing sample just means "not in that feed".
+ZERO_WHEN_ABSENT = {'hashtag', 'sound'}
+
+
+class TimeSeriesStore:
+    """
+    Per-region time series of hashtag usage, sound usage and video views,
+    recorded at every feed refresh, in SQLite.
+
+    Raw samples are kept for `raw_retention` seconds, then downsampled into
+    `bucket`-second averages kept for `rollup_retention` seconds, so the
+    file stays small. Rankings use growth over a rolling window instead of
+    a single snapshot's absolute counts, once the snapshots span at least
+    `min_span` seconds (closer ones would turn jitter into a rate per hour).
+    """
+
+    def __init__(self, path: str, raw_retention: float = 2 * 86400,
+                 rollup_retention: float = 30 * 86400, bucket: int = 3600, min_span: float = 900):
+        self.path = path
+        self.min_span = min_span
+        self.raw_retention = raw_retention
+        self.rollup_retention = rollup_retention
+        self.bucket = bucket
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def record(self, kind: str, region: str, values: dict, ts: Optional[int] = None):
+        """Stores one snapshot of `values` (key -> number) for kind/region."""
+        ts = int(ts if ts is not None else time.time())
+        with self._lock:
+            db = self._db()
+            with db:
+                db.execute('INSERT OR IGNORE INTO snapshots VALUES (?, ?, ?)', (kind, region, ts))
+                db.executemany(
+                    'INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?)',
+                    ((kind, region, key, ts, float(value)) for key, value in values.items()),
+                )
+
+    def record_feed(self, cols, region: str, ts: Optional[int] = None):
+        """
+        Records a feed page (analytics.FeedColumns): hashtag and sound usage
+        per 100 videos, so feeds of different sizes are comparable, and the
+        play count of each video.
+        """
+        if not cols.size:
+            return
+        scale = 100.0 / cols.size
+
+        if len(cols.tag_codes):
+            counts = np.bincount(cols.tag_codes, minlength=len(cols.tags)) * scale
+            self.record('hashtag', region, dict(zip(cols.tags.values, counts.tolist())), ts)
+
+        codes = cols.music_code[cols.music_code >= 0]
+        if len(codes):
+            usage = np.bincount(codes, minlength=len(cols.music)) * scale
+            self.record('sound', region, dict(zip(cols.music.values, usage.tolist())), ts)
+
+        views = {str(vid): play for vid, play in zip(cols.video_ids, cols.play.tolist()) if vid}
+        if views:
+            self.record('video', region, views, ts)
+
+    def growth(self, kind: str, region: str, keys: list, window: float, now: Optional[float] = None) -> dict:
+        """
+        Growth velocity of each key over the last `window` seconds: change
+        per hour between the oldest snapshot (raw or rolled up) inside the
+        window and the latest one.
+
+        Keys map to (velocity, new) where `new` means a hashtag/sound was
+        absent from the baseline snapshot, or to None without history
+        (including while the window's snapshots span less than min_span).
+        """
+        now = now if now is not None else time.time()
+        start = int(now - window)
+        result = dict.fromkeys(keys)
+        if not keys:
+            return result
+
+        with self._lock:
+            db = self._db()
+            latest = db.execute(
+                'SELECT MAX(ts) FROM snapshots WHERE kind = ? AND region = ?', (kind, region)
+            ).fetchone()[0]
+            if latest is None:
+                return result
+            base_ts = db.execute(
+                'SELECT MIN(ts) FROM snapshots WHERE kind = ? AND region = ? AND ts >= ? AND ts < ?',
+                (kind, region, start, latest),
+            ).fetchone()[0]
+            base_bucket = db.execute(
+                'SELECT MIN(bucket) FROM rollup_buckets WHERE kind = ? AND region = ? AND bucket >= ?',
+                (kind, region, start),
+            ).fetchone()[0]
+
+            if base_bucket is not None and (base_ts is None or base_bucket < base_ts):
+                base_sql = 'SELECT key, value FROM rollups WHERE kind = ? AND region = ? AND bucket = ?'
+                # A bucket's average sits at its middle
+                base_at, base_time = base_bucket, base_bucket + self.bucket / 2
+            elif base_ts is not None:
+                base_sql = 'SELECT key, value FROM samples WHERE kind = ? AND region = ? AND ts = ?'
+                base_at, base_time = base_ts, base_ts
+            else:
+                return result
+
+            if latest - base_time < self.min_span:
+                return result
+
+            wanted = set(keys)
+            current = {
+                k: v for k, v in db.execute(
+                    'SELECT key, value FROM samples WHERE kind = ? AND region = ? AND ts = ?',
+                    (kind, region, latest),
+                ) if k in wanted
+            }
+            baseline = {k: v for k, v in db.execute(base_sql, (kind, region, base_at)) if k in wanted}
+
+        hours = (latest - base_time) / 3600
+        for key in keys:
+            if key not in current:
+                continue
+            base = baseline.get(key)
+            new = base is None
+            if new:
+                if kind not in ZERO_WHEN_ABSENT:
+                    continue
+                base = 0.0
+            result[key] = ((current[key] - base) / hours, new)
+        return result
+
+    def compact(self, now: Optional[float] = None) -> int:
+        """
+        Downsamples raw samples older than raw_retention into bucket
+        averages and drops rollups older than rollup_retention.
+        Returns how many rows were removed.
+        """
+        now = now if now is not None else time.time()
+        raw_cutoff = int(now - self.raw_retention) // self.bucket * self.bucket
+        rollup_cutoff = int(now - self.rollup_retention)
+
+        with self._lock:
+            db = self._db()
+            with db:
+                # Average over the bucket's snapshots; a hashtag/sound absent from some of them counts as zero
+                db.execute(
+                    'INSERT OR REPLACE INTO rollup_buckets '
+                    'SELECT kind, region, ts / ? * ?, COUNT(*) FROM snapshots WHERE ts < ? '
+                    'GROUP BY kind, region, ts / ?',
+                    (self.bucket, self.bucket, raw_cutoff, self.bucket),
+                )
+                db.execute(
+                    'INSERT OR REPLACE INTO rollups '
+                    'SELECT s.kind, s.region, s.key, s.ts / ? * ?, '
+                    "CASE WHEN s.kind IN ('hashtag', 'sound') THEN SUM(s.value) / b.snapshots ELSE AVG(s.value) END "
+                    'FROM samples s JOIN rollup_buckets b '
+                    'ON b.kind = s.kind AND b.region = s.region AND b.bucket = s.ts / ? * ? '
+                    'WHERE s.ts < ? GROUP BY s.kind, s.region, s.key, s.ts / ?',
+                    (self.bucket, self.bucket, self.bucket, self.bucket, raw_cutoff, self.bucket),
+                )
+                removed = db.execute('DELETE FROM samples WHERE ts < ?', (raw_cutoff,)).rowcount
+                db.execute('DELETE FROM snapshots WHERE ts < ?', (raw_cutoff,))
+                removed += db.execute('DELETE FROM rollups WHERE bucket < ?', (rollup_cutoff,)).rowcount
+                db.execute('DELETE FROM rollup_buckets WHERE bucket < ?', (rollup_cutoff,))
+        return removed
+
+    def start(self, interval: float = 3600):
+        """Compacts the store every `interval` seconds in a daemon thread."""
+        def run():
+            while True:
+                try:
+                    removed = self.compact()
+                    if removed:
+                        logger.info(f"Time series compaction removed {removed} rows")
+                except Exception as e:
+                    logger.error(f"Time series compaction failed: {e}")
+                time.sleep(interval)
+
+        thread = threading.Thread(target=run, name='timeseries', daemon=True)
+        thread.start()
+        return thread
+
+
+timeseries = TimeSeriesStore(os.path.join(DATA_DIR, 'timeseries.db'))
@@ -0,0 +1,424 @@
+import io
+import atexit
+import os
+import glob
+import gzip
+import json
+import time
+import base64
+import hashlib
+import logging
+import threading
+from collections import deque
+from datetime import timedelta
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+
+RECORD = 'record'
+REPLAY = 'replay'
+
+# Bodies with these content types are stored as size-only placeholders
+MEDIA_TYPES = ('video/', 'audio/', 'image/', 'application/octet-stream', 'binary/')
+
+# Response headers never written to the archive
+SKIPPED_HEADERS = {'set-cookie', 'content-encoding', 'transfer-encoding'}
+
+# Request bodies longer than this are kept only as a digest
+MAX_REQUEST_BODY = 4096
+
+
+def _is_media(headers) -> bool:
+    return (headers.get('Content-Type') or '').lower().startswith(MEDIA_TYPES)
+
+
+def _encode_body(body: bytes) -> dict:
+    try:
+        return {'text': body.decode('utf-8')}
+    except UnicodeDecodeError:
+        return {'base64': base64.b64encode(body).decode('ascii')}
+
+
+def _decode_body(entry: dict) -> Optional[bytes]:
+    """Recorded body bytes, or None for a media placeholder."""
+    if 'text' in entry:
+        return entry['text'].encode('utf-8')
+    if 'base64' in entry:
+        return base64.b64decode(entry['base64'])
+    return None
+
+
+class TrafficArchive:
+    """
+    Capture and replay of upstream traffic: the downloader's and tikwm's
+    HTTP requests, and yt-dlp calls.
+
+    They all go through `request`/`get`/`post` and `YoutubeDL` here. With
+    no mode set those are plain requests/yt-dlp calls. In RECORD mode every
+    exchange is appended to a gzipped JSON lines archive, with its timing;
+    media bodies (and files yt-dlp writes) are stored as their size only.
+    In REPLAY mode the archive answers instead of the network, in recorded
+    order per request, after the recorded latency divided by `speed`
+    (0 = no waiting), with zero-filled placeholders of the original size
+    for media. Requests missing from the archive fail like an unreachable
+    host.
+    """
+
+    def __init__(self, mode: Optional[str], path: str, speed: float = 1.0):
+        if mode not in (None, RECORD, REPLAY):
+            raise ValueError(f"Unknown traffic mode {mode!r}")
+        self.mode = mode
+        self.path = path
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._out = None
+        self._entries = {}  # key -> deque of recorded entries (replay)
+        self.misses = 0
+        if mode == REPLAY:
+            self._load()
+        elif mode == RECORD:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self._out = gzip.open(path, 'at', encoding='utf-8')
+            atexit.register(self.close)
+            logger.info(f"Recording upstream traffic to {path}")
+
+    # HTTP
+
+    def get(self, url: str, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def request(self, method: str, url: str, **kwargs):
+        """requests.request, recorded or replayed depending on the mode."""
+        import requests
+
+        if self.mode is None:
+            return requests.request(method, url, **kwargs)
+
+        prepared = requests.Request(
+            method, url, params=kwargs.get('params'), data=kwargs.get('data'), json=kwargs.get('json'),
+        ).prepare()
+        body = prepared.body or b''
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        key = f"{method.upper()} {prepared.url} {hashlib.sha1(body).hexdigest()[:16]}"
+
+        if self.mode == REPLAY:
+            return self._replay_http(key, prepared, kwargs.get('stream', False))
+        return self._record_http(key, method, url, body, kwargs)
+
+    def _record_http(self, key: str, method: str, url: str, body: bytes, kwargs: dict):
+        import requests
+
+        entry = {'kind': 'http', 'key': key, 'method': method.upper(), 'url': url, 't': self._now()}
+        if len(body) <= MAX_REQUEST_BODY:
+            entry['request'] = body.decode('utf-8', 'replace')
+
+        started = time.monotonic()
+        try:
+            response = requests.request(method, url, **kwargs)
+        except requests.RequestException as e:
+            entry.update(error=type(e).__name__, message=str(e), elapsed=time.monotonic() - started)
+            self._write(entry)
+            raise
+
+        entry.update(
+            status=response.status_code,
+            reason=response.reason,
+            headers={k: v for k, v in response.headers.items() if k.lower() not in SKIPPED_HEADERS},
+            elapsed=response.elapsed.total_seconds(),
+        )
+
+        if not kwargs.get('stream'):
+            entry.update({'size': len(response.content)} if _is_media(response.headers) else _encode_body(response.content))
+            self._write(entry)
+            return response
+
+        # Streamed bodies are written once the caller has read them, with the transfer time
+        entry['stream'] = True
+        keep = not _is_media(response.headers)
+        chunks = []
+
+        def finish(size: int, seconds: float):
+            entry.update(size=size, transfer=seconds)
+            if keep:
+                entry.update(_encode_body(b''.join(chunks)))
+            self._write(entry)
+
+        response.raw = _RecordingRaw(response.raw, chunks if keep else None, finish)
+        return response
+
+    def _replay_http(self, key: str, prepared, stream: bool):
+        import requests
+        from requests.structures import CaseInsensitiveDict
+        from requests.utils import get_encoding_from_headers
+
+        entry = self._next(key)
+        if entry is None:
+            raise requests.ConnectionError(f"{key} is not in the traffic archive {self.path}")
+
+        self._wait(entry.get('elapsed', 0))
+        if 'error' in entry:
+            raise getattr(requests.exceptions, entry['error'], requests.RequestException)(entry['message'])
+
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.reason = entry.get('reason')
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = prepared.url
+        response.request = prepared
+        response.elapsed = timedelta(seconds=entry.get('elapsed', 0))
+
+        body = _decode_body(entry)
+        size = len(body) if body is not None else entry.get('size', 0)
+        if stream:
+            response.raw = _ReplayRaw(body, size, entry.get('transfer', 0) / self.speed if self.speed else 0)
+        else:
+            response._content = body if body is not None else bytes(size)
+        return response
+
+    # yt-dlp
+
+    def YoutubeDL(self, opts: dict):
+        """yt_dlp.YoutubeDL(opts), recorded or replayed depending on the mode."""
+        import yt_dlp
+
+        if self.mode == REPLAY:
+            return _ReplayYoutubeDL(self, opts)
+        ydl = yt_dlp.YoutubeDL(opts)
+        return _RecordingYoutubeDL(self, ydl, opts) if self.mode == RECORD else ydl
+
+    # Archive
+
+    def close(self):
+        with self._lock:
+            if self._out:
+                self._out.close()
+                self._out = None
+
+    def _now(self) -> float:
+        return round(time.monotonic() - self._started, 3)
+
+    def _write(self, entry: dict):
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':'))
+        with self._lock:
+            if self._out:
+                self._out.write(line + '\n')
+                # Sync flush: the archive stays readable if the bot is killed
+                self._out.flush()
+
+    def _next(self, key: str) -> Optional[dict]:
+        """The next recorded entry for `key`; the last one repeats once the others are used."""
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                self.misses += 1
+                logger.warning(f"Traffic replay miss: {key}")
+                return None
+            return entries.popleft() if len(entries) > 1 else entries[0]
+
+    def _wait(self, seconds: float):
+        if self.speed and seconds > 0:
+            time.sleep(seconds / self.speed)
+
+    def _load(self):
+        count = 0
+        try:
+            with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self._entries.setdefault(entry['key'], deque()).append(entry)
+                    count += 1
+        except FileNotFoundError:
+            raise ValueError(f"Traffic archive {self.path} not found")
+        except EOFError:
+            # Archive of a bot that was killed while recording: keep what was flushed
+            pass
+        logger.info(f"Replaying {count} upstream exchanges from {self.path} (speed {self.speed or 'unlimited'})")
+
+
+class _RecordingRaw:
+    """Wraps a urllib3 response to measure the body as the caller streams it."""
+
+    def __init__(self, raw, chunks: Optional[list], finish):
+        self._raw = raw
+        self._chunks = chunks
+        self._finish = finish
+        self._size = 0
+        self._started = time.monotonic()
+        self._done = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def _seen(self, chunk: bytes) -> bytes:
+        self._size += len(chunk)
+        if self._chunks is not None:
+            self._chunks.append(chunk)
+        return chunk
+
+    def _end(self):
+        if not self._done:
+            self._done = True
+            self._finish(self._size, round(time.monotonic() - self._started, 3))
+
+    def stream(self, amt: int = 2 ** 16, decode_content: Optional[bool] = None):
+        for chunk in self._raw.stream(amt, decode_content=decode_content):
+            yield self._seen(chunk)
+        self._end()
+
+    def read(self, amt: Optional[int] = None, *args, **kwargs) -> bytes:
+        chunk = self._seen(self._raw.read(amt, *args, **kwargs))
+        if not chunk or amt is None:
+            self._end()
+        return chunk
+
+    def close(self):
+        self._end()
+        self._raw.close()
+
+
+class _ReplayRaw:
+    """A streamed body served from the archive (zeros for media), paced over `seconds`."""
+
+    def __init__(self, body: Optional[bytes], size: int, seconds: float):
+        self._body = io.BytesIO(body) if body is not None else None
+        self._size = size
+        self._seconds = seconds
+        self._sent = 0
+
+    def read(self, amt: Optional[int] = None, *args, **kwargs) -> bytes:
+        amt = self._size - self._sent if amt is None else min(amt, self._size - self._sent)
+        if amt <= 0:
+            return b''
+        if self._seconds:
+            time.sleep(self._seconds * amt / self._size)
+        self._sent += amt
+        return self._body.read(amt) if self._body is not None else bytes(amt)
+
+    def stream(self, amt: int = 2 ** 16, decode_content: Optional[bool] = None):
+        while True:
+            chunk = self.read(amt)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+def _output_prefix(opts: dict) -> str:
+    """Path prefix of the files yt-dlp writes for `opts` ("downloads/<uuid>.")."""
+    template = opts.get('outtmpl') or ''
+    # YoutubeDL normalizes the option in place to {'default': template, ...}
+    if isinstance(template, dict):
+        template = template.get('default', '')
+    return template.split('%(', 1)[0]
+
+
+class _RecordingYoutubeDL:
+    """Records extract_info/download calls of a real YoutubeDL."""
+
+    def __init__(self, archive: TrafficArchive, ydl, opts: dict):
+        self._archive = archive
+        self._ydl = ydl
+        self._opts = opts
+
+    def __enter__(self):
+        self._ydl.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._ydl.__exit__(*exc)
+
+    def _record(self, call: str, url: str, fn):
+        import yt_dlp
+
+        entry = {'kind': 'yt-dlp', 'key': f"{call} {url} {self._opts.get('format', '')}", 'url': url, 't': self._archive._now()}
+        started = time.monotonic()
+        try:
+            result = fn()
+        except yt_dlp.utils.DownloadError as e:
+            entry.update(error=str(e), elapsed=round(time.monotonic() - started, 3))
+            self._archive._write(entry)
+            raise
+        entry['elapsed'] = round(time.monotonic() - started, 3)
+        return entry, result
+
+    def extract_info(self, url: str, download: bool = True, **kwargs):
+        entry, info = self._record('extract_info', url, lambda: self._ydl.extract_info(url, download=download, **kwargs))
+        entry['info'] = self._ydl.sanitize_info(info) if info else None
+        self._archive._write(entry)
+        return info
+
+    def download(self, urls: list):
+        prefix = _output_prefix(self._opts)
+        code = 0
+        for url in urls:
+            entry, code = self._record('download', url, lambda: self._ydl.download([url]))
+            # Files are kept as their suffix (".mp4", ".m4a"...) and size
+            entry['code'] = code
+            entry['files'] = {path[len(prefix):]: os.path.getsize(path) for path in glob.glob(glob.escape(prefix) + '*')} if prefix else {}
+            self._archive._write(entry)
+        return code
+
+
+class _ReplayYoutubeDL:
+    """Answers extract_info/download from the archive, writing placeholder files."""
+
+    def __init__(self, archive: TrafficArchive, opts: dict):
+        self._archive = archive
+        self._opts = opts
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def _entry(self, call: str, url: str) -> dict:
+        import yt_dlp
+
+        entry = self._archive._next(f"{call} {url} {self._opts.get('format', '')}")
+        if entry is None:
+            raise yt_dlp.utils.DownloadError(f"ERROR: {url} is not in the traffic archive {self._archive.path}")
+        self._archive._wait(entry.get('elapsed', 0))
+        if 'error' in entry:
+            raise yt_dlp.utils.DownloadError(entry['error'])
+        return entry
+
+    def extract_info(self, url: str, download: bool = True, **kwargs):
+        info = self._entry('extract_info', url)['info']
+        if download:
+            self.download([url])
+        return info
+
+    def download(self, urls: list):
+        prefix = _output_prefix(self._opts)
+        for url in urls:
+            entry = self._entry('download', url)
+            os.makedirs(os.path.dirname(prefix) or '.', exist_ok=True)
+            for suffix, size in entry.get('files', {}).items():
+                with open(prefix + suffix, 'wb') as f:
+                    # Sparse, zero-filled file of the recorded size
+                    f.truncate(size)
+                for hook in self._opts.get('progress_hooks', ()):
+                    hook({'status': 'downloading', 'downloaded_bytes': size, 'total_bytes': size, 'filename': prefix + suffix})
+                    hook({'status': 'finished', 'downloaded_bytes': size, 'total_bytes': size, 'filename': prefix + suffix})
+        return 0
+
+
+traffic = TrafficArchive(
+    os.getenv('TRAFFIC_MODE') or None,
+    os.getenv('TRAFFIC_ARCHIVE') or os.path.join(DATA_DIR, 'traffic.jsonl.gz'),
+    speed=float(os.getenv('TRAFFIC_REPLAY_SPEED', 1)),
+)
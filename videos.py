@@ -0,0 +1,75 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+# Longest title shown in a Telegram caption before it's cut with "..."
+CAPTION_TITLE_LENGTH = 100
+
+
+@dataclass(slots=True)
+class VideoRecord:
+    """
+    One TikTok video as shown by the bot (search, trending and creator
+    results). Slotted to keep cached result pages small; `url` and
+    `caption` are only built for the videos that are actually sent.
+
+    `get` gives dict-style read access, so analytics code that accepts raw
+    tikwm items also accepts records.
+    """
+
+    video_id: str
+    title: str = 'Sem título'
+    author: str = 'Desconhecido'  # nickname
+    unique_id: str = 'user'
+    play_count: int = 0
+    digg_count: int = 0
+    comment_count: int = 0
+    share_count: int = 0
+    create_time: int = 0
+    duration: int = 0
+    cover: str = ''
+    _url: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    _caption: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def url(self) -> str:
+        if self._url is None:
+            self._url = f"https://www.tiktok.com/@{self.unique_id}/video/{self.video_id}"
+        return self._url
+
+    @property
+    def caption(self) -> str:
+        """Title cut to CAPTION_TITLE_LENGTH characters."""
+        if self._caption is None:
+            title = self.title
+            self._caption = title[:CAPTION_TITLE_LENGTH] + "..." if len(title) > CAPTION_TITLE_LENGTH else title
+        return self._caption
+
+    def get(self, name: str, default=None):
+        return getattr(self, name, default)
+
+
+def parse_video(item: dict, unique_id: Optional[str] = None) -> VideoRecord:
+    """
+    Builds a VideoRecord from a raw tikwm video item, reading only the
+    fields the bot uses. `unique_id` overrides the author's (creator posts).
+    """
+    get = item.get
+    author = get('author') or {}
+    return VideoRecord(
+        str(get('video_id')),
+        get('title') or 'Sem título',
+        author.get('nickname', 'Desconhecido'),
+        unique_id or author.get('unique_id', 'user'),
+        get('play_count', 0),
+        get('digg_count', 0),
+        get('comment_count', 0),
+        get('share_count', 0),
+        get('create_time', 0),
+        get('duration', 0),
+        get('cover', ''),
+    )
+
+
+def parse_videos(items: list, unique_id: Optional[str] = None) -> list:
+    """parse_video for a page of raw tikwm items."""
+    return [parse_video(item, unique_id) for item in items]